@@ -1,6 +1,8 @@
 from flask import Flask
-from config import BASE_DIR, UPLOAD_DIR, OUTPUT_DIR, STATIC_DIR
+from config import BASE_DIR, UPLOAD_DIR, OUTPUT_DIR, STATIC_DIR, AUTOTUNE_ON_STARTUP, SEGMENTER_WARM_COUNT
 from workers.cleanup_worker import start_cleanup_worker
+from services import preset_tuner
+from services.segmentation_models import segmenter_pool
 
 
 # Import blueprints
@@ -9,6 +11,8 @@ from routes.compress_video import compress_bp
 from routes.split_video import split_bp
 from routes.download_video import download_bp
 from routes.video_ops import video_ops_bp
+from routes.uploads import uploads_bp
+from routes.presets import presets_bp
 
 
 
@@ -28,6 +32,22 @@ def create_app():
     app.register_blueprint(split_bp)
     app.register_blueprint(download_bp)
     app.register_blueprint(video_ops_bp)
+    app.register_blueprint(uploads_bp)
+    app.register_blueprint(presets_bp)
+    
+    # Encoder presets chosen by an earlier autotune run (or benchmark now)
+    preset_tuner.refresh()
+    if AUTOTUNE_ON_STARTUP:
+        preset_tuner.start_autotune()
+    
+    # Load the segmentation model before the first background removal needs it
+    if SEGMENTER_WARM_COUNT:
+        segmenter_pool.warm_in_background(SEGMENTER_WARM_COUNT)
+    
+    # Pick up overrides and autotune results written by other worker processes
+    @app.before_request
+    def refresh_presets():
+        preset_tuner.refresh()
     
     # Serve static files
     @app.route('/static/<path:path>')
@@ -45,6 +65,8 @@ if __name__ == "__main__":
     # Start Flask app
     app.run(debug=True, host="0.0.0.0", port=11000)
 else:
-    # For Gunicorn
+    # For Gunicorn: every worker process runs its own cleanup loop (the
+    # steps are idempotent), so task purging and cache eviction also happen
+    # in production
     app = create_app()
-    # Note: Worker startup might need to be handled differently in production
\ No newline at end of file
+    start_cleanup_worker()
\ No newline at end of file
@@ -0,0 +1,57 @@
+# benchmarks/bench_bg_parallel.py
+
+"""Wall time of background removal in one range vs keyframe-aligned parallel
+ranges, and whether both outputs have the same frame count. Run it on the
+target machine before setting BG_PARALLEL=1.
+
+  python -m benchmarks.bench_bg_parallel --input clip.mp4 --workers 4
+"""
+
+import time
+import argparse
+import tempfile
+import subprocess
+from config import FFPROBE, BG_REMOVAL_DEFAULT_QUALITY
+from services import video_ops_service
+from services.video_ops_service import process_video_background
+
+
+def frame_count(path):
+    probe = subprocess.run(
+        [FFPROBE, "-v", "error", "-select_streams", "v:0", "-count_frames",
+         "-show_entries", "stream=nb_read_frames", "-of", "default=noprint_wrappers=1:nokey=1", path],
+        capture_output=True, text=True
+    )
+    return int(probe.stdout.strip() or 0)
+
+
+def run(input_path, output_dir, parallel, quality):
+    started = time.perf_counter()
+    name = process_video_background(input_path, {"type": "color", "value": "#00ff00"}, 0.5,
+                                    output_dir, quality=quality, parallel=parallel)
+    return time.perf_counter() - started, f"{output_dir}/{name}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--workers", type=int, help="range processes (default: BG_PARALLEL_WORKERS)")
+    parser.add_argument("--quality", default=BG_REMOVAL_DEFAULT_QUALITY)
+    args = parser.parse_args()
+
+    if args.workers:
+        video_ops_service.BG_PARALLEL_WORKERS = args.workers
+
+    source_frames = frame_count(args.input)
+    with tempfile.TemporaryDirectory() as output_dir:
+        print(f"{args.input}: {source_frames} frames")
+        for label, parallel in (("single range", False), ("parallel", True)):
+            seconds, output = run(args.input, output_dir, parallel, args.quality)
+            frames = frame_count(output)
+            print(f"{label:<14} {seconds:8.2f}s  {frames} frames"
+                  f"{'' if frames == source_frames else '  (frame count differs)'}")
+
+
+if __name__ == "__main__":
+    main()
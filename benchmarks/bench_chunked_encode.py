@@ -0,0 +1,64 @@
+# benchmarks/bench_chunked_encode.py
+
+"""Wall-time comparison of the single-process encode and the chunked encoder.
+
+  python -m benchmarks.bench_chunked_encode --duration 300 --codec libx264
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import subprocess
+from config import FFMPEG, COMPRESSION_SETTINGS, CHUNK_ENCODER_THREADS
+from services.ffmpeg_service import build_compress_command
+from services.chunked_encoder import encode_chunked
+from utils.ffmpeg_utils import run_with_progress
+
+
+def make_clip(path, duration, size):
+    """Synthetic test clip (moving pattern + tone) with 2 s GOPs"""
+    subprocess.run([
+        FFMPEG, "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "60",
+        "-c:a", "aac", "-shortest", path,
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=300, help="clip length in seconds")
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--codec", default="libx264", choices=sorted(COMPRESSION_SETTINGS))
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    settings = COMPRESSION_SETTINGS[args.codec]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.mp4")
+        print(f"Generating {args.duration}s {args.size} clip...")
+        make_clip(source, args.duration, args.size)
+
+        single_out = os.path.join(tmp, "single.mp4")
+        started = time.perf_counter()
+        run_with_progress(build_compress_command(source, single_out, args.codec, cpus))
+        single = time.perf_counter() - started
+
+        chunked_out = os.path.join(tmp, "chunked.mp4")
+        parallel = max(1, cpus // CHUNK_ENCODER_THREADS)
+        started = time.perf_counter()
+        encode_chunked(source, chunked_out, args.codec, settings, args.duration, parallel)
+        chunked = time.perf_counter() - started
+
+        print(f"cpus={cpus} codec={args.codec} preset={settings['preset']}")
+        print(f"single-process: {single:8.2f}s  {os.path.getsize(single_out) / 1e6:8.2f} MB")
+        print(f"chunked (x{parallel}): {chunked:8.2f}s  {os.path.getsize(chunked_out) / 1e6:8.2f} MB")
+        print(f"speedup: {single / chunked:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
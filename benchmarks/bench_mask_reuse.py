@@ -0,0 +1,85 @@
+# benchmarks/bench_mask_reuse.py
+
+"""Segmentation throughput and mask drift of each BG_REMOVAL_QUALITY preset
+against "exact" (full resolution, every frame).
+
+  python -m benchmarks.bench_mask_reuse --frames 300 --size 1280x720
+  python -m benchmarks.bench_mask_reuse --input clip.mp4
+"""
+
+import time
+import argparse
+import cv2
+import numpy as np
+from config import BG_REMOVAL_QUALITY
+from services.segmentation_models import segmenter_pool
+from services.mask_tracker import MaskTracker
+
+
+def synthetic_frames(count, width, height, cut_every=120):
+    """A person-like silhouette walking over a textured backdrop, with hard cuts"""
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        shot = i // cut_every
+        backdrop = np.full((height, width, 3), 60 + 40 * (shot % 3), dtype=np.uint8)
+        noise = rng.integers(0, 30, (height // 8, width // 8, 3), dtype=np.uint8)
+        backdrop += cv2.resize(noise, (width, height), interpolation=cv2.INTER_NEAREST)
+        cx = int(width * (0.3 + 0.4 * ((i % cut_every) / cut_every)))
+        head = (cx, int(height * 0.3))
+        cv2.ellipse(backdrop, (cx, int(height * 0.75)), (width // 8, height // 3), 0, 0, 360,
+                    (40, 60, 150), -1)
+        cv2.circle(backdrop, head, height // 8, (120, 150, 200), -1)
+        frames.append(backdrop)
+    return frames
+
+
+def read_frames(path, limit):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run(frames, segmenter, settings, threshold):
+    tracker = MaskTracker(segmenter, **settings)
+    masks = []
+    started = time.perf_counter()
+    for frame in frames:
+        masks.append(tracker(frame) > threshold)
+    return masks, len(frames) / (time.perf_counter() - started), tracker.inferences
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--input", help="use frames from this video instead of a synthetic clip")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.input:
+        frames = read_frames(args.input, args.frames)
+    else:
+        width, height = (int(v) for v in args.size.split("x"))
+        frames = synthetic_frames(args.frames, width, height)
+    print(f"{len(frames)} frames at {frames[0].shape[1]}x{frames[0].shape[0]}")
+
+    with segmenter_pool.acquire() as segmenter:
+        exact, exact_fps, _ = run(frames, segmenter, BG_REMOVAL_QUALITY["exact"], args.threshold)
+        print(f"{'mode':<10} {'fps':>8} {'speedup':>8} {'inferred':>9} {'mask diff':>10}")
+        for name, settings in BG_REMOVAL_QUALITY.items():
+            masks, fps, inferences = run(frames, segmenter, settings, args.threshold)
+            # Share of pixels whose foreground/background decision differs from exact
+            diff = np.mean([np.mean(a != b) for a, b in zip(masks, exact)])
+            print(f"{name:<10} {fps:8.1f} {fps / exact_fps:7.2f}x {inferences:9d} {diff:9.2%}")
+
+
+if __name__ == "__main__":
+    main()
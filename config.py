@@ -12,8 +12,61 @@ STATIC_DIR = os.path.join(BASE_DIR, "static")
 FFMPEG = "ffmpeg"
 FFPROBE = "ffprobe"
 
-# Task management
-TASKS = {}  # In-memory task store (for simple deployment)
+# Task management (shared across worker processes, see services/task_store.py)
+TASK_STORE_BACKEND = os.environ.get("TASK_STORE_BACKEND", "sqlite")  # "sqlite", "memory" or "module:Class"
+TASK_DB_PATH = os.path.join(BASE_DIR, "tasks", "tasks.db")
+TASK_PROGRESS_FLUSH_SECONDS = 0.5
+TASK_LIFETIME_MINUTES = 60
+
+# Server-Sent Events progress stream (/events/<task_id>)
+SSE_MIN_INTERVAL_SECONDS = 0.25  # coalesce pushes to at most 4 per second
+SSE_POLL_SECONDS = 1.0           # re-read the shared store for other workers' updates
+SSE_HEARTBEAT_SECONDS = 15
+# Each open stream holds a gunicorn request thread (--threads in render.yaml).
+# Streams end after SSE_MAX_STREAM_SECONDS and the browser reconnects, and at
+# most SSE_MAX_STREAMS run per worker process (further clients poll /status),
+# so uploads, /status and downloads always find a free thread.
+SSE_MAX_STREAM_SECONDS = 60
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", 4))
+SSE_RETRY_MS = 1000  # reconnect delay the browser is told to use
+
+# Audio bitrate for re-encoded AAC (sources at or below it are stream-copied)
+AUDIO_BITRATE = 160_000
+
+# Multi-rendition output (one decode, several encoders) per /start request
+MAX_RENDITIONS = 4
+
+# Target-size mode (/start with target_size_mb): a few short windows are CRF
+# encoded to estimate size and speed before the real encode
+TARGET_SIZE_SAMPLES = 3
+TARGET_SIZE_SAMPLE_SECONDS = 4
+TARGET_SIZE_MIN_VIDEO_BITRATE = 100_000
+TARGET_SIZE_CONTAINER_OVERHEAD = 0.02  # share of the target reserved for muxing
+
+# Probe-driven fast paths: the bitrate an encode is expected to land at, in bits
+# per pixel per frame. Sources already below it are remuxed (same codec) or
+# encoded with -maxrate capped at their own bitrate (other codec).
+FASTPATH_TARGET_BPP = {
+    "libx264": 0.06,
+    "libx265": 0.04
+}
+ENCODER_CODEC_NAMES = {"libx264": "h264", "libx265": "hevc"}
+
+# Job scheduler (bounds concurrent heavy work). Each gunicorn worker process
+# runs its own scheduler, so every limit below is per process: the host's
+# cores are split between the WEB_CONCURRENCY (gunicorn's -w default) processes.
+WEB_WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+CPU_SHARE = max(1, (os.cpu_count() or 1) // WEB_WORKERS)
+# Files of one batch compressed concurrently; each ffmpeg gets
+# CPU_SHARE // (active scheduler jobs * parallel) threads
+BATCH_PARALLELISM = int(os.environ.get("BATCH_PARALLELISM", 2))
+# Fully loaded, JOB_WORKERS jobs of BATCH_PARALLELISM encodes fill CPU_SHARE cores
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", max(1, CPU_SHARE // BATCH_PARALLELISM)))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 50))
+# Background removal previews (a few frames each) get their own small pool so
+# they never wait behind long jobs in the main queue
+PREVIEW_WORKERS = int(os.environ.get("PREVIEW_WORKERS", 1))
+PREVIEW_QUEUE_SIZE = int(os.environ.get("PREVIEW_QUEUE_SIZE", 8))
 
 # Cleanup settings
 CLEANUP_INTERVAL_MINUTES = 1
@@ -25,5 +78,126 @@ COMPRESSION_SETTINGS = {
     "libx265": {"crf": "28", "preset": "slow"}
 }
 
+# Preset autotuner: benchmarks presets on a synthetic clip and picks, per codec,
+# the slowest one still encoding at >= AUTOTUNE_MIN_SPEED x realtime. It runs
+# as a scheduler job, so it measures next to whatever else is running, with
+# AUTOTUNE_CONCURRENCY encodes sharing the job's CPU budget (see /api/presets).
+# Starting a tune or changing presets needs "Authorization: Bearer
+# <PRESETS_ADMIN_TOKEN>"; without the variable these routes are disabled.
+PRESETS_ADMIN_TOKEN = os.environ.get("PRESETS_ADMIN_TOKEN")
+PRESET_TUNING_PATH = os.path.join(BASE_DIR, "cache", "preset_tuning.json")
+AUTOTUNE_ON_STARTUP = os.environ.get("AUTOTUNE_ON_STARTUP", "0") == "1"
+AUTOTUNE_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow"]
+AUTOTUNE_MIN_SPEED = float(os.environ.get("AUTOTUNE_MIN_SPEED", 1.5))
+AUTOTUNE_CLIP_SECONDS = 5
+AUTOTUNE_CLIP_SIZE = "1280x720"
+
+# Encodes of one compression batch
+AUTOTUNE_CONCURRENCY = int(os.environ.get("AUTOTUNE_CONCURRENCY", BATCH_PARALLELISM))
+
+# Chunked encoding of long single videos (split at keyframes, encode chunks in parallel)
+CHUNKED_ENCODE_MIN_SECONDS = 600
+CHUNK_SECONDS = 60
+CHUNK_ENCODER_THREADS = 2  # -threads per chunk encoder process
+
+# Result cache for compress/split outputs (content hash + parameters -> output)
+RESULT_CACHE_DIR = os.path.join(BASE_DIR, "cache", "results")
+RESULT_CACHE_MAX_MB = int(os.environ.get("RESULT_CACHE_MAX_MB", 2048))
+
+# Video split: "fast" (input seek + copy, keyframe snapped), "smart" (frame
+# accurate, re-encodes only boundary GOPs, verified by a decode), "accurate"
+# (full re-encode) or "copy" (legacy). Smart cut is opt-in per request.
+SPLIT_DEFAULT_MODE = "fast"
+SPLIT_REENCODE_CRF = "18"
+SPLIT_REENCODE_PRESET = "veryfast"
+MAX_SPLIT_RANGES = 50  # clips per multi-range /split-video request
+
+# Media index: one ffprobe per input (streams, duration; keyframes only when a
+# caller needs them), cached on disk
+MEDIA_INDEX_DIR = os.path.join(BASE_DIR, "cache", "media_index")
+MEDIA_INDEX_MAX_MB = 256
+
 # Allowed file extensions
-ALLOWED_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv', '.webm'}
\ No newline at end of file
+ALLOWED_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv', '.webm'}
+
+# Encode-while-uploading (/start-stream): containers ffmpeg can read from a pipe.
+# MP4/MOV qualify only when fragmented, which is detected from the first bytes.
+STREAMABLE_EXTENSIONS = {'.mkv', '.webm', '.mp4', '.mov'}
+STREAM_SNIFF_BYTES = 256 * 1024
+# Smaller uploads arrive quickly, so they go through the normal job, which
+# checks the result cache and the remux/capped fast paths before encoding
+STREAM_MIN_BYTES = int(os.environ.get("STREAM_MIN_BYTES", 64 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Resumable chunked uploads (/api/uploads)
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 4 * 1024 ** 3))
+UPLOAD_LIFETIME_MINUTES = 60  # abandoned, unfinalized uploads are purged after this
+
+# Background removal (services/video_ops_service.py): frames buffered between
+# the decode / segment / composite / encode pipeline stages
+VIDEO_OPS_QUEUE_SIZE = 8
+
+# Selfie segmentation model, fetched once by scripts/download_models.sh (run
+# by render.yaml at build time), never downloaded per request. Each worker
+# process keeps up to SEGMENTER_POOL_SIZE warm segmenters (by default one per
+# job worker and preview worker, so a preview never waits for a long job).
+SEGMENTER_MODEL_PATH = os.environ.get(
+    "SEGMENTER_MODEL_PATH", os.path.join(BASE_DIR, "models", "selfie_segmenter.tflite"))
+SEGMENTER_POOL_SIZE = int(os.environ.get("SEGMENTER_POOL_SIZE", JOB_WORKERS + PREVIEW_WORKERS))
+# Segmenters created per worker process at startup, so the first background
+# removal does not pay for model loading (0 disables)
+SEGMENTER_WARM_COUNT = int(os.environ.get("SEGMENTER_WARM_COUNT", 1))
+
+# Background removal speed/quality knob (services/mask_tracker.py):
+# inference_width downscales frames before segmentation, every=N reuses the
+# latest mask for N-1 frames, smoothing blends masks over time and scene_cut
+# forces fresh inference on a new shot. "exact" is full resolution per frame.
+BG_REMOVAL_QUALITY = {
+    "exact": {"inference_width": None, "every": 1, "smoothing": 0.0, "scene_cut": None},
+    "balanced": {"inference_width": 512, "every": 1, "smoothing": 0.3, "scene_cut": None},
+    "fast": {"inference_width": 256, "every": 3, "smoothing": 0.5, "scene_cut": 0.12},
+}
+BG_REMOVAL_DEFAULT_QUALITY = "exact"
+
+# Resized frames of a looping background video kept in memory per job
+BG_VIDEO_CACHE_MB = 256
+
+# Stock backgrounds offered by the page (predefined_bg_image/_video)
+PREDEFINED_BG_DIR = os.path.join(STATIC_DIR, "images", "backgrounds")
+
+# Shared background asset cache: stock backgrounds decoded once per size into
+# memory-mapped raw BGR frame rings, used by every job and worker process.
+# Uploaded backgrounds are used once, so they are streamed instead.
+BG_CACHE_DIR = os.path.join(BASE_DIR, "cache", "backgrounds")
+BG_CACHE_MAX_MB = int(os.environ.get("BG_CACHE_MAX_MB", 2048))
+BG_CACHE_MAX_ASSET_MB = 512  # larger assets are streamed per job instead
+
+# Long background-removal inputs can be split into keyframe-aligned time
+# ranges, each processed by its own process (and segmenter), then joined
+# without re-encoding. Off unless BG_PARALLEL=1 (measure it first with
+# benchmarks/bench_bg_parallel.py); a job never uses more processes than its
+# share of the CPU next to the scheduler's other active jobs.
+BG_PARALLEL = os.environ.get("BG_PARALLEL", "0") == "1"
+BG_PARALLEL_WORKERS = int(os.environ.get("BG_PARALLEL_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+BG_PARALLEL_MIN_PART_FRAMES = 900  # about 30 s at 30 fps
+
+# Background removal preview (/api/video-ops/preview): a few frames sampled
+# across the input at low resolution; their masks are cached so threshold or
+# background changes only re-composite
+PREVIEW_FRAMES = 12
+PREVIEW_WIDTH = 480
+PREVIEW_FPS = 4
+PREVIEW_CACHE_DIR = os.path.join(BASE_DIR, "cache", "previews")
+PREVIEW_CACHE_MAX_MB = 256
+# Inputs sent with a preview are referenced later by an opaque preview_id
+PREVIEW_INPUTS_DIR = os.path.join(BASE_DIR, "cache", "preview_inputs")
+PREVIEW_INPUT_LIFETIME_MINUTES = 60
+
+# yt-dlp metadata cache (/fetch-formats): per-process LRU keyed by normalized
+# URL; concurrent lookups of one URL share a single extraction. With
+# METADATA_CACHE_PERSIST=1 entries are also kept on disk for other workers.
+METADATA_CACHE_TTL_SECONDS = int(os.environ.get("METADATA_CACHE_TTL_SECONDS", 600))
+METADATA_CACHE_SIZE = int(os.environ.get("METADATA_CACHE_SIZE", 512))
+METADATA_CACHE_PERSIST = os.environ.get("METADATA_CACHE_PERSIST", "0") == "1"
+METADATA_CACHE_DIR = os.path.join(BASE_DIR, "cache", "metadata")
+METADATA_CACHE_MAX_MB = 64
@@ -1,58 +1,259 @@
 # routes/compress_video.py
 
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, request, jsonify, send_from_directory, Response, stream_with_context
 import uuid
+import json
+import time
+import hashlib
 import threading
-from config import UPLOAD_DIR, OUTPUT_DIR, TASKS
-from services.ffmpeg_service import compress_video_files
-from utils.file_utils import save_uploaded_files
+from config import (UPLOAD_DIR, OUTPUT_DIR, ALLOWED_EXTENSIONS, COMPRESSION_SETTINGS, MAX_RENDITIONS,
+                    SSE_MIN_INTERVAL_SECONDS, SSE_POLL_SECONDS, SSE_HEARTBEAT_SECONDS,
+                    SSE_MAX_STREAM_SECONDS, SSE_MAX_STREAMS, SSE_RETRY_MS)
+from services.ffmpeg_service import compress_video_files, compress_from_cache, estimate_compression
+from services.size_estimator import TargetSizeError
+from utils.file_utils import save_uploaded_files, unique_upload_name
+from services.stream_ingest import ingest_upload
+from services.upload_service import claim_uploads, release_uploads, peek_upload, UploadError
+from services.task_store import tasks
+from workers.job_scheduler import scheduler, QueueFullError
 import os
 
 compress_bp = Blueprint('compress', __name__)
 
+# Open /events streams in this worker process (each holds a request thread)
+_stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
 @compress_bp.route("/start", methods=["POST"])
 def start_compression():
     """Start video compression task"""
     files = request.files.getlist("videos")
+    upload_ids = request.form.getlist("upload_id")
     codec = request.form.get("codec", "libx264")
     
-    if not files or all(f.filename == '' for f in files):
-        return jsonify({"error": "No files uploaded"}), 400
+    # Optional renditions: JSON list of {"codec": ..., "height": ...} made in one pass
+    renditions = None
+    if request.form.get("renditions"):
+        try:
+            renditions = [
+                {"codec": r.get("codec", codec), "height": int(r["height"]) if r.get("height") else None}
+                for r in json.loads(request.form["renditions"])
+            ]
+        except (ValueError, TypeError, AttributeError):
+            return jsonify({"error": "Invalid renditions"}), 400
+        if not renditions or len(renditions) > MAX_RENDITIONS:
+            return jsonify({"error": f"Between 1 and {MAX_RENDITIONS} renditions are allowed"}), 400
+        for r in renditions:
+            if r["codec"] not in COMPRESSION_SETTINGS or (r["height"] and not 144 <= r["height"] <= 4320):
+                return jsonify({"error": "Invalid renditions"}), 400
     
-    # Save uploaded files - ONLY ONCE
-    filenames = save_uploaded_files(files, UPLOAD_DIR)
+    # Optional target size per output file (MB); two_pass trades time for accuracy
+    target_bytes = None
+    if request.form.get("target_size_mb"):
+        try:
+            target_bytes = int(float(request.form["target_size_mb"]) * 1024 * 1024)
+        except ValueError:
+            return jsonify({"error": "Invalid target size"}), 400
+        if target_bytes <= 0 or renditions:
+            return jsonify({"error": "Invalid target size"}), 400
+    two_pass = request.form.get("two_pass") in ("1", "true", "on")
+    
+    if upload_ids:
+        # Files already received through the resumable upload API
+        try:
+            filenames = claim_uploads(upload_ids)
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status
+    elif not files or all(f.filename == '' for f in files):
+        return jsonify({"error": "No files uploaded"}), 400
+    else:
+        # Save uploaded files - ONLY ONCE
+        filenames = save_uploaded_files(files, UPLOAD_DIR)
     
     if not filenames:
         return jsonify({"error": "No valid video files uploaded"}), 400
     
     # Create task entry
     task_id = str(uuid.uuid4())
-    TASKS[task_id] = {
-        "status": "pending",
+    tasks.create(task_id, {
+        "status": "queued",
         "current": 0,
         "total": len(filenames),
-        "file": "",
-        "percent": 0,
+        "progress": [{"file": name, "status": "pending", "percent": 0} for name in filenames],
         "files": []
-    }
+    })
+    
+    # Cache hits finish immediately without taking a worker slot
+    if not renditions and not target_bytes and compress_from_cache(task_id, filenames, codec, UPLOAD_DIR, OUTPUT_DIR):
+        return jsonify({"task_id": task_id})
+    
+    # Queue compression on the shared worker pool
+    try:
+        scheduler.submit(task_id, compress_video_files,
+                         task_id, filenames, codec, UPLOAD_DIR, OUTPUT_DIR,
+                         renditions=renditions, target_bytes=target_bytes, two_pass=two_pass)
+    except QueueFullError as e:
+        tasks.delete(task_id)
+        if upload_ids:
+            # Keep the uploads, so the client can retry without sending them again
+            release_uploads(upload_ids)
+        else:
+            for filename in filenames:
+                try:
+                    os.remove(os.path.join(UPLOAD_DIR, filename))
+                except OSError:
+                    pass
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+    
+    return jsonify({"task_id": task_id, "queue_position": scheduler.position(task_id)})
+
+@compress_bp.route("/estimate-size", methods=["POST"])
+def estimate_size():
+    """Expected size and encode time of a target-size encode, without encoding.
+
+    Takes a finalized resumable upload ({"upload_id", "target_size_mb",
+    "codec", "two_pass"}); the upload is not claimed, so the same upload_id
+    can be passed to /start once the user has confirmed. The job started
+    there reuses this estimate instead of sampling again.
+    """
+    data = request.get_json(silent=True) or request.form
+    codec = data.get("codec", "libx264")
+    if codec not in COMPRESSION_SETTINGS:
+        return jsonify({"error": "Invalid codec"}), 400
+    try:
+        target_bytes = int(float(data.get("target_size_mb")) * 1024 * 1024)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid target size"}), 400
+    if target_bytes <= 0:
+        return jsonify({"error": "Invalid target size"}), 400
+    two_pass = str(data.get("two_pass")).lower() in ("1", "true", "on")
+    
+    try:
+        input_path = peek_upload(data.get("upload_id"))
+        estimate, _ = scheduler.run(f"estimate:{data.get('upload_id')}", estimate_compression,
+                                    input_path, codec, target_bytes, two_pass)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    except TargetSizeError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+    except Exception as e:
+        print("ESTIMATE ERROR:", e)
+        return jsonify({"error": "Could not estimate the output size"}), 500
+    return jsonify(estimate)
+
+@compress_bp.route("/start-stream", methods=["POST"])
+def start_stream():
+    """Create a task whose single file is uploaded with PUT to upload_url"""
+    data = request.get_json(silent=True) or request.form
+    filename = data.get("filename", "")
+    codec = data.get("codec", "libx264")
+    
+    if os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+        return jsonify({"error": "No valid video file"}), 400
+    
+    task_id = str(uuid.uuid4())
+    unique_filename = unique_upload_name(filename)
+    tasks.create(task_id, {
+        "status": "uploading",
+        "current": 0,
+        "total": 1,
+        "progress": [{"file": unique_filename, "status": "pending", "percent": 0}],
+        "files": [],
+        "filename": unique_filename,
+        "codec": codec
+    })
+    return jsonify({"task_id": task_id, "upload_url": f"/start-stream/{task_id}"})
+
+@compress_bp.route("/start-stream/<task_id>", methods=["PUT"])
+def stream_upload(task_id):
+    """Receive the raw file body, encoding while it uploads when possible"""
+    task = tasks.get(task_id)
+    if not task:
+        return jsonify({"error": "Task not found"}), 404
+    if task.get("status") != "uploading":
+        return jsonify({"error": "Upload already received"}), 409
     
-    # Start compression in background thread
-    threading.Thread(
-        target=compress_video_files,
-        args=(task_id, filenames, codec, UPLOAD_DIR, OUTPUT_DIR),
-        daemon=True
-    ).start()
+    try:
+        mode = ingest_upload(task_id, task["filename"], task["codec"], request.stream,
+                             request.content_length, UPLOAD_DIR, OUTPUT_DIR)
+    except QueueFullError as e:
+        # ingest_upload already dropped the task and the buffered input
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
     
-    return jsonify({"task_id": task_id})
+    return jsonify({"task_id": task_id, "mode": mode})
 
 @compress_bp.route("/status/<task_id>")
 def status(task_id):
     """Get compression task status"""
-    task = TASKS.get(task_id)
+    task = tasks.get(task_id)
     if not task:
         return jsonify({"error": "Task not found"}), 404
+    if task.get("status") == "queued":
+        # Prefer the live position when this process owns the job
+        task["queue_position"] = scheduler.position(task_id) or task.get("queue_position")
     return jsonify(task)
 
+@compress_bp.route("/events/<task_id>")
+def events(task_id):
+    """Stream task progress as Server-Sent Events.
+
+    The stream ends with a "done" or "error" event, or after
+    SSE_MAX_STREAM_SECONDS without one; EventSource then reconnects with
+    Last-Event-ID, and an unchanged record is not sent again. When
+    SSE_MAX_STREAMS are already open the request is refused with 503 and
+    the client falls back to polling /status.
+    """
+    if tasks.get(task_id) is None:
+        return jsonify({"error": "Task not found"}), 404
+    if not _stream_slots.acquire(blocking=False):
+        return jsonify({"error": "Too many progress streams, poll /status instead"}), 503
+    last_event_id = request.headers.get("Last-Event-ID")
+
+    def stream():
+        version = -1
+        last_sent = last_event_id
+        last_push = 0.0
+        started = last_heartbeat = time.monotonic()
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while time.monotonic() - started < SSE_MAX_STREAM_SECONDS:
+            # Woken by local progress; other workers' writes are picked up by polling
+            version = tasks.wait_for_change(task_id, version, SSE_POLL_SECONDS)
+
+            # Coalesce bursts of updates into at most one push per interval
+            wait = SSE_MIN_INTERVAL_SECONDS - (time.monotonic() - last_push)
+            if wait > 0:
+                time.sleep(wait)
+
+            task = tasks.get(task_id)
+            if task is None:
+                yield "event: error\ndata: {\"error\": \"Task not found\"}\n\n"
+                return
+            if task.get("status") == "queued":
+                task["queue_position"] = scheduler.position(task_id) or task.get("queue_position")
+
+            payload = json.dumps(task)
+            event_id = hashlib.sha1(payload.encode()).hexdigest()[:16]
+            if task.get("status") in ("done", "error"):
+                yield f"event: {task['status']}\nid: {event_id}\ndata: {payload}\n\n"
+                return
+            if event_id != last_sent:
+                last_sent = event_id
+                last_push = last_heartbeat = time.monotonic()
+                yield f"id: {event_id}\ndata: {payload}\n\n"
+            elif time.monotonic() - last_heartbeat > SSE_HEARTBEAT_SECONDS:
+                last_heartbeat = time.monotonic()
+                yield ": keep-alive\n\n"
+
+    response = Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Runs when the stream ends or the client goes away
+    response.call_on_close(_stream_slots.release)
+    return response
+
 @compress_bp.route("/download/<filename>")
 def download(filename):
     """Download compressed file"""
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify, render_template, send_from_directory
 import os
 from services.downloader_service import extract_video_info, download_selected_format
+from services.metadata_cache import metadata_cache
+from workers.job_scheduler import scheduler, QueueFullError
 
 download_bp = Blueprint("download_bp", __name__)
 
@@ -34,6 +36,13 @@ def fetch_formats():
         return jsonify({"error": str(e)}), 500
 
 
+# -------------------------------
+# API: Metadata cache counters (this worker process)
+# -------------------------------
+@download_bp.route("/api/metadata-cache/stats", methods=["GET"])
+def metadata_cache_stats():
+    return jsonify(metadata_cache.stats())
+
 
 # -------------------------------
 # API: Download selected format
@@ -48,7 +57,7 @@ def download_video():
         return jsonify({"error": "Missing URL or format ID"}), 400
 
     try:
-        filename = download_selected_format(url, format_id, OUTPUT_FOLDER)
+        filename = scheduler.run(url, download_selected_format, url, format_id, OUTPUT_FOLDER)
         
         # Check if filename is valid
         if not filename:
@@ -56,6 +65,8 @@ def download_video():
             
         return jsonify({"status": "done", "file": filename})
         
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
     except Exception as e:
         print("YT-DLP DOWNLOAD ERROR:", str(e))  # Convert exception to string
         error_msg = str(e) if str(e) else "Unknown download error"
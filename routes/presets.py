@@ -0,0 +1,72 @@
+# routes/presets.py
+
+import hmac
+from flask import Blueprint, request, jsonify
+from config import PRESETS_ADMIN_TOKEN
+from services import preset_tuner
+from workers.job_scheduler import QueueFullError
+
+presets_bp = Blueprint("presets", __name__)
+
+
+def _admin_error():
+    """Error response unless the request carries the PRESETS_ADMIN_TOKEN bearer token"""
+    if not PRESETS_ADMIN_TOKEN:
+        return jsonify({"error": "Preset changes are disabled on this server"}), 403
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode(), PRESETS_ADMIN_TOKEN.encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+
+@presets_bp.route("/api/presets", methods=["GET"])
+def presets_state():
+    """Encoder preset per codec, whether it was autotuned or overridden"""
+    return jsonify(preset_tuner.tuning_state())
+
+
+@presets_bp.route("/api/presets/tune", methods=["POST"])
+def run_autotune():
+    """Queue a preset benchmark: {"codecs": [...], "min_speed": 1.5} (admin only).
+
+    Answers with the tuning state and the task_id to follow on /status.
+    """
+    denied = _admin_error()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    codecs = data.get("codecs")
+    if codecs is not None and (not isinstance(codecs, list)
+                               or any(c not in preset_tuner.COMPRESSION_SETTINGS for c in codecs)):
+        return jsonify({"error": "Unknown codec"}), 400
+    kwargs = {"codecs": codecs}
+    if "min_speed" in data:
+        try:
+            kwargs["min_speed"] = float(data["min_speed"])
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid min_speed"}), 400
+    try:
+        task_id = preset_tuner.start_autotune(**kwargs)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+    if not task_id:
+        return jsonify({"error": "Autotune already running"}), 409
+    return jsonify(dict(preset_tuner.tuning_state(), task_id=task_id)), 202
+
+
+@presets_bp.route("/api/presets/<codec>", methods=["PUT", "DELETE"])
+def override_preset(codec):
+    """Pin a codec's preset ({"preset": "medium"}), or DELETE to drop the override (admin only)"""
+    denied = _admin_error()
+    if denied:
+        return denied
+    preset = None
+    if request.method == "PUT":
+        preset = (request.get_json(silent=True) or request.form).get("preset")
+        if not preset:
+            return jsonify({"error": "Missing preset"}), 400
+    try:
+        preset_tuner.set_override(codec, preset)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(preset_tuner.tuning_state())
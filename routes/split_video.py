@@ -1,10 +1,17 @@
 # routes/slit_video.py
 
 
-from flask import Blueprint, request, jsonify, render_template, send_from_directory, current_app
+from flask import Blueprint, request, jsonify, render_template, send_from_directory, current_app, Response
 import os
-from utils.file_utils import save_uploaded_files
-from services.ffmpeg_service import split_video as ffmpeg_split_video
+import json
+import uuid
+from utils.file_utils import save_uploaded_files, iter_zip
+from services.ffmpeg_service import split_video as ffmpeg_split_video, split_video_ranges, MULTI_SPLIT_MODES
+from services.task_store import tasks
+from services.split_engine import SPLIT_MODES
+from config import SPLIT_DEFAULT_MODE, MAX_SPLIT_RANGES
+from workers.job_scheduler import scheduler, QueueFullError
+from services.upload_service import claim_upload, release_uploads, UploadError
 
 split_bp = Blueprint("split_bp", __name__)
 
@@ -13,6 +20,15 @@ UPLOAD_FOLDER = "incoming"
 OUTPUT_FOLDER = "processed"
 
 
+def _give_back(upload_id, input_path):
+    """Undo taking the input of a refused job: a resumable upload stays
+    available for the retry, a form upload is deleted"""
+    if upload_id:
+        release_uploads([upload_id])
+    else:
+        os.remove(input_path)
+
+
 # -------------------------------
 # PAGE ROUTE (renders split.html)
 # -------------------------------
@@ -27,30 +43,52 @@ OUTPUT_FOLDER = "processed"
 @split_bp.route("/split-video", methods=["POST"])
 def split_video():
     video = request.files.get("video")
+    upload_id = request.form.get("upload_id")
     start = request.form.get("start")
     end = request.form.get("end")
+    ranges_field = request.form.get("ranges")
+    multi = ranges_field is not None
+    mode = request.form.get("mode", "copy" if multi else SPLIT_DEFAULT_MODE)
 
-    if not video:
+    if not video and not upload_id:
         return jsonify({"error": "No video uploaded"}), 400
 
-    if start is None or end is None:
+    if not multi and (start is None or end is None):
         return jsonify({"error": "Start and end times are required"}), 400
 
-    # Validate numeric times
+    if mode not in (MULTI_SPLIT_MODES if multi else SPLIT_MODES):
+        return jsonify({"error": f"Unknown split mode: {mode}"}), 400
+
+    # Validate numeric times; "ranges" is a JSON list of [start, end] pairs
     try:
-        start_float = float(start)
-        end_float = float(end)
-        if end_float <= start_float:
-            return jsonify({"error": "End time must be greater than start time"}), 400
-    except ValueError:
+        if multi:
+            ranges = [
+                (float(r["start"]), float(r["end"])) if isinstance(r, dict) else (float(r[0]), float(r[1]))
+                for r in json.loads(ranges_field)
+            ]
+            if not ranges or len(ranges) > MAX_SPLIT_RANGES:
+                return jsonify({"error": f"Between 1 and {MAX_SPLIT_RANGES} ranges are allowed"}), 400
+        else:
+            ranges = [(float(start), float(end))]
+        for range_start, range_end in ranges:
+            if range_start < 0 or range_end <= range_start:
+                return jsonify({"error": "End time must be greater than start time"}), 400
+        start_float, end_float = ranges[0]
+    except (ValueError, TypeError, KeyError, IndexError):
         return jsonify({"error": "Invalid time values"}), 400
 
     # Ensure folders exist
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-    # Save uploaded video using existing utility function
-    saved_files = save_uploaded_files([video], UPLOAD_FOLDER)
+    # Save uploaded video using existing utility function (or take a finished upload)
+    if upload_id:
+        try:
+            saved_files = [claim_upload(upload_id)]
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status
+    else:
+        saved_files = save_uploaded_files([video], UPLOAD_FOLDER)
 
     if not saved_files:
         return jsonify({"error": "Failed to save uploaded video"}), 400
@@ -58,13 +96,30 @@ def split_video():
     input_filename = saved_files[0]
     input_path = os.path.join(UPLOAD_FOLDER, input_filename)
 
+    # Several ranges: one ffmpeg pass, run as an async task
+    if multi:
+        task_id = str(uuid.uuid4())
+        tasks.create(task_id, {"status": "queued", "percent": 0, "files": [], "total": len(ranges)})
+        try:
+            scheduler.submit(task_id, split_video_ranges,
+                             task_id, input_path, ranges, OUTPUT_FOLDER, mode)
+        except QueueFullError as e:
+            tasks.delete(task_id)
+            _give_back(upload_id, input_path)
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+        return jsonify({"task_id": task_id, "zip_url": f"/download-split-zip/{task_id}"})
+
     # Output file name
     output_filename = f"split_{input_filename}"
     output_path = os.path.join(OUTPUT_FOLDER, output_filename)
 
-    # Perform the split using FFmpeg
+    # Perform the split using FFmpeg (through the shared worker pool)
     try:
-        ffmpeg_split_video(input_path, output_path, start_float, end_float)
+        scheduler.run(output_filename, ffmpeg_split_video,
+                      input_path, output_path, start_float, end_float, mode)
+    except QueueFullError as e:
+        _give_back(upload_id, input_path)
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
     except Exception as e:
         current_app.logger.exception("Error splitting video")
         return jsonify({"error": "Failed to split video"}), 500
@@ -81,3 +136,24 @@ def split_video():
 @split_bp.route("/download-split/<filename>", methods=["GET"])
 def download_split(filename):
     return send_from_directory(OUTPUT_FOLDER, filename, as_attachment=True)
+
+
+@split_bp.route("/download-split-zip/<task_id>", methods=["GET"])
+def download_split_zip(task_id):
+    """Stream every clip of a finished multi-range split as one zip"""
+    task = tasks.get(task_id)
+    if not task:
+        return jsonify({"error": "Task not found"}), 404
+    if task.get("status") != "done":
+        return jsonify({"error": "Split is not finished"}), 409
+
+    paths = [os.path.join(OUTPUT_FOLDER, name) for name in task.get("files", [])]
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return jsonify({"error": "File not found"}), 404
+
+    return Response(
+        iter_zip(paths),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=clips_{task_id[:8]}.zip"},
+    )
@@ -0,0 +1,43 @@
+# routes/uploads.py
+
+from flask import Blueprint, request, jsonify
+from services.upload_service import (UploadError, create_upload, get_upload,
+                                     write_chunk, finalize_upload)
+
+uploads_bp = Blueprint("uploads", __name__)
+
+
+@uploads_bp.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({"error": str(e)}), e.status
+
+
+@uploads_bp.route("/api/uploads", methods=["POST"])
+def init_upload():
+    """Start a resumable upload: {"filename": ..., "size": bytes}"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        size = int(data.get("size", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid file size"}), 400
+    return jsonify(create_upload(data.get("filename", ""), size)), 201
+
+
+@uploads_bp.route("/api/uploads/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    """Received byte ranges, so a client can resume after a dropped connection"""
+    return jsonify(get_upload(upload_id))
+
+
+@uploads_bp.route("/api/uploads/<upload_id>", methods=["PUT"])
+def put_chunk(upload_id):
+    """Raw chunk body written at ?offset=<byte offset>"""
+    offset = request.args.get("offset", type=int)
+    if offset is None:
+        return jsonify({"error": "Missing offset"}), 400
+    return jsonify(write_chunk(upload_id, offset, request.stream))
+
+
+@uploads_bp.route("/api/uploads/<upload_id>/finalize", methods=["POST"])
+def finalize(upload_id):
+    return jsonify(finalize_upload(upload_id))
@@ -2,13 +2,86 @@
 
 from flask import Blueprint, request, jsonify, send_from_directory
 import os
-from services.video_ops_service import process_video_background
+import uuid
+from config import UPLOAD_DIR, BG_REMOVAL_QUALITY, BG_REMOVAL_DEFAULT_QUALITY, PREDEFINED_BG_DIR
+from services.video_ops_service import remove_background_task
+from services.video_preview import render_preview, register_input, resolve_input
+from services.segmentation_models import segmenter_pool, ModelUnavailableError
+from services.task_store import tasks
+from workers.job_scheduler import scheduler, preview_scheduler, QueueFullError
+from services.upload_service import claim_upload, release_uploads, UploadError
+from utils.file_utils import unique_upload_name
 
 video_ops_bp = Blueprint("video_ops_bp", __name__)
 
 INCOMING_FOLDER = "incoming"
 PROCESSED_FOLDER = "processed"
-PREDEFINED_BG_FOLDER = os.path.join("static", "images", "backgrounds")  # you can change this
+PREDEFINED_BG_FOLDER = PREDEFINED_BG_DIR  # set in config.py
+
+
+def _save_incoming(file):
+    """Save a request file under a collision-free name in INCOMING_FOLDER"""
+    path = os.path.join(INCOMING_FOLDER, unique_upload_name(file.filename))
+    file.save(path)
+    return path
+
+
+def _input_path():
+    """(input video, preview_id) of the request: resumable upload, earlier
+    preview (by its opaque preview_id) or form file"""
+    video_file = request.files.get("video_file")
+    upload_id = request.form.get("upload_id")
+    preview_id = request.form.get("preview_id")
+
+    if upload_id:
+        return os.path.join(UPLOAD_DIR, claim_upload(upload_id)), None
+    if preview_id:
+        # Input already sent with a preview request
+        path = resolve_input(preview_id)
+        if not path:
+            raise UploadError("Preview not found", 404)
+        return path, preview_id
+    if not video_file:
+        return None, None
+    return _save_incoming(video_file), None
+
+
+def _background_source():
+    background_color = request.form.get("background_color")
+    background_image = request.files.get("background_image")
+    background_video = request.files.get("background_video")
+    predefined_bg_image = request.form.get("predefined_bg_image")
+    predefined_bg_video = request.form.get("predefined_bg_video")
+
+    bg_source = None
+
+    if background_color:
+        bg_source = {"type": "color", "value": background_color}
+
+    elif background_image:
+        bg_source = {"type": "image", "value": _save_incoming(background_image)}
+
+    elif background_video:
+        bg_source = {"type": "video", "value": _save_incoming(background_video)}
+
+    elif predefined_bg_image:
+        bg_source = {
+            "type": "image",
+            "value": os.path.join(PREDEFINED_BG_FOLDER, predefined_bg_image),
+        }
+
+    elif predefined_bg_video:
+        bg_source = {
+            "type": "video",
+            "value": os.path.join(PREDEFINED_BG_FOLDER, predefined_bg_video),
+        }
+
+    return bg_source
+
+
+def _feather():
+    # Soft edge width in mask confidence (0 = hard cut-out)
+    return min(max(float(request.form.get("feather", 0)), 0.0), 1.0)
 
 
 @video_ops_bp.route("/api/video-ops/process", methods=["POST"])
@@ -17,62 +90,112 @@ def process_video_ops():
         os.makedirs(INCOMING_FOLDER, exist_ok=True)
         os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
-        video_file = request.files.get("video_file")
         threshold = float(request.form.get("threshold", 0.5))
-        background_color = request.form.get("background_color")
-        background_image = request.files.get("background_image")
-        background_video = request.files.get("background_video")
-        predefined_bg_image = request.form.get("predefined_bg_image")
-        predefined_bg_video = request.form.get("predefined_bg_video")
         remove_voice = request.form.get("remove_voice") == "true"
+        quality = request.form.get("quality", BG_REMOVAL_DEFAULT_QUALITY)
+        if quality not in BG_REMOVAL_QUALITY:
+            return jsonify({"error": "Invalid quality"}), 400
+        feather = _feather()
 
-        if not video_file:
+        input_path, _ = _input_path()
+        if not input_path:
             return jsonify({"error": "No video file provided"}), 400
 
-        input_path = os.path.join(INCOMING_FOLDER, video_file.filename)
-        video_file.save(input_path)
-
-        bg_source = None
-
-        if background_color:
-            bg_source = {"type": "color", "value": background_color}
-
-        elif background_image:
-            bg_path = os.path.join(INCOMING_FOLDER, background_image.filename)
-            background_image.save(bg_path)
-            bg_source = {"type": "image", "value": bg_path}
-
-        elif background_video:
-            bg_path = os.path.join(INCOMING_FOLDER, background_video.filename)
-            background_video.save(bg_path)
-            bg_source = {"type": "video", "value": bg_path}
-
-        elif predefined_bg_image:
-            bg_source = {
-                "type": "image",
-                "value": os.path.join(PREDEFINED_BG_FOLDER, predefined_bg_image),
-            }
-
-        elif predefined_bg_video:
-            bg_source = {
-                "type": "video",
-                "value": os.path.join(PREDEFINED_BG_FOLDER, predefined_bg_video),
-            }
-
-        output_file = process_video_background(
-            input_path=input_path,
-            bg_source=bg_source,
-            threshold=threshold,
-            output_folder=PROCESSED_FOLDER,
-            remove_voice=remove_voice,
-        )
+        bg_source = _background_source()
 
+        # Queue the job on the shared worker pool and answer straight away
+        task_id = str(uuid.uuid4())
+        tasks.create(task_id, {
+            "status": "queued",
+            "percent": 0,
+            "frames_done": 0,
+            "total_frames": 0,
+            "file": None,
+        })
+        try:
+            scheduler.submit(
+                task_id,
+                remove_background_task,
+                task_id,
+                input_path,
+                bg_source=bg_source,
+                threshold=threshold,
+                output_folder=PROCESSED_FOLDER,
+                remove_voice=remove_voice,
+                quality=quality,
+                feather=feather,
+            )
+        except QueueFullError:
+            tasks.delete(task_id)
+            upload_id = request.form.get("upload_id")
+            if upload_id:
+                # Keep the upload, so the client can retry without sending it again
+                release_uploads([upload_id])
+            raise
+
+        return jsonify({"task_id": task_id, "queue_position": scheduler.position(task_id)})
+
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+    except Exception as e:
+        print("VIDEO BG ERROR:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@video_ops_bp.route("/api/video-ops/preview", methods=["POST"])
+def preview_video_ops():
+    """Low-resolution preview of a few sampled frames, ready within seconds.
+
+    Send the returned preview_id instead of the file on later previews (and
+    on the final /process request); sampled frames and masks are cached, so
+    changing the threshold or background does not run inference again.
+    """
+    try:
+        os.makedirs(INCOMING_FOLDER, exist_ok=True)
+        os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+
+        threshold = float(request.form.get("threshold", 0.5))
+        feather = _feather()
+        input_path, preview_id = _input_path()
+        if not input_path:
+            return jsonify({"error": "No video file provided"}), 400
+        bg_source = _background_source()
+        preview_id = preview_id or register_input(input_path)
+
+        output_file, cached = preview_scheduler.run(
+            f"preview:{preview_id}", render_preview,
+            input_path, bg_source, threshold, PROCESSED_FOLDER, feather,
+        )
         return jsonify({
-            "status": "done",
+            "preview_id": preview_id,
             "file": output_file,
-            "download_url": f"/download-file/{output_file}",
+            "preview_url": f"/api/video-ops/preview/{output_file}",
+            "cached_masks": cached,
         })
 
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+    except ModelUnavailableError as e:
+        print("VIDEO BG MODEL ERROR:", e)
+        return jsonify({"error": "Background removal is not available"}), 503
     except Exception as e:
-        print("VIDEO BG ERROR:", e)
+        print("VIDEO BG PREVIEW ERROR:", e)
         return jsonify({"error": str(e)}), 500
+
+
+@video_ops_bp.route("/api/video-ops/preview/<filename>", methods=["GET"])
+def preview_file(filename):
+    """Serve a preview inline so the page can play it"""
+    if not filename.startswith("bg_preview_"):
+        return jsonify({"error": "Invalid filename"}), 400
+    return send_from_directory(PROCESSED_FOLDER, filename)
+
+
+@video_ops_bp.route("/api/video-ops/metrics", methods=["GET"])
+def video_ops_metrics():
+    """Segmentation model load time and warm pool usage for this worker process"""
+    return jsonify(segmenter_pool.metrics())
@@ -0,0 +1,11 @@
+#!/bin/sh
+# Fetch the models the app loads from models/ (run once per checkout/build)
+set -e
+cd "$(dirname "$0")/.."
+mkdir -p models
+if [ ! -s models/selfie_segmenter.tflite ]; then
+  curl -fsSL -o models/selfie_segmenter.tflite.tmp \
+    https://storage.googleapis.com/mediapipe-models/image_segmenter/selfie_segmenter/float16/latest/selfie_segmenter.tflite
+  mv models/selfie_segmenter.tflite.tmp models/selfie_segmenter.tflite
+fi
+echo "models/selfie_segmenter.tflite ready"
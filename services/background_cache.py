@@ -0,0 +1,165 @@
+# services/background_cache.py
+
+import os
+import time
+import uuid
+import fcntl
+import threading
+import subprocess
+from collections import OrderedDict
+import numpy as np
+from config import FFMPEG, BG_CACHE_DIR, BG_CACHE_MAX_MB, BG_CACHE_MAX_ASSET_MB, PREDEFINED_BG_DIR
+from services.media_index import index_key, get_media_index
+from utils.file_utils import evict_lru
+
+_OPEN_LIMIT = 16
+_UNCACHEABLE_LIMIT = 256
+_open_rings = OrderedDict()  # file name -> np.memmap (per process)
+_open_lock = threading.Lock()
+_build_locks = {}
+_uncacheable = OrderedDict()  # ring names (content key + size) too long or undecodable here
+# Build locks shared by every process (kept out of BG_CACHE_DIR so eviction never removes one)
+_LOCK_DIR = os.path.join(os.path.dirname(BG_CACHE_DIR), ".locks")
+
+
+def _decode(path, ring_path, width, height, max_frames):
+    """Decode every frame of path scaled to width x height as raw BGR into ring_path"""
+    tmp = f"{ring_path}.{uuid.uuid4().hex[:8]}.tmp"
+    cmd = [FFMPEG, "-y", "-v", "error", "-i", path,
+           "-map", "0:v:0", "-vf", f"scale={width}:{height}",
+           "-frames:v", str(max_frames + 1),
+           "-f", "rawvideo", "-pix_fmt", "bgr24", tmp]
+    try:
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        frames = os.path.getsize(tmp) // (width * height * 3)
+        if frames == 0 or frames > max_frames:
+            return False
+        os.replace(tmp, ring_path)
+        return True
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _too_long(path, max_frames):
+    """True when the media index already shows the asset decodes to more than max_frames"""
+    try:
+        index = get_media_index(path)
+    except Exception:
+        return False
+    video = index.video_stream() or {}
+    num, _, den = str(video.get("avg_frame_rate") or "0/1").partition("/")
+    try:
+        fps = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return False
+    return index.duration * fps > max_frames * 1.05
+
+
+def _build(path, ring_path, skip_path, width, height, max_frames):
+    """Decode the ring unless another process has (or has given up); True if it exists"""
+    os.makedirs(BG_CACHE_DIR, exist_ok=True)
+    os.makedirs(_LOCK_DIR, exist_ok=True)
+    with open(os.path.join(_LOCK_DIR, os.path.basename(ring_path) + ".lock"), "w") as lock:
+        # One decode per asset and size on the host; the others wait and map its result
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(ring_path):
+            return True
+        if os.path.exists(skip_path):
+            return False
+        try:
+            built = not _too_long(path, max_frames) and _decode(path, ring_path, width, height, max_frames)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Background cache decode failed for {path}: {e}")
+            built = False
+        if not built:
+            # Negative marker: no other process repeats a decode that cannot be cached
+            open(skip_path, "w").close()
+        return built
+
+
+def is_cacheable(path):
+    """Only stock backgrounds are reused across jobs; uploads get unique names"""
+    root = os.path.realpath(PREDEFINED_BG_DIR)
+    return os.path.realpath(path).startswith(root + os.sep)
+
+
+def get_frames(path, width, height):
+    """Read-only (frames, height, width, 3) uint8 memmap of path at this size, or None.
+
+    The asset (a stock background video or image) is decoded once per
+    content and size; the raw frame ring on disk is shared by every worker
+    process through the page cache. None for assets outside
+    PREDEFINED_BG_DIR, and when the asset decodes to more than
+    BG_CACHE_MAX_ASSET_MB or cannot be decoded; that outcome is remembered
+    on disk (a .skip marker, evicted like the rings) so other processes and
+    jobs stream the asset without trying again.
+    """
+    if not is_cacheable(path):
+        return None
+    name = f"{index_key(path)}_{width}x{height}.bgr"
+    ring_path = os.path.join(BG_CACHE_DIR, name)
+    skip_path = os.path.join(BG_CACHE_DIR, f"{name}.skip")
+    with _open_lock:
+        ring = _open_rings.get(name)
+        if ring is not None:
+            _open_rings.move_to_end(name)
+    if ring is not None:
+        try:
+            os.utime(ring_path)
+        except OSError:
+            pass  # evicted on disk; this process keeps its mapping
+        return ring
+    with _open_lock:
+        if name in _uncacheable:
+            _uncacheable.move_to_end(name)
+            return None
+        build_lock = _build_locks.setdefault(name, threading.Lock())
+
+    frame_bytes = width * height * 3
+    with build_lock:
+        if not os.path.exists(ring_path):
+            max_frames = max(1, BG_CACHE_MAX_ASSET_MB * 1024 * 1024 // frame_bytes)
+            if not _build(path, ring_path, skip_path, width, height, max_frames):
+                with _open_lock:
+                    _build_locks.pop(name, None)
+                    _uncacheable[name] = True
+                    while len(_uncacheable) > _UNCACHEABLE_LIMIT:
+                        _uncacheable.popitem(last=False)
+                return None
+        try:
+            frames = os.path.getsize(ring_path) // frame_bytes
+            ring = np.memmap(ring_path, dtype=np.uint8, mode="r", shape=(frames, height, width, 3))
+            os.utime(ring_path)  # mtime doubles as LRU recency
+        except (OSError, ValueError):
+            # Evicted between the check and the map: let the caller stream instead
+            ring = None
+
+    with _open_lock:
+        _build_locks.pop(name, None)
+        if ring is not None:
+            _open_rings[name] = ring
+            while len(_open_rings) > _OPEN_LIMIT:
+                _open_rings.popitem(last=False)
+    return ring
+
+
+def evict(max_bytes=BG_CACHE_MAX_MB * 1024 * 1024, lock_age_seconds=3600):
+    """Keep the frame rings within their size budget (LRU); mapped rings stay valid.
+
+    Lock files of assets whose ring and marker are gone are dropped once old.
+    """
+    removed = evict_lru(BG_CACHE_DIR, max_bytes)
+    if os.path.isdir(_LOCK_DIR):
+        cutoff = time.time() - lock_age_seconds
+        for lock_name in os.listdir(_LOCK_DIR):
+            name = lock_name[:-len(".lock")]
+            lock_path = os.path.join(_LOCK_DIR, lock_name)
+            try:
+                if (os.path.getmtime(lock_path) < cutoff
+                        and not os.path.exists(os.path.join(BG_CACHE_DIR, name))
+                        and not os.path.exists(os.path.join(BG_CACHE_DIR, f"{name}.skip"))):
+                    os.remove(lock_path)
+            except OSError:
+                continue
+    return removed
@@ -0,0 +1,115 @@
+# services/chunked_encoder.py
+
+import os
+import csv
+import uuid
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from config import FFMPEG, CHUNK_SECONDS, CHUNK_ENCODER_THREADS, AUDIO_BITRATE
+from utils.ffmpeg_utils import run_with_progress
+
+
+def split_at_keyframes(input_path, work_dir, chunk_seconds=CHUNK_SECONDS):
+    """Stream-copy the video track into keyframe-aligned chunks.
+
+    Returns [(chunk_path, start, end), ...] in playback order.
+    """
+    list_path = os.path.join(work_dir, "chunks.csv")
+    cmd = [
+        FFMPEG, "-y",
+        "-i", input_path,
+        "-map", "0:v:0",
+        "-c", "copy",
+        "-f", "segment",
+        "-segment_time", str(chunk_seconds),
+        "-segment_list", list_path,
+        "-segment_list_type", "csv",
+        "-reset_timestamps", "1",
+        os.path.join(work_dir, "chunk_%05d.mkv"),
+    ]
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    chunks = []
+    with open(list_path, newline="") as f:
+        for name, start, end in csv.reader(f):
+            chunks.append((os.path.join(work_dir, name), float(start), float(end)))
+    return chunks
+
+
+def encode_chunked(input_path, output_path, codec, settings, duration,
+                   parallel, on_percent=None, audio_bitrate=AUDIO_BITRATE, copy_audio=False):
+    """Encode one long video as parallel chunks and join them with the concat demuxer.
+
+    Each chunk is encoded by its own ffmpeg process (CHUNK_ENCODER_THREADS
+    threads each), `parallel` at a time. Audio is encoded once in a separate
+    process so chunk boundaries cannot introduce gaps. Returns True on success.
+    """
+    work_dir = os.path.join(os.path.dirname(os.path.abspath(output_path)), f".chunks_{uuid.uuid4().hex[:8]}")
+    os.makedirs(work_dir)
+    try:
+        chunks = split_at_keyframes(input_path, work_dir)
+
+        lock = threading.Lock()
+        done_seconds = [0.0] * len(chunks)
+
+        def report(index, seconds):
+            with lock:
+                done_seconds[index] = seconds
+                total = sum(done_seconds)
+            if on_percent:
+                on_percent(max(0, min(int(total / duration * 100), 99)))
+
+        def encode_chunk(index):
+            chunk_path, start, end = chunks[index]
+            encoded_path = os.path.join(work_dir, f"enc_{index:05d}.mkv")
+            cmd = [
+                FFMPEG, "-y",
+                "-i", chunk_path,
+                "-c:v", codec,
+                "-preset", settings["preset"],
+                "-crf", settings["crf"],
+                "-threads", str(CHUNK_ENCODER_THREADS),
+                "-an",
+                "-progress", "pipe:1",
+                "-nostats",
+                encoded_path,
+            ]
+            code = run_with_progress(cmd, lambda t: report(index, min(t, end - start)))
+            if code != 0:
+                raise RuntimeError(f"Chunk {index} failed to encode")
+            return encoded_path
+
+        def encode_audio():
+            audio_path = os.path.join(work_dir, "audio.m4a")
+            cmd = [
+                FFMPEG, "-y",
+                "-i", input_path,
+                "-map", "0:a:0",
+            ]
+            cmd += ["-c:a", "copy"] if copy_audio else ["-c:a", "aac", "-b:a", str(audio_bitrate)]
+            cmd.append(audio_path)
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            # A non-zero exit here just means the input has no audio track
+            return audio_path if result.returncode == 0 else None
+
+        with ThreadPoolExecutor(max_workers=max(1, parallel) + 1) as pool:
+            audio_future = pool.submit(encode_audio)
+            encoded = list(pool.map(encode_chunk, range(len(chunks))))
+            audio_path = audio_future.result()
+
+        concat_list = os.path.join(work_dir, "concat.txt")
+        with open(concat_list, "w") as f:
+            for path in encoded:
+                f.write(f"file '{path}'\n")
+
+        cmd = [FFMPEG, "-y", "-f", "concat", "-safe", "0", "-i", concat_list]
+        if audio_path:
+            cmd += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+        cmd += ["-c", "copy", output_path]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return result.returncode == 0
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,158 @@
+# services/compositor.py
+
+import cv2
+import numpy as np
+from services import background_cache
+
+
+class Compositor:
+    """Blend foreground frames over a background without per-frame allocations.
+
+    Output frames come from a ring of `ring` preallocated buffers, so a frame
+    stays valid while up to ring - 1 newer frames are composited (size it to
+    the number of frames queued downstream). With feather == 0 the mask is
+    hard: background is copied and the foreground copied over it where the
+    confidence exceeds threshold. With feather > 0 confidence within
+    threshold +/- feather/2 becomes a soft alpha, blended in uint16 fixed
+    point: out = (fg * a + bg * (256 - a)) >> 8 with a in [0, 256].
+    """
+
+    def __init__(self, width, height, threshold, feather=0.0, ring=12):
+        self.threshold = threshold
+        self.feather = feather
+        self._ring = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(max(2, ring))]
+        self._next = 0
+        self._hard = np.empty((height, width, 1), dtype=bool)
+        if feather > 0:
+            self._soft = np.empty((height, width), dtype=np.float32)
+            self._alpha = np.empty((height, width, 1), dtype=np.uint16)
+            self._inverse = np.empty((height, width, 1), dtype=np.uint16)
+            self._acc = np.empty((height, width, 3), dtype=np.uint16)
+            self._tmp = np.empty((height, width, 3), dtype=np.uint16)
+
+    def _output(self):
+        out = self._ring[self._next]
+        self._next = (self._next + 1) % len(self._ring)
+        return out
+
+    def composite(self, frame, confidence, background):
+        """frame/background: HxWx3 uint8, confidence: HxW float32 in [0, 1]"""
+        out = self._output()
+        if self.feather <= 0:
+            np.greater(confidence, self.threshold, out=self._hard[:, :, 0])
+            np.copyto(out, background)
+            np.copyto(out, frame, where=self._hard)
+            return out
+
+        # alpha = clip((confidence - (threshold - feather / 2)) / feather, 0, 1) * 256
+        soft = self._soft
+        np.subtract(confidence, self.threshold - self.feather / 2, out=soft)
+        np.multiply(soft, 256 / self.feather, out=soft)
+        np.clip(soft, 0, 256, out=soft)
+        np.copyto(self._alpha[:, :, 0], soft, casting="unsafe")
+        np.subtract(256, self._alpha, out=self._inverse)
+
+        np.multiply(frame, self._alpha, out=self._acc)
+        np.multiply(background, self._inverse, out=self._tmp)
+        np.add(self._acc, self._tmp, out=self._acc)
+        np.right_shift(self._acc, 8, out=self._acc)
+        np.copyto(out, self._acc, casting="unsafe")
+        return out
+
+
+class BackgroundSource:
+    """Background frames at the output size, resized once and reused.
+
+    Stock images and videos come from the shared background cache (a
+    memory-mapped raw frame ring) whenever it can hold them; uploaded ones
+    are only used once, so they are streamed. Otherwise images are resized
+    once, and a looping background video is resized into a per-job cache
+    while it fits within max_bytes; once one full loop (from its first
+    frame) is cached the video is no longer decoded.
+    Longer videos are resized into a reusable ring instead. start_index is
+    the absolute output frame of the first frame() call, so a worker given
+    a frame range starts at the right point of the loop. use_cache=False
+    skips the shared cache, for callers that only need a few frames.
+    """
+
+    def __init__(self, bg_source, width, height, max_bytes=256 * 1024 * 1024, ring=12, start_index=0,
+                 use_cache=True):
+        self.size = (width, height)
+        self._still = None
+        self._cap = None
+        self._frames = []
+        self._complete = False
+        # Frames are cached only from the loop's first frame, so an offset start waits for the wrap
+        self._caching = start_index == 0
+        self._cacheable = True
+        self._ring = None  # allocated only once a video turns out too long to cache
+        self._ring_size = max(2, ring)
+        self._next = 0
+        self._max_frames = max(1, max_bytes // (width * height * 3))
+
+        kind = bg_source["type"] if bg_source else None
+        shared = None
+        if use_cache and kind in ("image", "video"):
+            # Decoded and scaled once per asset and size, shared across jobs and processes
+            shared = background_cache.get_frames(bg_source["value"], width, height)
+
+        if kind == "color":
+            color = bg_source["value"].lstrip("#")
+            r, g, b = tuple(int(color[i:i+2], 16) for i in (0, 2, 4))
+            self._still = np.full((height, width, 3), (b, g, r), dtype=np.uint8)
+        elif shared is not None and len(shared) == 1:
+            self._still = shared[0]
+        elif shared is not None:
+            self._frames = shared
+            self._complete = True
+        elif kind == "image":
+            self._still = cv2.resize(cv2.imread(bg_source["value"]), self.size)
+        elif kind == "video":
+            self._cap = cv2.VideoCapture(bg_source["value"])
+            loop = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if start_index and loop > 0:
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, start_index % loop)
+        else:
+            self._still = np.zeros((height, width, 3), dtype=np.uint8)
+
+    def frame(self, index):
+        """Background for absolute output frame `index` (loops over a video background)"""
+        if self._still is not None:
+            return self._still
+        if self._complete:
+            return self._frames[index % len(self._frames)]
+
+        ret, bg = self._cap.read()
+        if not ret:
+            if self._caching and self._frames:
+                # One full loop is cached: stop decoding
+                self._complete = True
+                self._cap.release()
+                return self._frames[index % len(self._frames)]
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, bg = self._cap.read()
+            if not ret:
+                raise RuntimeError("Could not read the background video")
+            self._caching = self._cacheable
+            self._frames = []
+
+        if self._caching:
+            if len(self._frames) < self._max_frames:
+                resized = cv2.resize(bg, self.size)
+                self._frames.append(resized)
+                return resized
+            # Too long to cache: resize into reused buffers from now on
+            self._caching = self._cacheable = False
+            self._frames = []
+
+        if self._ring is None:
+            self._ring = [np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+                          for _ in range(self._ring_size)]
+        out = self._ring[self._next]
+        self._next = (self._next + 1) % len(self._ring)
+        cv2.resize(bg, self.size, dst=out)
+        return out
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
@@ -2,8 +2,14 @@ import yt_dlp
 import os
 import uuid
 import time  # Add this import for retry logic
+from services.metadata_cache import metadata_cache
 
 def extract_video_info(url):
+    """Metadata + useful formats, cached per normalized URL (see metadata_cache)."""
+    return metadata_cache.get(url, _extract_video_info)
+
+
+def _extract_video_info(url):
     """Extract metadata + useful formats only."""
     
     # Universal ydl_opts that work for most sites
@@ -35,6 +41,10 @@ def extract_video_info(url):
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
         info = ydl.extract_info(url, download=False)
 
+    # ignoreerrors makes yt-dlp return None instead of raising; never cache that
+    if not info:
+        raise Exception("Could not extract video info")
+
     title = info.get("title")
     thumbnail = info.get("thumbnail")
     formats = info.get("formats", [])
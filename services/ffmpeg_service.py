@@ -1,11 +1,32 @@
 # services/ffmpeg_service.py
 
 import os
+import uuid
+import shutil
+import tempfile
 import subprocess
-from config import TASKS, COMPRESSION_SETTINGS, FFMPEG, FFPROBE
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import (COMPRESSION_SETTINGS, FFMPEG, FFPROBE, BATCH_PARALLELISM,
+                    CHUNKED_ENCODE_MIN_SECONDS, CHUNK_ENCODER_THREADS, SPLIT_DEFAULT_MODE,
+                    SPLIT_REENCODE_CRF, SPLIT_REENCODE_PRESET, AUDIO_BITRATE,
+                    FASTPATH_TARGET_BPP, ENCODER_CODEC_NAMES, CPU_SHARE)
+from services.task_store import tasks
+from services.chunked_encoder import encode_chunked
+from services.size_estimator import estimate_target_size, TargetSizeError
+from services.split_engine import SPLIT_MODES
+from services.media_index import get_media_index
+from services import result_cache, preset_tuner
+from workers.job_scheduler import scheduler
+from utils.file_utils import get_content_hash
+from utils.ffmpeg_utils import run_with_progress, percent_of
 
 def get_video_duration(file_path):
-    """Get video duration using ffprobe"""
+    """Get video duration from the media index (falls back to a direct ffprobe)"""
+    try:
+        return get_media_index(file_path).duration
+    except Exception as e:
+        print(f"Media index unavailable for {file_path}: {e}")
     try:
         probe = subprocess.run(
             [FFPROBE, "-v", "error", "-show_entries",
@@ -16,120 +37,534 @@ def get_video_duration(file_path):
     except:
         return 0
 
-def compress_single_video(input_path, output_path, codec, task_id, file_index, total_files, filename):
-    """Compress a single video file"""
-    settings = COMPRESSION_SETTINGS.get(codec, COMPRESSION_SETTINGS["libx264"])
+class BatchProgress:
+    """Per-file progress of one compression task, published as task["progress"]"""
+
+    def __init__(self, task_id, filenames):
+        self.task_id = task_id
+        self._lock = threading.Lock()
+        self.entries = [{"file": name, "status": "pending", "percent": 0} for name in filenames]
+
+    def set(self, index, flush=False, **fields):
+        with self._lock:
+            self.entries[index].update(fields)
+            snapshot = [dict(entry) for entry in self.entries]
+        done = sum(1 for entry in snapshot if entry["status"] in ("done", "error"))
+        if flush:
+            tasks.update(self.task_id, progress=snapshot, current=done)
+        else:
+            tasks.update_progress(self.task_id, progress=snapshot, current=done)
+
+
+def ffmpeg_thread_budget(parallel):
+    """Encoder threads per ffmpeg process so this worker process's share of
+    the CPU is split between `parallel` encodes in each active scheduler job"""
+    return max(1, CPU_SHARE // (scheduler.active_jobs() * max(1, parallel)))
+
+
+def _frame_rate(stream):
+    num, _, den = str(stream.get("avg_frame_rate") or "0/1").partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0
+
+def stream_bitrate(stream):
+    """Bitrate of a probed stream in bit/s, or None when the container does not say.
+
+    MKV/WebM rarely set bit_rate on a stream; mkvmerge writes it as a BPS tag.
+    """
+    if not stream:
+        return None
+    for value in (stream.get("bit_rate"), stream.get("tag:BPS"), stream.get("tag:BPS-eng")):
+        try:
+            if value and float(value) > 0:
+                return float(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def plan_compression(input_path, codec):
+    """Decide per stream whether re-encoding is worth it, from the media index.
+
+    video: "copy" when the source already uses this codec below the bitrate
+    the encode would target, "capped" (encode with -maxrate at the source
+    bitrate) when it is below target in another codec, otherwise "encode".
+    audio: "copy" when the source is AAC known to be at or below
+    AUDIO_BITRATE (an unknown bitrate is re-encoded).
+    """
+    try:
+        index = get_media_index(input_path)
+    except Exception as e:
+        print(f"Probe failed for {input_path}, encoding normally: {e}")
+        return {"video": "encode", "audio": "encode"}
+    return plan_from_streams(index.video_stream(), index.audio_stream(),
+                             float(index.format.get("bit_rate") or 0), codec)
+
+def plan_from_streams(video, audio, total_bitrate, codec):
+    """plan_compression's decision for probed streams; total_bitrate is the
+    container's overall bit/s (0 when unknown)"""
+    plan = {"video": "encode", "audio": "encode"}
     
-    duration = get_video_duration(input_path)
-    if duration == 0:
-        duration = 1  # Prevent division by zero
+    audio_bitrate = stream_bitrate(audio)
+    if audio and audio.get("codec_name") == "aac" and audio_bitrate and audio_bitrate <= AUDIO_BITRATE:
+        plan["audio"] = "copy"
     
+    if video and video.get("width") and video.get("height"):
+        source_bitrate = stream_bitrate(video)
+        if not source_bitrate:
+            # Containers like MKV only carry the overall bitrate
+            source_bitrate = total_bitrate - (audio_bitrate or 0) if total_bitrate else None
+        target = FASTPATH_TARGET_BPP.get(codec, 0) * video["width"] * video["height"] * _frame_rate(video)
+        if source_bitrate and target and source_bitrate <= target:
+            if video.get("codec_name") == ENCODER_CODEC_NAMES.get(codec):
+                plan["video"] = "copy"
+            else:
+                plan["video"] = "capped"
+                plan["maxrate"] = int(source_bitrate)
+    return plan
+
+def build_compress_command(input_path, output_path, codec, threads=None, plan=None):
+    """ffmpeg command for the single-process CRF encode (or the plan's fast path)"""
+    settings = COMPRESSION_SETTINGS.get(codec, COMPRESSION_SETTINGS["libx264"])
+    plan = plan or {"video": "encode", "audio": "encode"}
     cmd = [
         FFMPEG, "-y",
         "-i", input_path,
-        "-c:v", codec,
-        "-preset", settings["preset"],
-        "-crf", settings["crf"],
-        "-c:a", "aac",
-        "-b:a", "160k",
+    ]
+    if plan["video"] == "copy":
+        cmd += ["-c:v", "copy"]
+    else:
+        cmd += [
+            "-c:v", codec,
+            "-preset", settings["preset"],
+            "-crf", settings["crf"],
+        ]
+        if plan["video"] == "capped":
+            # Never spend more bits than the source already does
+            cmd += ["-maxrate", str(plan["maxrate"]), "-bufsize", str(2 * plan["maxrate"])]
+        if threads:
+            cmd += ["-threads", str(threads)]
+    if plan["audio"] == "copy":
+        cmd += ["-c:a", "copy"]
+    else:
+        cmd += ["-c:a", "aac", "-b:a", str(AUDIO_BITRATE)]
+    cmd += [
         "-progress", "pipe:1",
         "-nostats",
         output_path
     ]
+    return cmd
+
+def compress_cache_key(input_path, output_path, codec, content_hash=None):
+    """Result cache key for compressing input_path with codec's settings"""
+    settings = COMPRESSION_SETTINGS.get(codec, COMPRESSION_SETTINGS["libx264"])
+    return result_cache.cache_key(
+        content_hash or get_content_hash(input_path), op="compress", codec=codec,
+        crf=settings["crf"], preset=settings["preset"],
+        ext=os.path.splitext(output_path)[1].lower()
+    )
+
+def compress_from_cache(task_id, filenames, codec, input_dir, output_dir):
+    """Finish the task straight away if every file is already in the result cache"""
+    outputs = []
+    for filename in filenames:
+        output_filename = f"compressed_{filename}"
+        key = compress_cache_key(os.path.join(input_dir, filename), output_filename, codec)
+        if not result_cache.lookup(key, os.path.join(output_dir, output_filename)):
+            return False
+        outputs.append(output_filename)
     
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
-    
-    for line in process.stdout:
-        line = line.strip()
-        if line.startswith("out_time_ms="):
-            try:
-                ms = int(line.split("=")[1])
-                # Calculate percentage with bounds
-                percent = min(int((ms / 1_000_000) / duration * 100), 100)
-                percent = max(percent, 0)  # Ensure not negative
-            except:
-                percent = 0
-            
-            # Update task status
-            if task_id in TASKS:
-                TASKS[task_id].update({
-                    "status": "processing",
-                    "current": file_index,
-                    "total": total_files,
-                    "file": filename,
-                    "percent": percent
-                })
-    
-    process.wait()
+    for filename in filenames:
+        try:
+            os.remove(os.path.join(input_dir, filename))
+        except Exception as e:
+            print(f"Error deleting {filename}: {e}")
+    tasks.update(
+        task_id,
+        status="done",
+        current=len(filenames),
+        progress=[{"file": name, "status": "done", "percent": 100, "cached": True} for name in filenames],
+        files=outputs
+    )
     return True
 
-def compress_video_files(task_id, filenames, codec, input_dir, output_dir):
-    """Compress multiple video files"""
-    compressed_files = []
+def compress_single_video(input_path, output_path, codec, progress, file_index, threads=None):
+    """Compress a single video file"""
+    settings = COMPRESSION_SETTINGS.get(codec, COMPRESSION_SETTINGS["libx264"])
+    
+    duration = get_video_duration(input_path)
+    if duration == 0:
+        duration = 1  # Prevent division by zero
+    
+    # Identical input + settings already encoded: reuse the result
+    key = compress_cache_key(input_path, output_path, codec)
+    if result_cache.lookup(key, output_path):
+        progress.set(file_index, flush=True, status="done", percent=100, cached=True)
+        return True
+    
+    # Skip work the source does not need (remux / audio copy / capped bitrate)
+    plan = plan_compression(input_path, codec)
+    progress.set(file_index, flush=True, status="processing", percent=0, path=plan)
+    
+    def on_percent(percent):
+        # Update task status (buffered, flushed periodically)
+        progress.set(file_index, percent=percent)
+    
+    # Long inputs are split at keyframes and encoded as parallel chunks
+    ok = False
+    chunk_parallel = (threads or os.cpu_count() or 1) // CHUNK_ENCODER_THREADS
+    if (plan["video"] == "encode" and duration >= CHUNKED_ENCODE_MIN_SECONDS
+            and chunk_parallel >= 2):
+        try:
+            ok = encode_chunked(input_path, output_path, codec, settings,
+                                duration, chunk_parallel, on_percent,
+                                copy_audio=plan["audio"] == "copy")
+        except Exception as e:
+            print(f"Chunked encode failed for {input_path}, falling back: {e}")
+    
+    if not ok:
+        cmd = build_compress_command(input_path, output_path, codec, threads, plan)
+        ok = run_with_progress(cmd, lambda t: on_percent(percent_of(t, duration))) == 0
+    
+    ok = ok and os.path.exists(output_path)
+    if ok:
+        result_cache.store(key, output_path)
+    progress.set(file_index, flush=True, status="done" if ok else "error", percent=100 if ok else 0)
+    return ok
+
+def build_target_command(input_path, output_path, codec, estimate, plan, threads=None,
+                         pass_number=None, passlog=None):
+    """ffmpeg command for a target-size encode (one pass, or one of two passes)"""
+    settings = COMPRESSION_SETTINGS.get(codec, COMPRESSION_SETTINGS["libx264"])
+    bitrate = estimate["video_bitrate"]
+    cmd = [FFMPEG, "-y", "-progress", "pipe:1", "-nostats", "-i", input_path,
+           "-c:v", codec, "-preset", settings["preset"]]
+    if estimate["mode"] == "crf":
+        # The CRF encode already fits: keep its quality, cap it at the budget
+        cmd += ["-crf", settings["crf"], "-maxrate", str(bitrate), "-bufsize", str(2 * bitrate)]
+    else:
+        cmd += ["-b:v", str(bitrate)]
+    if pass_number:
+        if codec == "libx265":
+            cmd += ["-x265-params", f"pass={pass_number}:stats={passlog}.log"]
+        else:
+            cmd += ["-pass", str(pass_number), "-passlogfile", passlog]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    if pass_number == 1:
+        return cmd + ["-an", "-f", "null", os.devnull]
+    if plan["audio"] == "copy":
+        cmd += ["-c:a", "copy"]
+    else:
+        cmd += ["-c:a", "aac", "-b:a", str(AUDIO_BITRATE)]
+    return cmd + [output_path]
+
+def estimate_compression(input_path, codec, target_bytes, two_pass=False, threads=None):
+    """(estimate, plan) for compressing input_path to target_bytes, without encoding it.
+
+    Used on its own by /estimate-size so a client can show the expected
+    size and time (and let the user confirm) before the full encode starts.
+    The result is kept in the result cache by content, so the confirmed
+    job does not sample-encode the same input again.
+    Raises TargetSizeError when the target cannot be reached.
+    """
+    key = result_cache.cache_key(
+        get_content_hash(input_path), op="estimate", codec=codec,
+        target_bytes=target_bytes, two_pass=two_pass,
+        preset=COMPRESSION_SETTINGS.get(codec, COMPRESSION_SETTINGS["libx264"])["preset"]
+    )
+    cached = result_cache.lookup_value(key)
+    if cached:
+        return cached["estimate"], cached["plan"]
+    
+    plan = plan_compression(input_path, codec)
+    audio_bitrate = AUDIO_BITRATE
+    if plan["audio"] == "copy":
+        audio_bitrate = stream_bitrate(get_media_index(input_path).audio_stream())
+    estimate = estimate_target_size(input_path, codec, target_bytes, get_video_duration(input_path),
+                                    audio_bitrate, two_pass, threads)
+    result_cache.store_value(key, {"estimate": estimate, "plan": plan})
+    return estimate, plan
+
+def compress_to_target_size(input_path, output_path, codec, target_bytes, two_pass,
+                            progress, file_index, threads=None):
+    """Compress a single video so it lands near target_bytes.
+
+    A few short windows are sample-encoded first, unless /estimate-size
+    already did for this content (see estimate_compression); the estimate
+    is also published in the file's progress entry.
+    """
+    duration = get_video_duration(input_path)
+    key = result_cache.cache_key(
+        get_content_hash(input_path), op="target_size", codec=codec,
+        target_bytes=target_bytes, two_pass=two_pass,
+        preset=COMPRESSION_SETTINGS.get(codec, COMPRESSION_SETTINGS["libx264"])["preset"],
+        ext=os.path.splitext(output_path)[1].lower()
+    )
+    if result_cache.lookup(key, output_path):
+        progress.set(file_index, flush=True, status="done", percent=100, cached=True)
+        return True
+    
+    progress.set(file_index, flush=True, status="estimating", percent=0)
+    try:
+        estimate, plan = estimate_compression(input_path, codec, target_bytes, two_pass, threads)
+    except (TargetSizeError, RuntimeError) as e:
+        progress.set(file_index, flush=True, status="error", percent=0, error=str(e))
+        return False
+    progress.set(file_index, flush=True, status="processing", percent=0, estimate=estimate)
+    
+    if estimate["mode"] == "two_pass":
+        # Pass logs live in a private work dir, not in the swept output folder
+        work_dir = tempfile.mkdtemp(prefix="passlog_")
+        passlog = os.path.join(work_dir, "passlog")
+        try:
+            first = build_target_command(input_path, output_path, codec, estimate, plan,
+                                         threads, 1, passlog)
+            ok = run_with_progress(
+                first, lambda t: progress.set(file_index, percent=percent_of(t, duration) // 2)) == 0
+            if ok:
+                second = build_target_command(input_path, output_path, codec, estimate, plan,
+                                              threads, 2, passlog)
+                ok = run_with_progress(
+                    second, lambda t: progress.set(file_index, percent=50 + percent_of(t, duration) // 2)) == 0
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    else:
+        cmd = build_target_command(input_path, output_path, codec, estimate, plan, threads)
+        ok = run_with_progress(cmd, lambda t: progress.set(file_index, percent=percent_of(t, duration))) == 0
+    
+    ok = ok and os.path.exists(output_path)
+    if ok:
+        result_cache.store(key, output_path)
+    progress.set(file_index, flush=True, status="done" if ok else "error", percent=100 if ok else 0,
+                 size=os.path.getsize(output_path) if ok else None)
+    return ok
+
+def rendition_filename(filename, rendition):
+    """compressed_<name>_<codec>_<height|src><ext>"""
+    stem, ext = os.path.splitext(filename)
+    return f"compressed_{stem}_{rendition['codec']}_{rendition.get('height') or 'src'}{ext}"
+
+def build_rendition_command(input_path, output_paths, renditions, threads=None):
+    """One decode fanned out through a split filter into one encoder per rendition"""
+    count = len(renditions)
+    graph = [f"[0:v:0]split={count}" + "".join(f"[s{i}]" for i in range(count))]
+    for i, rendition in enumerate(renditions):
+        if rendition.get("height"):
+            graph.append(f"[s{i}]scale=-2:{int(rendition['height'])}[v{i}]")
+        else:
+            graph.append(f"[s{i}]null[v{i}]")
+    
+    cmd = [FFMPEG, "-y", "-progress", "pipe:1", "-nostats",
+           "-i", input_path, "-filter_complex", ";".join(graph)]
+    for i, (rendition, output_path) in enumerate(zip(renditions, output_paths)):
+        settings = COMPRESSION_SETTINGS[rendition["codec"]]
+        cmd += [
+            "-map", f"[v{i}]", "-map", "0:a:0?",
+            "-c:v", rendition["codec"],
+            "-preset", settings["preset"],
+            "-crf", settings["crf"],
+        ]
+        if threads:
+            cmd += ["-threads", str(threads)]
+        cmd += ["-c:a", "aac", "-b:a", str(AUDIO_BITRATE), output_path]
+    return cmd
+
+def compress_renditions(input_path, output_dir, filename, renditions, progress, file_index, threads=None):
+    """Produce every rendition of one file from a single decode, returns the output names"""
+    duration = get_video_duration(input_path) or 1
+    names = [rendition_filename(filename, r) for r in renditions]
+    paths = [os.path.join(output_dir, name) for name in names]
+    keys = [
+        result_cache.cache_key(get_content_hash(input_path), op="rendition", codec=r["codec"],
+                               height=r.get("height"), crf=COMPRESSION_SETTINGS[r["codec"]]["crf"],
+                               preset=COMPRESSION_SETTINGS[r["codec"]]["preset"],
+                               ext=os.path.splitext(filename)[1].lower())
+        for r in renditions
+    ]
+    
+    def entries(status, percent):
+        return [dict(r, file=name, status=status, percent=percent)
+                for r, name in zip(renditions, names)]
+    
+    # Link outputs only when every rendition is cached: a partial hit is
+    # re-encoded as a whole, and must not write through links into the cache
+    if (all(result_cache.contains(key) for key in keys)
+            and all(result_cache.lookup(key, path) for key, path in zip(keys, paths))):
+        progress.set(file_index, flush=True, status="done", percent=100, cached=True,
+                     renditions=entries("done", 100))
+        return names
+    
+    progress.set(file_index, flush=True, status="processing", percent=0,
+                 renditions=entries("processing", 0))
+    
+    # All renditions share one decode, so they advance together
+    def on_time(t):
+        percent = percent_of(t, duration)
+        progress.set(file_index, percent=percent, renditions=entries("processing", percent))
+    
+    # Encode into fresh files and move them into place, so an output path that
+    # is still a hard link to a cache entry is replaced, never truncated
+    tmp_paths = [os.path.join(output_dir, f".tmp_{uuid.uuid4().hex[:8]}_{name}") for name in names]
+    # The renditions' encoders run side by side in one process: split the budget
+    threads = max(1, (threads or os.cpu_count() or 1) // len(renditions))
+    try:
+        code = run_with_progress(build_rendition_command(input_path, tmp_paths, renditions, threads),
+                                 on_time)
+        done = []
+        for name, path, tmp_path, key in zip(names, paths, tmp_paths, keys):
+            if code == 0 and os.path.exists(tmp_path):
+                os.replace(tmp_path, path)
+                result_cache.store(key, path)
+                done.append(name)
+    finally:
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    ok = len(done) == len(names)
+    progress.set(file_index, flush=True, status="done" if ok else "error", percent=100 if ok else 0,
+                 renditions=[dict(r, file=name, status="done" if name in done else "error",
+                                  percent=100 if name in done else 0)
+                             for r, name in zip(renditions, names)])
+    return done
+
+def compress_video_files(task_id, filenames, codec, input_dir, output_dir, parallel=BATCH_PARALLELISM,
+                         renditions=None, target_bytes=None, two_pass=False):
+    """Compress multiple video files, up to `parallel` at a time.
+
+    With renditions (a list of {"codec", "height"}), every file is decoded
+    once and encoded to each rendition in the same ffmpeg run. With
+    target_bytes, each file is encoded at a bitrate estimated to land there.
+    """
     total = len(filenames)
+    parallel = max(1, min(parallel, total))
+    progress = BatchProgress(task_id, filenames)
     
-    # Set initial status
-    if task_id in TASKS:
-        TASKS[task_id].update({
-            "status": "processing",
-            "current": 0,
-            "total": total,
-            "file": "",
-            "percent": 0
-        })
-    
-    for idx, filename in enumerate(filenames, start=1):
+    def compress_one(idx, filename):
         input_path = os.path.join(input_dir, filename)
         output_filename = f"compressed_{filename}"
         output_path = os.path.join(output_dir, output_filename)
         
         # Check if input file exists
         if not os.path.exists(input_path):
-            continue
+            progress.set(idx, flush=True, status="error")
+            return []
+        
+        try:
+            if renditions:
+                return compress_renditions(input_path, output_dir, filename, renditions,
+                                           progress, idx, threads)
+            if target_bytes:
+                compress_to_target_size(input_path, output_path, codec, target_bytes,
+                                        two_pass, progress, idx, threads)
+            else:
+                compress_single_video(input_path, output_path, codec, progress, idx, threads)
+        finally:
+            # Delete input file immediately after compression (FIX 3)
+            try:
+                os.remove(input_path)
+            except Exception as e:
+                print(f"Error deleting {input_path}: {e}")
         
-        # Compress the video
-        compress_single_video(input_path, output_path, codec, task_id, idx, total, filename)
+        return [output_filename] if os.path.exists(output_path) else []
+    
+    try:
+        # The job may have waited in the queue: use the presets current now
+        preset_tuner.refresh()
+        threads = ffmpeg_thread_budget(parallel)
+        
+        # Set initial status
+        tasks.update(
+            task_id,
+            status="processing",
+            current=0,
+            total=total,
+            progress=progress.entries
+        )
         
-        # Add to compressed files list
-        if os.path.exists(output_path):
-            compressed_files.append(output_filename)
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            results = list(pool.map(compress_one, range(total), filenames))
         
+        # Mark task as done (keeps upload order)
+        compressed_files = [name for names in results for name in names]
+        tasks.update(
+            task_id,
+            status="done",
+            files=compressed_files,
+            current=total
+        )
+    except Exception as e:
+        print("COMPRESSION ERROR:", e)
+        tasks.update(task_id, status="error", error=str(e))
+        # Inputs the batch never reached are not deleted by compress_one
+        for filename in filenames:
+            try:
+                os.remove(os.path.join(input_dir, filename))
+            except OSError:
+                pass
+
+
+
+# Video Slider
+def split_video(input_path, output_path, start, end, mode=SPLIT_DEFAULT_MODE):
+    """Cut [start, end) out of input_path with one of SPLIT_MODES"""
+    split = SPLIT_MODES.get(mode, SPLIT_MODES[SPLIT_DEFAULT_MODE])
+
+    key = result_cache.cache_key(
+        get_content_hash(input_path), op="split", start=float(start), end=float(end),
+        mode=mode, ext=os.path.splitext(output_path)[1].lower()
+    )
+    try:
+        if not result_cache.lookup(key, output_path):
+            split(input_path, output_path, float(start), float(end))
+            result_cache.store(key, output_path)
+    finally:
         # Delete input file immediately after compression (FIX 3)
         try:
             os.remove(input_path)
         except Exception as e:
             print(f"Error deleting {input_path}: {e}")
-    
-    # Mark task as done
-    if task_id in TASKS:
-        TASKS[task_id].update({
-            "status": "done",
-            "files": compressed_files,
-            "percent": 100,
-            "file": "",
-            "current": total
-        })
 
 
+MULTI_SPLIT_MODES = ("copy", "accurate")
 
-# Video Slider
-def split_video(input_path, output_path, start, end):
-    duration = float(end) - float(start)
+def split_video_ranges(task_id, input_path, ranges, output_dir, mode="copy"):
+    """Cut several [start, end) ranges in one ffmpeg run (the input is read once).
 
-    command = [
-        "ffmpeg",
-        "-i", input_path,
-        "-ss", str(start),
-        "-t", str(duration),
-        "-c", "copy",
-        output_path
-    ]
+    "copy" stream-copies every clip; "accurate" decodes once and re-encodes
+    each clip. Progress and the resulting clip names go to the task record.
+    """
+    input_name = os.path.basename(input_path)
+    stem, ext = os.path.splitext(input_name)
+    outputs = [f"split_{stem}_{idx:02d}{ext}" for idx in range(1, len(ranges) + 1)]
+    last_end = max(end for _, end in ranges)
+
+    cmd = [FFMPEG, "-y", "-progress", "pipe:1", "-nostats", "-i", input_path]
+    for (start, end), output in zip(ranges, outputs):
+        cmd += ["-map", "0:v:0?", "-map", "0:a:0?", "-ss", str(start), "-to", str(end)]
+        if mode == "accurate":
+            cmd += ["-c:v", "libx264", "-preset", SPLIT_REENCODE_PRESET, "-crf", SPLIT_REENCODE_CRF,
+                    "-c:a", "aac", "-b:a", str(AUDIO_BITRATE)]
+        else:
+            cmd += ["-c", "copy", "-avoid_negative_ts", "make_zero"]
+        cmd.append(os.path.join(output_dir, output))
 
-    subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    
-    # Delete input file immediately after compression (FIX 3)
     try:
-        os.remove(input_path)
+        tasks.update(task_id, status="processing", percent=0)
+        code = run_with_progress(
+            cmd, lambda t: tasks.update_progress(task_id, percent=percent_of(t, last_end))
+        )
+        files = [name for name in outputs if os.path.exists(os.path.join(output_dir, name))]
+        if code == 0 and files:
+            tasks.update(task_id, status="done", percent=100, files=files)
+        else:
+            tasks.update(task_id, status="error", error="Failed to split video", files=files)
     except Exception as e:
-        print(f"Error deleting {input_path}: {e}")
-
+        print("SPLIT ERROR:", e)
+        tasks.update(task_id, status="error", error=str(e))
+    finally:
+        try:
+            os.remove(input_path)
+        except Exception as e:
+            print(f"Error deleting {input_path}: {e}")
@@ -0,0 +1,81 @@
+# services/mask_tracker.py
+
+import cv2
+import numpy as np
+import mediapipe as mp
+
+# Side of the grayscale thumbnail compared between frames to detect scene cuts
+_THUMB_SIZE = (64, 36)
+
+
+class MaskTracker:
+    """Per-frame person confidence masks with optional shortcuts.
+
+    inference_width: run the segmenter on a frame downscaled to this width
+        (the selfie model works at 256x256 anyway) and upsample the mask;
+        None segments the full-resolution frame.
+    every: run inference on every Nth frame only and reuse the latest mask
+        in between.
+    smoothing: weight of the previous mask in an exponential moving average
+        over inferred masks (0 disables), which damps edge flicker.
+    scene_cut: mean absolute thumbnail difference (0-1) above which a frame
+        is treated as a new shot: inference runs immediately and the
+        smoothing history is dropped. None disables detection.
+
+    The defaults reproduce the exact per-frame, full-resolution behaviour.
+    """
+
+    def __init__(self, segmenter, inference_width=None, every=1, smoothing=0.0, scene_cut=None):
+        self.segmenter = segmenter
+        self.inference_width = inference_width
+        self.every = max(1, int(every))
+        self.smoothing = smoothing
+        self.scene_cut = scene_cut
+        self.inferences = 0
+        self.scene_cuts = 0
+        self._index = 0
+        self._mask = None       # latest (smoothed) mask at inference resolution
+        self._upsampled = None  # that mask at frame resolution
+        self._thumb = None      # thumbnail of the last inferred frame
+
+    def _infer(self, frame):
+        height, width = frame.shape[:2]
+        if self.inference_width and width > self.inference_width:
+            small_height = max(1, round(height * self.inference_width / width))
+            frame = cv2.resize(frame, (self.inference_width, small_height), interpolation=cv2.INTER_AREA)
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        result = self.segmenter.segment(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb))
+        # numpy_view() is only valid while result lives, so copy it out
+        return np.array(result.confidence_masks[0].numpy_view(), dtype=np.float32)
+
+    def _is_scene_cut(self, thumb):
+        if self._thumb is None:
+            return True
+        return float(np.mean(cv2.absdiff(thumb, self._thumb))) / 255 > self.scene_cut
+
+    def __call__(self, frame):
+        """Confidence mask (float32, 0-1) at the frame's resolution"""
+        thumb = None
+        due = self._mask is None or self._index % self.every == 0
+        if self.scene_cut is not None:
+            thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), _THUMB_SIZE,
+                               interpolation=cv2.INTER_AREA)
+            if not due and self._is_scene_cut(thumb):
+                due = True
+                self.scene_cuts += 1
+                self._mask = None  # do not blend across a cut
+        self._index += 1
+
+        if due:
+            mask = self._infer(frame)
+            self.inferences += 1
+            if self.smoothing and self._mask is not None and self._mask.shape == mask.shape:
+                cv2.addWeighted(self._mask, self.smoothing, mask, 1 - self.smoothing, 0, dst=mask)
+            self._mask = mask
+            self._thumb = thumb
+            height, width = frame.shape[:2]
+            if mask.shape[:2] != (height, width):
+                self._upsampled = cv2.resize(mask, (width, height), interpolation=cv2.INTER_LINEAR)
+            else:
+                self._upsampled = mask
+        return self._upsampled
@@ -0,0 +1,235 @@
+# services/media_index.py
+
+import os
+import json
+import mmap
+import uuid
+import array
+import bisect
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+from config import FFPROBE, MEDIA_INDEX_DIR, MEDIA_INDEX_MAX_MB
+from utils.file_utils import known_content_hash, evict_lru
+
+_OPEN_INDEX_LIMIT = 64
+_open_indexes = OrderedDict()  # key -> MediaIndex (per process)
+_open_lock = threading.Lock()
+_build_locks = {}
+
+
+class MediaIndex:
+    """Probed layout of one media file: streams, duration and video keyframes.
+
+    Streams and duration come from a cheap format/stream probe. Keyframes
+    need a scan of every packet, so they are only probed the first time a
+    caller asks for them (split), then kept in the on-disk .kf file whose
+    times (float64 seconds) and byte offsets (int64) are memory-mapped.
+    """
+
+    def __init__(self, key, meta, kf_path, path):
+        self.key = key
+        self.path = path  # latest path seen with this content, probed for keyframes
+        self.format = meta["format"]
+        self.streams = meta["streams"]
+        self.duration = meta["duration"]
+        self._kf_path = kf_path
+        self._kf_lock = threading.Lock()
+        self._map = None
+        self._times = None
+        self._offsets = None
+
+    def video_stream(self):
+        return next((s for s in self.streams if s.get("codec_type") == "video"), None)
+
+    def audio_stream(self):
+        return next((s for s in self.streams if s.get("codec_type") == "audio"), None)
+
+    def _keyframes(self):
+        """(times, offsets) memoryviews, probing the keyframes on first use"""
+        with self._kf_lock:
+            if self._times is None:
+                if not os.path.exists(self._kf_path):
+                    _build_keyframes(self.path, self._kf_path)
+                self._times = memoryview(b"").cast("d")
+                self._offsets = memoryview(b"").cast("q")
+                count = os.path.getsize(self._kf_path) // 16
+                if count:
+                    with open(self._kf_path, "rb") as f:
+                        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    view = memoryview(self._map)
+                    self._times = view[:count * 8].cast("d")
+                    self._offsets = view[count * 8:count * 16].cast("q")
+            return self._times, self._offsets
+
+    @property
+    def keyframe_times(self):
+        return self._keyframes()[0]
+
+    @property
+    def keyframe_offsets(self):
+        return self._keyframes()[1]
+
+    def keyframes_between(self, start, end):
+        times = self.keyframe_times
+        lo = bisect.bisect_left(times, start)
+        hi = bisect.bisect_right(times, end)
+        return list(times[lo:hi])
+
+    def keyframe_before(self, t):
+        """(time, byte offset) of the last keyframe at or before t, or None"""
+        times, offsets = self._keyframes()
+        idx = bisect.bisect_right(times, t) - 1
+        if idx < 0:
+            return None
+        return times[idx], offsets[idx]
+
+
+def index_key(path):
+    """Content hash when known, else a cheap path/size/mtime fingerprint"""
+    digest = known_content_hash(path)
+    if digest:
+        return digest
+    st = os.stat(path)
+    fingerprint = f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+    return "f" + hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def _parse_compact(line):
+    section, _, rest = line.partition("|")
+    fields = {}
+    for item in rest.split("|"):
+        name, sep, value = item.partition("=")
+        if sep:
+            fields[name] = value
+    return section, fields
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _run_probe(path, *args, data=None):
+    # data is fed on stdin (path "pipe:0")
+    probe = subprocess.run([FFPROBE, "-v", "error", *args, "-of", "compact", path],
+                           input=data, capture_output=True)
+    if probe.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {path}")
+    return [_parse_compact(line) for line in probe.stdout.decode(errors="replace").splitlines()]
+
+
+def _probe(path, data=None):
+    """Format and stream headers only (does not read the packets)"""
+    fmt, streams = {}, []
+    for section, fields in _run_probe(path, "-show_format", "-show_streams", data=data):
+        if section == "stream":
+            streams.append(fields)
+        elif section == "format":
+            fmt = fields
+
+    for stream in streams:
+        for name in ("index", "width", "height", "channels", "sample_rate"):
+            if name in stream:
+                stream[name] = _number(stream[name], int)
+        for name in ("bit_rate", "duration"):
+            if name in stream:
+                stream[name] = _number(stream[name])
+
+    return {
+        "format": fmt,
+        "streams": streams,
+        "duration": _number(fmt.get("duration")) or 0,
+    }
+
+
+def probe_head(data):
+    """Format and streams probed from the first bytes of a file (an upload
+    that is still arriving). Fields stored at the end of the container,
+    such as a total duration or bitrate, may be missing."""
+    return _probe("pipe:0", data)
+
+
+def _probe_keyframes(path):
+    """Sorted (time, byte offset) of every keyframe of the first video stream.
+
+    Reads every packet header of the file, so it only runs for callers that
+    need keyframes.
+    """
+    keyframes = []
+    for section, fields in _run_probe(path, "-select_streams", "v:0",
+                                      "-show_entries", "packet=pts_time,pos,flags"):
+        if section == "packet" and "K" in fields.get("flags", ""):
+            t = _number(fields.get("pts_time"))
+            pos = _number(fields.get("pos"), int)
+            if t is not None:
+                keyframes.append((t, pos if pos is not None else -1))
+    keyframes.sort()
+    return keyframes
+
+
+def _build_keyframes(path, kf_path):
+    keyframes = _probe_keyframes(path)
+    os.makedirs(MEDIA_INDEX_DIR, exist_ok=True)
+    tmp = f"{kf_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "wb") as f:
+        array.array("d", (t for t, _ in keyframes)).tofile(f)
+        array.array("q", (pos for _, pos in keyframes)).tofile(f)
+    os.replace(tmp, kf_path)
+
+
+def _build(key, path):
+    meta = _probe(path)
+    os.makedirs(MEDIA_INDEX_DIR, exist_ok=True)
+    meta_path = os.path.join(MEDIA_INDEX_DIR, f"{key}.json")
+    tmp = f"{meta_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+def _load(key, meta_path, kf_path, path):
+    with open(meta_path) as f:
+        index = MediaIndex(key, json.load(f), kf_path, path)
+    # Touch both files for LRU eviction (the .kf exists once keyframes were asked for)
+    os.utime(meta_path)
+    if os.path.exists(kf_path):
+        os.utime(kf_path)
+    return index
+
+
+def get_media_index(path):
+    """MediaIndex for path, probing only the first time its content is seen"""
+    key = index_key(path)
+    with _open_lock:
+        index = _open_indexes.get(key)
+        if index:
+            _open_indexes.move_to_end(key)
+            index.path = path
+            return index
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+
+    meta_path = os.path.join(MEDIA_INDEX_DIR, f"{key}.json")
+    kf_path = os.path.join(MEDIA_INDEX_DIR, f"{key}.kf")
+    with build_lock:
+        try:
+            index = _load(key, meta_path, kf_path, path)
+        except (OSError, ValueError, KeyError):
+            # Missing, evicted or unreadable: probe again
+            _build(key, path)
+            index = _load(key, meta_path, kf_path, path)
+
+    with _open_lock:
+        _build_locks.pop(key, None)
+        _open_indexes[key] = index
+        while len(_open_indexes) > _OPEN_INDEX_LIMIT:
+            _open_indexes.popitem(last=False)
+    return index
+
+
+def evict(max_bytes=MEDIA_INDEX_MAX_MB * 1024 * 1024):
+    """Keep the on-disk index within its size budget (LRU)"""
+    return evict_lru(MEDIA_INDEX_DIR, max_bytes)
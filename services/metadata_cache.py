@@ -0,0 +1,211 @@
+# services/metadata_cache.py
+
+import os
+import copy
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from config import (METADATA_CACHE_TTL_SECONDS, METADATA_CACHE_SIZE, METADATA_CACHE_PERSIST,
+                    METADATA_CACHE_DIR, METADATA_CACHE_MAX_MB)
+from utils.file_utils import evict_lru
+
+# Click trackers that never change what a URL points to, on any site (plus utm_*)
+_TRACKING_PARAMS = {"fbclid", "gclid"}
+_YOUTUBE_HOSTS = {"youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com"}
+# Share/referral parameters known to be ignored by these sites only; elsewhere
+# a parameter like "ref" may select different content
+_HOST_TRACKING_PARAMS = {
+    **{host: {"si", "feature", "pp"} for host in _YOUTUBE_HOSTS | {"youtu.be"}},
+    "instagram.com": {"igshid", "igsh"},
+    "twitter.com": {"ref_src", "ref_url", "s"},
+    "x.com": {"ref_src", "ref_url", "s"},
+    "tiktok.com": {"is_from_webapp", "sender_device", "_r", "_t"},
+    "vimeo.com": {"share"},
+}
+
+
+def normalize_url(url):
+    """Cache key for url: the same video under different spellings maps to one key.
+
+    Scheme and host are lowercased, "www." is dropped, tracking parameters
+    (site-specific ones only on their site) and the fragment are removed and
+    the remaining query is sorted. YouTube watch/short/embed/youtu.be links
+    become https://youtube.com/watch?v=ID.
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    if scheme == "http":
+        scheme = "https"
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    ignored = _TRACKING_PARAMS | _HOST_TRACKING_PARAMS.get(host, set())
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k not in ignored and not k.startswith("utm_")]
+
+    video_id = None
+    if host == "youtu.be":
+        video_id = path.lstrip("/").split("/")[0]
+    elif host in _YOUTUBE_HOSTS:
+        if path == "/watch":
+            video_id = dict(query).get("v")
+        elif path.startswith(("/shorts/", "/embed/", "/live/", "/v/")):
+            video_id = path.split("/")[2]
+    if video_id:
+        return f"https://youtube.com/watch?v={video_id}"
+
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+
+class MetadataCache:
+    """Per-process LRU of extracted video metadata with a TTL.
+
+    Concurrent lookups of one key share a single extraction (singleflight):
+    the first caller runs it, the others wait for its result or error.
+    Errors are never cached. Every caller gets its own copy of the info, so
+    callers may modify it freely. With persist, entries are also written to
+    `directory` as JSON so other worker processes and restarts reuse them
+    until they expire.
+    """
+
+    def __init__(self, ttl=METADATA_CACHE_TTL_SECONDS, size=METADATA_CACHE_SIZE,
+                 persist=METADATA_CACHE_PERSIST, directory=METADATA_CACHE_DIR):
+        self.ttl = ttl
+        self.size = max(1, size)
+        self.persist = persist
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored at, info)
+        self._inflight = {}  # key -> Future of the running extraction
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0,
+                       "errors": 0, "expired": 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def _remember(self, key, stored, info):
+        # Caller holds self._lock
+        self._entries[key] = (stored, info)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def _load(self, key):
+        """(stored at, info) from disk if persisted and still fresh"""
+        if not self.persist:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != key or time.time() - entry.get("stored", 0) > self.ttl:
+            return None
+        return entry["stored"], entry["info"]
+
+    def _save(self, key, stored, info):
+        if not self.persist:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump({"url": key, "stored": stored, "info": info}, f)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Metadata cache write failed for {key}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def get(self, url, extract):
+        """Metadata for url, calling extract(url) only on a miss"""
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.time() - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return copy.deepcopy(entry[1])
+                del self._entries[key]
+                self._stats["expired"] += 1
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            entry = self._load(key)
+            if entry is not None:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+            else:
+                with self._lock:
+                    self._stats["misses"] += 1
+                entry = (time.time(), copy.deepcopy(extract(url)))
+                self._save(key, *entry)
+            with self._lock:
+                self._remember(key, *entry)
+            future.set_result(entry[1])
+            return copy.deepcopy(entry[1])
+        except BaseException as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def invalidate(self, url):
+        key = normalize_url(url)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.persist:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["inflight"] = len(self._inflight)
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_ratio"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else None
+        stats.update(ttl_seconds=self.ttl, size=self.size, persist=self.persist, pid=os.getpid())
+        return stats
+
+    def evict(self, max_bytes=METADATA_CACHE_MAX_MB * 1024 * 1024):
+        """Delete expired persisted entries, then keep the rest within max_bytes (LRU)"""
+        if not self.persist or not os.path.isdir(self.directory):
+            return 0
+        removed = 0
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed + evict_lru(self.directory, max_bytes)
+
+
+metadata_cache = MetadataCache()
@@ -0,0 +1,223 @@
+# services/preset_tuner.py
+
+import os
+import json
+import time
+import uuid
+import fcntl
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from config import (FFMPEG, COMPRESSION_SETTINGS, PRESET_TUNING_PATH, AUTOTUNE_PRESETS,
+                    AUTOTUNE_MIN_SPEED, AUTOTUNE_CONCURRENCY, AUTOTUNE_CLIP_SECONDS,
+                    AUTOTUNE_CLIP_SIZE, CPU_SHARE)
+from services.task_store import tasks
+from workers.job_scheduler import scheduler, QueueFullError
+
+# x264/x265 presets, fastest first
+ENCODER_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast",
+                   "medium", "slow", "slower", "veryslow"]
+
+# Presets as shipped in config.py, restored when an override is cleared without a tuned choice
+DEFAULT_PRESETS = {codec: settings["preset"] for codec, settings in COMPRESSION_SETTINGS.items()}
+
+_state_lock = threading.Lock()
+_loaded_version = None  # (inode, mtime) of the tuning file last applied here
+_tuning = threading.Event()  # set while this process has a tune queued or running
+
+
+def benchmark_preset(codec, preset, concurrency=AUTOTUNE_CONCURRENCY,
+                     seconds=AUTOTUNE_CLIP_SECONDS, size=AUTOTUNE_CLIP_SIZE):
+    """Encode speed (x realtime) of codec/preset with `concurrency` encodes running at once.
+
+    Each encoder gets the thread budget a compression batch would get now
+    (this process's CPU share over the active scheduler jobs), so the result
+    reflects the current load; the slowest of the concurrent runs is reported.
+    """
+    threads = max(1, CPU_SHARE // (scheduler.active_jobs() * max(1, concurrency)))
+    cmd = [
+        FFMPEG, "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={seconds}",
+        "-c:v", codec,
+        "-preset", preset,
+        "-crf", COMPRESSION_SETTINGS[codec]["crf"],
+        "-threads", str(threads),
+        "-f", "null", os.devnull,
+    ]
+
+    def run_once(_):
+        started = time.monotonic()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        return seconds / (time.monotonic() - started)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return min(pool.map(run_once, range(concurrency)))
+
+
+def tune_codec(codec, min_speed=AUTOTUNE_MIN_SPEED, concurrency=AUTOTUNE_CONCURRENCY):
+    """Slowest preset in AUTOTUNE_PRESETS that still encodes at >= min_speed.
+
+    Speed falls monotonically through the list, so the presets are binary
+    searched. Falls back to the fastest preset when none is fast enough.
+    """
+    measured = {}
+    lo, hi = 0, len(AUTOTUNE_PRESETS) - 1
+    best = 0
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        preset = AUTOTUNE_PRESETS[mid]
+        measured[preset] = round(benchmark_preset(codec, preset, concurrency), 2)
+        if measured[preset] >= min_speed:
+            best = mid
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    preset = AUTOTUNE_PRESETS[best]
+    return {
+        "preset": preset,
+        "speed": measured.get(preset),
+        "measured": measured,
+        "min_speed": min_speed,
+        "concurrency": concurrency,
+        "tuned_at": time.time(),
+    }
+
+
+def _read_state():
+    try:
+        with open(PRESET_TUNING_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(state):
+    os.makedirs(os.path.dirname(PRESET_TUNING_PATH), exist_ok=True)
+    tmp = f"{PRESET_TUNING_PATH}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, PRESET_TUNING_PATH)
+
+
+def _apply(state):
+    """Point COMPRESSION_SETTINGS at the override, else the tuned, else the default preset"""
+    for codec, settings in COMPRESSION_SETTINGS.items():
+        entry = state.get(codec, {})
+        settings["preset"] = (entry.get("override") or (entry.get("auto") or {}).get("preset")
+                              or DEFAULT_PRESETS[codec])
+
+
+def _file_version():
+    # The file is always replaced, so a new inode marks every write
+    st = os.stat(PRESET_TUNING_PATH)
+    return st.st_ino, st.st_mtime_ns
+
+
+def refresh():
+    """Re-apply the shared tuning file when another worker process changed it.
+
+    Costs one stat(); called before every request and every compression job
+    so an override or autotune in one worker reaches all of them.
+    """
+    global _loaded_version
+    try:
+        version = _file_version()
+    except OSError:
+        return
+    with _state_lock:
+        if version != _loaded_version:
+            _loaded_version = version
+            _apply(_read_state())
+
+
+def _update_state(change):
+    global _loaded_version
+    with _state_lock:
+        state = _read_state()
+        change(state)
+        _write_state(state)
+        _loaded_version = _file_version()
+        _apply(state)
+        return state
+
+
+def tuning_state():
+    """Current preset per codec, where it came from and the last benchmark"""
+    refresh()
+    state = _read_state()
+    result = {}
+    for codec, settings in COMPRESSION_SETTINGS.items():
+        entry = state.get(codec, {})
+        source = "override" if entry.get("override") else "auto" if entry.get("auto") else "default"
+        result[codec] = {
+            "preset": settings["preset"],
+            "source": source,
+            "override": entry.get("override"),
+            "auto": entry.get("auto"),
+        }
+    return {"codecs": result, "tuning": _tuning.is_set(), "presets": AUTOTUNE_PRESETS}
+
+
+def set_override(codec, preset):
+    """Pin codec to preset (None clears the override)"""
+    if codec not in COMPRESSION_SETTINGS:
+        raise ValueError(f"Unknown codec: {codec}")
+    if preset is not None and preset not in ENCODER_PRESETS:
+        raise ValueError(f"Unknown preset: {preset}")
+
+    def change(state):
+        state.setdefault(codec, {})["override"] = preset
+    _update_state(change)
+
+
+def autotune(codecs=None, min_speed=AUTOTUNE_MIN_SPEED, concurrency=AUTOTUNE_CONCURRENCY):
+    """Benchmark and store the preset choice for each codec (one host-wide run at a time)"""
+    os.makedirs(os.path.dirname(PRESET_TUNING_PATH), exist_ok=True)
+    with open(PRESET_TUNING_PATH + ".lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False  # another worker process is already benchmarking
+        for codec in codecs or list(COMPRESSION_SETTINGS):
+            try:
+                result = tune_codec(codec, min_speed, concurrency)
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"Preset autotune failed for {codec}: {e}")
+                continue
+            print(f"Autotuned {codec}: preset={result['preset']} ({result['speed']}x realtime)")
+            _update_state(lambda state: state.setdefault(codec, {}).update(auto=result))
+    return True
+
+
+def _autotune_task(task_id, **kwargs):
+    """Scheduler job: autotune() with its outcome in the task record"""
+    tasks.update(task_id, status="processing")
+    try:
+        if autotune(**kwargs):
+            tasks.update(task_id, status="done")
+        else:
+            tasks.update(task_id, status="error", error="Autotune already running")
+    except Exception as e:
+        print("AUTOTUNE ERROR:", e)
+        tasks.update(task_id, status="error", error=str(e))
+    finally:
+        _tuning.clear()
+
+
+def start_autotune(**kwargs):
+    """Queue autotune() on the job scheduler, so the benchmark takes a worker
+    slot like any other encode. Returns its task id, or None when a tune is
+    already queued or running here; raises QueueFullError."""
+    with _state_lock:
+        if _tuning.is_set():
+            return None
+        _tuning.set()
+    task_id = str(uuid.uuid4())
+    tasks.create(task_id, {"status": "queued"})
+    try:
+        scheduler.submit(task_id, _autotune_task, task_id, **kwargs)
+    except QueueFullError:
+        tasks.delete(task_id)
+        _tuning.clear()
+        raise
+    return task_id
@@ -0,0 +1,98 @@
+# services/result_cache.py
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+from config import RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB
+from utils.file_utils import evict_lru
+
+
+def cache_key(content_hash, **params):
+    """Key for an operation on an input: content hash + operation parameters"""
+    payload = json.dumps(params, sort_keys=True)
+    return hashlib.sha256(f"{content_hash}:{payload}".encode()).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(RESULT_CACHE_DIR, key)
+
+
+def _link_or_copy(src, dst):
+    # Hard links make hits free and keep the cache entry alive when the
+    # cleanup worker deletes the output copy
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def contains(key):
+    """True if key is cached, without materializing anything"""
+    return os.path.exists(_entry_path(key))
+
+
+def lookup(key, output_path):
+    """Materialize a cached result at output_path, returns True on a hit"""
+    entry = _entry_path(key)
+    if not os.path.exists(entry):
+        return False
+    try:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        _link_or_copy(entry, output_path)
+        os.utime(entry)  # mtime doubles as LRU recency
+        return True
+    except OSError as e:
+        print(f"Result cache read failed for {key}: {e}")
+        return False
+
+
+def store(key, output_path):
+    """Add a finished output to the cache"""
+    if not os.path.exists(output_path):
+        return
+    os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+    tmp_path = _entry_path(f".{key}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        _link_or_copy(output_path, tmp_path)
+        os.replace(tmp_path, _entry_path(key))
+        os.utime(_entry_path(key))
+    except OSError as e:
+        print(f"Result cache write failed for {key}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    evict()
+
+
+def lookup_value(key):
+    """JSON value cached with store_value, or None"""
+    entry = _entry_path(key)
+    try:
+        with open(entry) as f:
+            value = json.load(f)
+        os.utime(entry)
+        return value
+    except (OSError, ValueError):
+        return None
+
+
+def store_value(key, value):
+    """Cache a small JSON-serializable result (e.g. an estimate) under key"""
+    os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+    tmp_path = _entry_path(f".{key}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, _entry_path(key))
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Result cache write failed for {key}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def evict(max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024):
+    """Delete least recently used entries until the cache fits in max_bytes"""
+    return evict_lru(RESULT_CACHE_DIR, max_bytes)
@@ -0,0 +1,144 @@
+# services/segmentation_models.py
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from mediapipe.tasks.python.vision import ImageSegmenter
+from mediapipe.tasks.python import BaseOptions
+from mediapipe.tasks.python.vision import RunningMode
+from config import SEGMENTER_MODEL_PATH, SEGMENTER_POOL_SIZE
+
+
+class ModelUnavailableError(Exception):
+    """The bundled segmentation model is missing or unreadable"""
+
+
+class SegmenterPool:
+    """Warm ImageSegmenter instances shared by every request in this process.
+
+    The model file is read once from a fixed local path (never downloaded);
+    segmenters are created lazily up to `size` and handed out one caller at a
+    time, since a segmenter is not safe to use from two threads at once.
+    """
+
+    def __init__(self, model_path=SEGMENTER_MODEL_PATH, size=SEGMENTER_POOL_SIZE):
+        self.model_path = model_path
+        self.size = max(1, size)
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._model = None
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+        self._stats = {"model_load_seconds": None, "segmenter_init_seconds": [],
+                       "acquires": 0, "waits": 0, "wait_seconds": 0.0}
+
+    def _load_model(self):
+        started = time.perf_counter()
+        try:
+            with open(self.model_path, "rb") as f:
+                self._model = f.read()
+        except OSError as e:
+            raise ModelUnavailableError(f"Segmentation model not found at {self.model_path}: {e}")
+        self._stats["model_load_seconds"] = round(time.perf_counter() - started, 4)
+
+    def _create(self):
+        started = time.perf_counter()
+        options = ImageSegmenter.ImageSegmenterOptions(
+            base_options=BaseOptions(model_asset_buffer=self._model),
+            running_mode=RunningMode.IMAGE
+        )
+        segmenter = ImageSegmenter.create_from_options(options)
+        self._stats["segmenter_init_seconds"].append(round(time.perf_counter() - started, 4))
+        return segmenter
+
+    @contextmanager
+    def acquire(self):
+        """Borrow a warm segmenter, waiting for one when all are busy"""
+        with self._cond:
+            if self._pid != os.getpid():
+                # Forked worker: instances from the parent are not usable here
+                self._reset()
+            if self._model is None:
+                self._load_model()
+            self._stats["acquires"] += 1
+            create = False
+            if not self._idle and self._created >= self.size:
+                self._stats["waits"] += 1
+                started = time.perf_counter()
+                self._cond.wait_for(lambda: self._idle)
+                self._stats["wait_seconds"] += time.perf_counter() - started
+            if self._idle:
+                segmenter = self._idle.pop()
+            else:
+                self._created += 1
+                create = True
+            self._in_use += 1
+
+        if create:
+            try:
+                segmenter = self._create()
+            except BaseException:
+                with self._cond:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+        try:
+            yield segmenter
+        finally:
+            with self._cond:
+                self._in_use -= 1
+                self._idle.append(segmenter)
+                self._cond.notify()
+
+    def warm(self, count=1):
+        """Create up to `count` segmenters ahead of the first request"""
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._model is None:
+                self._load_model()
+            missing = max(0, min(count, self.size) - self._created)
+            self._created += missing
+        for _ in range(missing):
+            try:
+                segmenter = self._create()
+            except BaseException:
+                with self._cond:
+                    self._created -= 1
+                raise
+            with self._cond:
+                self._idle.append(segmenter)
+                self._cond.notify()
+
+    def warm_in_background(self, count=1):
+        """warm() in a daemon thread; a missing model is only logged"""
+        def run():
+            try:
+                self.warm(count)
+            except Exception as e:
+                print(f"Segmenter warm-up skipped: {e}")
+        threading.Thread(target=run, name="segmenter-warm", daemon=True).start()
+
+    def metrics(self):
+        with self._cond:
+            return {
+                "model_path": self.model_path,
+                "model_loaded": self._model is not None,
+                "model_bytes": len(self._model) if self._model else 0,
+                "pool_size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self._stats,
+                "wait_seconds": round(self._stats["wait_seconds"], 3),
+                "pid": self._pid,
+            }
+
+
+segmenter_pool = SegmenterPool()
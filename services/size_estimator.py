@@ -0,0 +1,85 @@
+# services/size_estimator.py
+
+import os
+import time
+import uuid
+import subprocess
+from config import (FFMPEG, COMPRESSION_SETTINGS, TARGET_SIZE_SAMPLES,
+                    TARGET_SIZE_SAMPLE_SECONDS, TARGET_SIZE_MIN_VIDEO_BITRATE,
+                    TARGET_SIZE_CONTAINER_OVERHEAD)
+
+
+class TargetSizeError(Exception):
+    """The requested size cannot be reached for this input"""
+
+
+def sample_windows(duration, samples=TARGET_SIZE_SAMPLES, seconds=TARGET_SIZE_SAMPLE_SECONDS):
+    """(start, length) of short windows spread evenly across the file"""
+    if duration <= samples * seconds * 2:
+        # Short clip: one sample over (up to) the whole thing
+        return [(0.0, min(duration, samples * seconds))]
+    return [(duration * (i + 0.5) / samples - seconds / 2, seconds) for i in range(samples)]
+
+
+def _encode_sample(input_path, work_path, start, length, codec, settings, threads):
+    """CRF-encode one window without audio, returns (bytes, wall seconds)"""
+    cmd = [FFMPEG, "-y", "-ss", str(start), "-i", input_path, "-t", str(length),
+           "-map", "0:v:0", "-an", "-c:v", codec,
+           "-preset", settings["preset"], "-crf", settings["crf"]]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    began = time.monotonic()
+    result = subprocess.run(cmd + [work_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    elapsed = time.monotonic() - began
+    if result.returncode != 0 or not os.path.exists(work_path):
+        raise RuntimeError(f"Sample encode failed at {start:.1f}s")
+    size = os.path.getsize(work_path)
+    os.remove(work_path)
+    return size, elapsed
+
+
+def estimate_target_size(input_path, codec, target_bytes, duration, audio_bitrate,
+                         two_pass=False, threads=None):
+    """Sample-encode input_path and plan an encode that lands near target_bytes.
+
+    Returns a dict with the video bitrate to use, the size a plain CRF encode
+    would reach, and the predicted output size and encode time. When the CRF
+    encode already fits, mode is "crf" and the bitrate is only used as a cap.
+    """
+    settings = COMPRESSION_SETTINGS.get(codec, COMPRESSION_SETTINGS["libx264"])
+    if duration <= 0:
+        raise TargetSizeError("Could not read the video duration")
+
+    video_bitrate = int(target_bytes * 8 * (1 - TARGET_SIZE_CONTAINER_OVERHEAD) / duration - audio_bitrate)
+    if video_bitrate < TARGET_SIZE_MIN_VIDEO_BITRATE:
+        raise TargetSizeError("Target size is too small for this video's length")
+
+    work_path = os.path.join(os.path.dirname(os.path.abspath(input_path)),
+                             f".sample_{uuid.uuid4().hex[:8]}.mkv")
+    sampled_bytes = sampled_seconds = wall_seconds = 0
+    try:
+        for start, length in sample_windows(duration):
+            size, elapsed = _encode_sample(input_path, work_path, start, length, codec, settings, threads)
+            sampled_bytes += size
+            sampled_seconds += length
+            wall_seconds += elapsed
+    finally:
+        if os.path.exists(work_path):
+            os.remove(work_path)
+
+    crf_bitrate = sampled_bytes * 8 / sampled_seconds
+    # Encode time scales with duration; bitrate mode costs about the same as CRF,
+    # and the first pass of a two-pass encode runs at roughly half that again
+    encode_seconds = wall_seconds / sampled_seconds * duration * (1.5 if two_pass else 1)
+
+    mode = "crf" if crf_bitrate <= video_bitrate else ("two_pass" if two_pass else "bitrate")
+    predicted_video = crf_bitrate if mode == "crf" else video_bitrate
+    return {
+        "mode": mode,
+        "target_bytes": target_bytes,
+        "video_bitrate": video_bitrate,
+        "crf_bytes": int((crf_bitrate + audio_bitrate) * duration / 8),
+        "predicted_bytes": int((predicted_video + audio_bitrate) * duration / 8
+                               / (1 - TARGET_SIZE_CONTAINER_OVERHEAD)),
+        "encode_seconds": round(encode_seconds, 1),
+    }
@@ -0,0 +1,161 @@
+# services/split_engine.py
+
+import os
+import uuid
+import shutil
+import subprocess
+from config import FFMPEG, SPLIT_REENCODE_CRF, SPLIT_REENCODE_PRESET, AUDIO_BITRATE
+from services.media_index import get_media_index
+
+# Encoders able to produce a stream that can be concatenated with the source's
+SMART_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
+
+# Nudge past a keyframe's timestamp so input seeking cannot land on the previous one
+SEEK_EPSILON = 0.001
+
+
+def _run(cmd):
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr[-500:]}")
+
+
+def probe_video_stream(input_path):
+    """codec_name / pix_fmt of the first video stream (or None)"""
+    return get_media_index(input_path).video_stream()
+
+
+def keyframes_between(input_path, start, end):
+    """Keyframe timestamps of the first video stream in [start, end]"""
+    return get_media_index(input_path).keyframes_between(start, end)
+
+
+def split_copy(input_path, output_path, start, end):
+    """Legacy mode: output seeking + stream copy (reads everything before start)"""
+    _run([FFMPEG, "-y", "-i", input_path, "-ss", str(start), "-t", str(end - start),
+          "-c", "copy", output_path])
+
+
+def split_fast(input_path, output_path, start, end):
+    """Input seeking + stream copy: near instant, cut snaps to the keyframe before start"""
+    _run([FFMPEG, "-y", "-ss", str(start), "-i", input_path, "-t", str(end - start),
+          "-map", "0", "-c", "copy", "-avoid_negative_ts", "make_zero", output_path])
+
+
+def split_accurate(input_path, output_path, start, end):
+    """Input seeking + full re-encode of the range: frame accurate"""
+    _run([FFMPEG, "-y", "-ss", str(start), "-i", input_path, "-t", str(end - start),
+          "-c:v", "libx264", "-preset", SPLIT_REENCODE_PRESET, "-crf", SPLIT_REENCODE_CRF,
+          "-c:a", "aac", "-b:a", str(AUDIO_BITRATE), output_path])
+
+
+# ffprobe profile names -> encoder -profile:v values the source can be matched with
+_H264_PROFILES = {"constrained baseline": "baseline", "baseline": "baseline", "main": "main",
+                  "high": "high", "high 10": "high10", "high 4:2:2": "high422",
+                  "high 4:4:4 predictive": "high444"}
+_HEVC_PROFILES = {"main": "main", "main 10": "main10", "main still picture": "mainstillpicture"}
+
+
+def _match_source_args(encoder, stream):
+    """Encoder options reproducing the source stream's pixel format, profile and level"""
+    args = []
+    if stream.get("pix_fmt"):
+        args += ["-pix_fmt", stream["pix_fmt"]]
+    profile = str(stream.get("profile") or "").lower()
+    try:
+        level = int(stream.get("level") or 0)
+    except (TypeError, ValueError):
+        level = 0
+    if encoder == "libx264":
+        if profile in _H264_PROFILES:
+            args += ["-profile:v", _H264_PROFILES[profile]]
+        if level > 0:
+            args += ["-level", f"{level / 10:.1f}"]
+    else:
+        if profile in _HEVC_PROFILES:
+            args += ["-profile:v", _HEVC_PROFILES[profile]]
+        if level > 0:
+            # ffprobe reports HEVC general_level_idc, i.e. 30 x the level
+            args += ["-x265-params", f"level-idc={level / 30:g}"]
+    return args
+
+
+def decodes_cleanly(path):
+    """True if every frame of path decodes without a single decoder error"""
+    result = subprocess.run([FFMPEG, "-v", "error", "-xerror", "-i", path, "-f", "null", os.devnull],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return result.returncode == 0 and not result.stderr.strip()
+
+
+def split_smart(input_path, output_path, start, end):
+    """Frame-accurate cut that only re-encodes the partial GOPs at each boundary.
+
+    [start, k1) and [k2, end) are re-encoded with the source's codec,
+    profile, level and pixel format, the keyframe-aligned middle [k1, k2)
+    is stream-copied, and the three pieces are joined with the concat
+    demuxer. The pieces are MPEG-TS (Annex-B), so each carries its own
+    parameter sets in-band instead of relying on the first file's
+    avcC/hvcC. Audio is re-encoded for the exact range. The joined clip is
+    decoded once to verify it; if that fails the range is fully re-encoded.
+    """
+    stream = probe_video_stream(input_path)
+    codec_name = (stream or {}).get("codec_name")
+    encoder = SMART_ENCODERS.get(codec_name)
+    keyframes = keyframes_between(input_path, start, end) if encoder else []
+    if not encoder or not keyframes:
+        # Unknown codec or no keyframe inside the range: nothing to copy
+        return split_accurate(input_path, output_path, start, end)
+
+    k1, k2 = keyframes[0], keyframes[-1]
+    work_dir = os.path.join(os.path.dirname(os.path.abspath(output_path)), f".split_{uuid.uuid4().hex[:8]}")
+    os.makedirs(work_dir)
+    try:
+        def encode_part(name, part_start, part_end):
+            path = os.path.join(work_dir, name)
+            cmd = [FFMPEG, "-y", "-ss", str(part_start), "-i", input_path,
+                   "-t", str(part_end - part_start), "-map", "0:v:0", "-an",
+                   "-c:v", encoder, "-preset", SPLIT_REENCODE_PRESET, "-crf", SPLIT_REENCODE_CRF]
+            _run(cmd + _match_source_args(encoder, stream) + ["-f", "mpegts", path])
+            return path
+
+        parts = []
+        if k1 - start > SEEK_EPSILON:
+            parts.append(encode_part("head.ts", start, k1))
+        if k2 > k1:
+            middle = os.path.join(work_dir, "middle.ts")
+            # Stop just short of k2 so the tail's first frame is not duplicated;
+            # mp4toannexb puts the source's parameter sets in front of each keyframe
+            _run([FFMPEG, "-y", "-ss", str(k1 + SEEK_EPSILON), "-i", input_path,
+                  "-t", str(k2 - k1 - 2 * SEEK_EPSILON), "-map", "0:v:0", "-c", "copy",
+                  "-bsf:v", f"{codec_name}_mp4toannexb",
+                  "-avoid_negative_ts", "make_zero", "-f", "mpegts", middle])
+            parts.append(middle)
+        if end - k2 > SEEK_EPSILON:
+            parts.append(encode_part("tail.ts", k2, end))
+
+        concat_list = os.path.join(work_dir, "parts.txt")
+        with open(concat_list, "w") as f:
+            for path in parts:
+                f.write(f"file '{path}'\n")
+
+        joined = os.path.join(work_dir, "joined" + os.path.splitext(output_path)[1])
+        _run([FFMPEG, "-y",
+              "-f", "concat", "-safe", "0", "-i", concat_list,
+              "-ss", str(start), "-t", str(end - start), "-i", input_path,
+              "-map", "0:v:0", "-map", "1:a:0?",
+              "-c:v", "copy", "-c:a", "aac", "-b:a", str(AUDIO_BITRATE),
+              joined])
+        if not decodes_cleanly(joined):
+            print(f"Smart cut of {input_path} did not decode cleanly, re-encoding the range")
+            return split_accurate(input_path, output_path, start, end)
+        os.replace(joined, output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+SPLIT_MODES = {
+    "copy": split_copy,
+    "fast": split_fast,
+    "accurate": split_accurate,
+    "smart": split_smart,
+}
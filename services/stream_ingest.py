@@ -0,0 +1,278 @@
+# services/stream_ingest.py
+
+import os
+import hashlib
+import threading
+from config import (STREAMABLE_EXTENSIONS, STREAM_SNIFF_BYTES, STREAM_MIN_BYTES, UPLOAD_CHUNK_SIZE,
+                    CHUNKED_ENCODE_MIN_SECONDS, CHUNK_ENCODER_THREADS)
+from services.task_store import tasks
+from services.ffmpeg_service import (build_compress_command, compress_video_files,
+                                     compress_cache_key, ffmpeg_thread_budget, plan_from_streams)
+from services.media_index import probe_head
+from services import result_cache
+from utils.ffmpeg_utils import run_with_progress
+from utils.file_utils import remember_content_hash
+from workers.job_scheduler import scheduler, QueueFullError
+
+
+def _iter_mp4_boxes(data, start=0, end=None):
+    """Yield (type, payload_start, box_end) for the ISO-BMFF boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size = int.from_bytes(data[pos:pos + 4], "big")
+        box_type = data[pos + 4:pos + 8]
+        header = 8
+        if size == 1 and pos + 16 <= end:
+            size = int.from_bytes(data[pos + 8:pos + 16], "big")
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def is_streamable(filename, head):
+    """True if ffmpeg can decode this container from a non-seekable pipe.
+
+    Matroska/WebM always can. MP4/MOV only when fragmented (moov carries an
+    mvex box); a regular MP4 may keep its index at the end of the file.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in STREAMABLE_EXTENSIONS:
+        return False
+    if ext in (".mkv", ".webm"):
+        return head[:4] == b"\x1a\x45\xdf\xa3"  # EBML magic
+    for box_type, payload, box_end in _iter_mp4_boxes(head):
+        if box_type == b"moov":
+            if box_end > len(head):
+                return False  # moov not fully sniffed, play safe
+            return any(t == b"mvex" for t, _, _ in _iter_mp4_boxes(head, payload, box_end))
+        if box_type in (b"mdat", b"moof"):
+            return box_type == b"moof"
+    return False
+
+
+def _read_head(stream, size):
+    head = b""
+    while len(head) < size:
+        chunk = stream.read(size - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head
+
+
+class _Spool:
+    """Upload body written to disk by the request thread while the encode job
+    reads it back, so the request returns as soon as the body has arrived"""
+
+    def __init__(self, path):
+        self.path = path
+        self.written = 0
+        self.done = False        # the whole body arrived
+        self.failed = False      # the upload broke off
+        self.cached = False      # the result is already cached: stop encoding
+        self.abandoned = False   # the job has finished: stop reporting upload progress
+        self.key = None          # result cache key, known once the body has arrived
+        self._cond = threading.Condition()
+
+    def advance(self, written, report):
+        """Record bytes on disk and report them, False once the job has finished"""
+        with self._cond:
+            if self.abandoned:
+                return False
+            self.written = written
+            self._cond.notify_all()
+            # Under the lock, so no report can follow the job's final update
+            report(written)
+            return True
+
+    def finish(self, failed=False, key=None, cached=False):
+        with self._cond:
+            self.done = not failed
+            self.failed = failed
+            self.key = key
+            self.cached = cached
+            self._cond.notify_all()
+
+    def abandon(self):
+        with self._cond:
+            self.abandoned = True
+
+    def chunks(self):
+        """Yield the body as it lands on disk, until the upload ends"""
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(UPLOAD_CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                    continue
+                with self._cond:
+                    self._cond.wait_for(lambda: f.tell() < self.written or self.done
+                                        or self.failed or self.cached)
+                    if self.failed or self.cached or (self.done and f.tell() >= self.written):
+                        return
+
+
+def _feed(spool, write_fd):
+    try:
+        with os.fdopen(write_fd, "wb") as pipe:
+            for chunk in spool.chunks():
+                pipe.write(chunk)
+    except BrokenPipeError:
+        pass  # ffmpeg exited early, its return code reports the error
+
+
+def _encode_spooled(task_id, spool, filename, codec, plan, output_dir, threads):
+    """Scheduler job: encode the upload from its spool file while it arrives"""
+    output_filename = f"compressed_{filename}"
+    output_path = os.path.join(output_dir, output_filename)
+    try:
+        read_fd, write_fd = os.pipe()
+        feeder = threading.Thread(target=_feed, args=(spool, write_fd), daemon=True)
+        feeder.start()
+        try:
+            cmd = build_compress_command("pipe:0", output_path, codec, threads, plan)
+            code = run_with_progress(cmd, stdin=read_fd)
+        finally:
+            os.close(read_fd)
+            feeder.join()
+        spool.abandon()
+
+        cached = spool.cached and result_cache.lookup(spool.key, output_path)
+        ok = cached or (code == 0 and spool.done and os.path.exists(output_path))
+        if ok and not cached:
+            result_cache.store(spool.key, output_path)
+        tasks.update(
+            task_id,
+            status="done" if ok else "error",
+            current=1,
+            bytes_received=spool.written,
+            progress=[{"file": filename, "status": "done" if ok else "error",
+                       "percent": 100 if ok else 0, "cached": bool(cached), "path": plan}],
+            files=[output_filename] if ok else [],
+            **({} if ok else {"error": "Streaming encode failed"})
+        )
+    except Exception as e:
+        spool.abandon()
+        print("STREAMING ENCODE ERROR:", e)
+        tasks.update(task_id, status="error", error=str(e))
+    finally:
+        try:
+            os.remove(spool.path)
+        except OSError:
+            pass
+
+
+def _stream_plan(head, content_length, codec):
+    """Compression plan to encode an upload with while it arrives, from its
+    first bytes, or None when the normal job would do better: small uploads,
+    inputs long enough for a chunked encode, and heads ffprobe cannot read"""
+    if not content_length or content_length < STREAM_MIN_BYTES:
+        return None
+    try:
+        meta = probe_head(head)
+    except Exception as e:
+        print(f"Could not probe the upload head: {e}")
+        return None
+    duration = meta["duration"]
+    if (duration >= CHUNKED_ENCODE_MIN_SECONDS
+            and ffmpeg_thread_budget(1) // CHUNK_ENCODER_THREADS >= 2):
+        return None
+    video = next((s for s in meta["streams"] if s.get("codec_type") == "video"), None)
+    audio = next((s for s in meta["streams"] if s.get("codec_type") == "audio"), None)
+    # The container's bitrate is often only known at the end: derive it from the size
+    total_bitrate = content_length * 8 / duration if duration else 0
+    return plan_from_streams(video, audio, total_bitrate, codec)
+
+
+def ingest_upload(task_id, filename, codec, stream, content_length, input_dir, output_dir):
+    """Consume an upload body, encoding while it arrives when that pays off.
+
+    Large uploads in a pipe-readable container are spooled to disk and
+    encoded from the spool by a job that starts right away (with the remux or
+    capped fast path when the head probe allows it); the request returns once
+    the body has arrived and the job finishes on its own. Everything else is
+    saved and queued as a normal job. Returns "streaming" or "buffered".
+    On QueueFullError the task record and any saved input are removed.
+    """
+    head = _read_head(stream, STREAM_SNIFF_BYTES)
+    input_path = os.path.join(input_dir, filename)
+    output_path = os.path.join(output_dir, f"compressed_{filename}")
+    sha = hashlib.sha256()
+
+    def body():
+        yield head
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+            yield chunk
+
+    # Only stream when a worker is free right now, otherwise the encode could
+    # not overlap the upload anyway
+    plan = None
+    if is_streamable(filename, head) and scheduler.idle_workers() > 0:
+        plan = _stream_plan(head, content_length, codec)
+
+    if plan is None:
+        received = 0
+        with open(input_path, "wb") as out:
+            for chunk in body():
+                sha.update(chunk)
+                out.write(chunk)
+                received += len(chunk)
+        remember_content_hash(input_path, sha.hexdigest())
+        tasks.update(task_id, status="queued", mode="buffered", bytes_received=received)
+        try:
+            scheduler.submit(task_id, compress_video_files,
+                             task_id, [filename], codec, input_dir, output_dir)
+        except QueueFullError:
+            tasks.delete(task_id)
+            os.remove(input_path)
+            raise
+        return "buffered"
+
+    def report(received):
+        percent = int(received / content_length * 100) if content_length else 0
+        tasks.update_progress(task_id, status="processing", bytes_received=received,
+                              progress=[{"file": filename, "status": "processing",
+                                         "percent": min(percent, 99), "path": plan}])
+
+    out = open(input_path, "wb")
+    spool = _Spool(input_path)
+    tasks.update(task_id, status="processing", mode="streaming")
+    try:
+        scheduler.submit(task_id, _encode_spooled, task_id, spool, filename, codec, plan,
+                         output_dir, ffmpeg_thread_budget(1))
+    except QueueFullError:
+        out.close()
+        os.remove(input_path)
+        tasks.delete(task_id)
+        raise
+
+    received = 0
+    try:
+        with out:
+            for chunk in body():
+                out.write(chunk)
+                out.flush()
+                sha.update(chunk)
+                received += len(chunk)
+                if not spool.advance(received, report):
+                    # ffmpeg gave up, its job already reported the error
+                    return "streaming"
+    except Exception as e:
+        print(f"Streaming upload for {task_id} aborted: {e}")
+        spool.finish(failed=True)
+        return "streaming"
+    except BaseException:
+        spool.finish(failed=True)
+        raise
+
+    # With the whole body hashed, an identical earlier result ends the encode
+    digest = sha.hexdigest()
+    remember_content_hash(input_path, digest)
+    key = compress_cache_key(input_path, output_path, codec, digest)
+    spool.finish(key=key, cached=result_cache.contains(key))
+    return "streaming"
@@ -0,0 +1,327 @@
+# services/task_store.py
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import importlib
+from config import TASK_STORE_BACKEND, TASK_DB_PATH, TASK_PROGRESS_FLUSH_SECONDS
+
+
+class TaskStore:
+    """Base class for task record backends.
+
+    Backends implement _read/_write/_merge/_delete/_purge (and optionally
+    _merge_many). Progress updates are buffered here and written at most
+    once per flush interval; a background thread writes whatever is still
+    buffered after an interval, so other processes see the latest value even
+    when no further update follows.
+    """
+
+    def __init__(self, flush_interval=TASK_PROGRESS_FLUSH_SECONDS):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Held from taking buffered fields to writing them, so a flush of older
+        # progress can never land after a newer state change
+        self._write_lock = threading.Lock()
+        self._pending = {}     # task_id -> buffered progress fields
+        self._last_flush = {}  # task_id -> time of last progress write
+        self._changed = threading.Lock()  # guards the change bookkeeping below
+        self._versions = {}    # task_id -> local change counter (for waiters)
+        self._touched = {}     # task_id -> time of the last local change
+        self._waiters = {}     # task_id -> [Condition on self._changed, waiter count]
+        self._flusher_pid = None
+
+    # --- backend hooks -------------------------------------------------
+    def _read(self, task_id):
+        raise NotImplementedError
+
+    def _write(self, task_id, record):
+        raise NotImplementedError
+
+    def _merge(self, task_id, fields):
+        """Merge fields into an existing record; no-op if it does not exist"""
+        raise NotImplementedError
+
+    def _merge_many(self, updates):
+        """Merge {task_id: fields} into existing records"""
+        for task_id, fields in updates.items():
+            self._merge(task_id, fields)
+
+    def _delete(self, task_id):
+        raise NotImplementedError
+
+    def _purge(self, max_age_seconds):
+        """Delete records not updated for max_age_seconds, return their ids"""
+        raise NotImplementedError
+
+    # --- public API ----------------------------------------------------
+    def create(self, task_id, record):
+        self._write(task_id, record)
+        self._notify(task_id)
+
+    def get(self, task_id):
+        record = self._read(task_id)
+        with self._lock:
+            pending = self._pending.get(task_id)
+        if record is not None and pending:
+            record.update(pending)
+        return record
+
+    def update(self, task_id, **fields):
+        """Write fields immediately (used for state changes)"""
+        with self._write_lock:
+            with self._lock:
+                pending = self._pending.pop(task_id, {})
+                self._last_flush[task_id] = time.monotonic()
+            pending.update(fields)
+            self._merge(task_id, pending)
+        self._notify(task_id)
+
+    def update_many(self, updates):
+        """Write fields for several tasks at once ({task_id: fields}), in one
+        transaction where the backend supports it"""
+        if not updates:
+            return
+        self._merge_many(updates)
+        for task_id in updates:
+            self._notify(task_id)
+
+    def update_progress(self, task_id, **fields):
+        """Buffer frequent progress fields and flush them periodically"""
+        now = time.monotonic()
+        with self._lock:
+            self._pending.setdefault(task_id, {}).update(fields)
+            due = now - self._last_flush.get(task_id, 0) >= self.flush_interval
+            if not due:
+                self._start_flusher()
+        if due:
+            with self._write_lock:
+                with self._lock:
+                    pending = self._pending.pop(task_id, None)
+                    self._last_flush[task_id] = now
+                if pending:
+                    self._merge(task_id, pending)
+        # Local readers see buffered fields through get(), so wake them either way
+        self._notify(task_id)
+
+    def flush(self, task_id):
+        with self._write_lock:
+            with self._lock:
+                pending = self._pending.pop(task_id, None)
+                self._last_flush.pop(task_id, None)
+            if pending:
+                self._merge(task_id, pending)
+
+    def flush_due(self):
+        """Write buffered progress that has waited at least one flush interval"""
+        now = time.monotonic()
+        with self._write_lock:
+            with self._lock:
+                due = {task_id: self._pending.pop(task_id) for task_id in list(self._pending)
+                       if now - self._last_flush.get(task_id, 0) >= self.flush_interval}
+                for task_id in due:
+                    self._last_flush[task_id] = now
+            if due:
+                self._merge_many(due)
+
+    def _start_flusher(self):
+        # Caller holds self._lock. Threads do not survive a fork, so start one
+        # per process
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_due()
+            except Exception as e:
+                print(f"Error flushing task progress: {e}")
+
+    def delete(self, task_id):
+        self._delete(task_id)
+        self._forget([task_id])
+
+    def purge_expired(self, max_age_seconds):
+        """Delete records not updated for max_age_seconds, return the count"""
+        purged = self._purge(max_age_seconds)
+        # Records may have been purged by another process: also drop local
+        # bookkeeping for tasks this process has not touched for as long
+        cutoff = time.monotonic() - max_age_seconds
+        with self._changed:
+            idle = [k for k, touched in self._touched.items() if touched < cutoff]
+        self._forget(list(purged) + idle)
+        return len(purged)
+
+    def _forget(self, task_ids):
+        with self._lock:
+            for task_id in task_ids:
+                self._pending.pop(task_id, None)
+                self._last_flush.pop(task_id, None)
+        with self._changed:
+            for task_id in task_ids:
+                self._versions.pop(task_id, None)
+                self._touched.pop(task_id, None)
+
+    def _notify(self, task_id):
+        with self._changed:
+            self._versions[task_id] = self._versions.get(task_id, 0) + 1
+            self._touched[task_id] = time.monotonic()
+            # Only wake the streams following this task
+            waiters = self._waiters.get(task_id)
+            if waiters:
+                waiters[0].notify_all()
+
+    def wait_for_change(self, task_id, version, timeout):
+        """Block until this process changes the task (or timeout), return its version.
+
+        Changes made by other worker processes are not signalled; callers
+        should re-read the record after a timeout as well.
+        """
+        with self._changed:
+            waiters = self._waiters.get(task_id)
+            if waiters is None:
+                waiters = self._waiters[task_id] = [threading.Condition(self._changed), 0]
+            waiters[1] += 1
+            try:
+                waiters[0].wait_for(lambda: self._versions.get(task_id, 0) != version, timeout)
+                return self._versions.get(task_id, 0)
+            finally:
+                waiters[1] -= 1
+                if not waiters[1]:
+                    del self._waiters[task_id]
+
+    def __contains__(self, task_id):
+        return self._read(task_id) is not None
+
+
+class MemoryTaskStore(TaskStore):
+    """Process-local store, only suitable for a single worker"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._records = {}  # task_id -> (updated_at, record)
+        self._records_lock = threading.Lock()
+
+    def _read(self, task_id):
+        with self._records_lock:
+            entry = self._records.get(task_id)
+            return dict(entry[1]) if entry else None
+
+    def _write(self, task_id, record):
+        with self._records_lock:
+            self._records[task_id] = (time.time(), dict(record))
+
+    def _merge(self, task_id, fields):
+        with self._records_lock:
+            entry = self._records.get(task_id)
+            if entry:
+                entry[1].update(fields)
+                self._records[task_id] = (time.time(), entry[1])
+
+    def _delete(self, task_id):
+        with self._records_lock:
+            self._records.pop(task_id, None)
+
+    def _purge(self, max_age_seconds):
+        cutoff = time.time() - max_age_seconds
+        with self._records_lock:
+            expired = [k for k, (updated, _) in self._records.items() if updated < cutoff]
+            for task_id in expired:
+                del self._records[task_id]
+        return expired
+
+
+class SQLiteTaskStore(TaskStore):
+    """SQLite (WAL mode) store shared by every worker process on the host"""
+
+    def __init__(self, path=TASK_DB_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_updated ON tasks(updated_at)")
+
+    def _connect(self):
+        # One connection per thread and per process (gunicorn forks workers)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _read(self, task_id):
+        row = self._connect().execute(
+            "SELECT data FROM tasks WHERE id = ?", (task_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, task_id, record):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO tasks (id, data, updated_at) VALUES (?, ?, ?)",
+            (task_id, json.dumps(record), time.time()),
+        )
+
+    def _merge(self, task_id, fields):
+        self._merge_many({task_id: fields})
+
+    def _merge_many(self, updates):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            for task_id, fields in updates.items():
+                row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+                if row:
+                    record = json.loads(row[0])
+                    record.update(fields)
+                    conn.execute(
+                        "UPDATE tasks SET data = ?, updated_at = ? WHERE id = ?",
+                        (json.dumps(record), now, task_id),
+                    )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _delete(self, task_id):
+        self._connect().execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def _purge(self, max_age_seconds):
+        cutoff = time.time() - max_age_seconds
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = [row[0] for row in conn.execute(
+                "SELECT id FROM tasks WHERE updated_at < ?", (cutoff,))]
+            conn.execute("DELETE FROM tasks WHERE updated_at < ?", (cutoff,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return expired
+
+
+def create_task_store(backend=TASK_STORE_BACKEND):
+    """Build a store from a backend name or a "module:ClassName" path"""
+    if backend == "sqlite":
+        return SQLiteTaskStore()
+    if backend == "memory":
+        return MemoryTaskStore()
+    module_name, _, class_name = backend.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+tasks = create_task_store()
@@ -0,0 +1,256 @@
+# services/upload_service.py
+
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from config import (UPLOAD_DIR, ALLOWED_EXTENSIONS, MAX_UPLOAD_BYTES,
+                    UPLOAD_CHUNK_SIZE, UPLOAD_LIFETIME_MINUTES)
+from utils.file_utils import unique_upload_name, remember_content_hash, HASH_CHUNK_SIZE
+
+META_DIR = os.path.join(UPLOAD_DIR, ".uploads")
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    """Upload API error carrying the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _meta_path(upload_id):
+    if not upload_id or not _UPLOAD_ID_RE.match(upload_id):
+        raise UploadError("Invalid upload id", 404)
+    return os.path.join(META_DIR, f"{upload_id}.json")
+
+
+@contextmanager
+def _locked_meta(upload_id):
+    """Read-modify-write access to an upload's metadata, locked across processes"""
+    path = _meta_path(upload_id)
+    try:
+        f = open(path, "r+")
+    except FileNotFoundError:
+        raise UploadError("Upload not found", 404)
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        meta = json.load(f)
+        yield meta
+        f.seek(0)
+        f.truncate()
+        json.dump(meta, f)
+
+
+def _merge_range(ranges, start, end):
+    """Add [start, end) to a sorted list of disjoint [start, end) ranges"""
+    merged = []
+    for r_start, r_end in sorted(ranges + [[start, end]]):
+        if merged and r_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], r_end)
+        else:
+            merged.append([r_start, r_end])
+    return merged
+
+
+def _received(meta):
+    return sum(end - start for start, end in meta["ranges"])
+
+
+def create_upload(filename, size):
+    """Reserve the final file for an upload and return its public state"""
+    if not filename or os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+        raise UploadError("File type not allowed")
+    if size <= 0:
+        raise UploadError("Invalid file size")
+    if size > MAX_UPLOAD_BYTES:
+        raise UploadError("File is too large", 413)
+
+    os.makedirs(META_DIR, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    stored_name = unique_upload_name(filename)
+
+    # Chunks are written in place with pwrite, so reserve the full length now
+    with open(os.path.join(UPLOAD_DIR, stored_name), "wb") as f:
+        f.truncate(size)
+
+    meta = {
+        "upload_id": upload_id,
+        "filename": stored_name,
+        "size": size,
+        "ranges": [],
+        "complete": False,
+    }
+    with open(_meta_path(upload_id), "w") as f:
+        json.dump(meta, f)
+    return upload_state(meta)
+
+
+def upload_state(meta):
+    return {
+        "upload_id": meta["upload_id"],
+        "size": meta["size"],
+        "received": _received(meta),
+        "ranges": meta["ranges"],
+        "complete": meta["complete"],
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+    }
+
+
+def get_upload(upload_id):
+    with _locked_meta(upload_id) as meta:
+        return upload_state(meta)
+
+
+def write_chunk(upload_id, offset, stream):
+    """Write a request body at offset straight into the final file"""
+    path = _meta_path(upload_id)
+    try:
+        with open(path) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise UploadError("Upload not found", 404)
+    if meta["complete"]:
+        raise UploadError("Upload already finalized", 409)
+    if offset < 0 or offset > meta["size"]:
+        raise UploadError("Invalid offset", 416)
+
+    position = offset
+    fd = os.open(os.path.join(UPLOAD_DIR, meta["filename"]), os.O_WRONLY)
+    try:
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+            if position + len(chunk) > meta["size"]:
+                raise UploadError("Chunk extends past the declared size", 416)
+            view = memoryview(chunk)
+            while view:
+                written = os.pwrite(fd, view, position)
+                position += written
+                view = view[written:]
+    finally:
+        os.close(fd)
+        # Record what did land, so a dropped connection can resume from here
+        if position > offset:
+            with _locked_meta(upload_id) as meta:
+                meta["ranges"] = _merge_range(meta["ranges"], offset, position)
+
+    return get_upload(upload_id)
+
+
+def finalize_upload(upload_id):
+    """Check every byte arrived, hash the file once and mark it ready"""
+    with _locked_meta(upload_id) as meta:
+        if meta["ranges"] != [[0, meta["size"]]]:
+            raise UploadError("Upload is incomplete", 409)
+        if not meta["complete"]:
+            path = os.path.join(UPLOAD_DIR, meta["filename"])
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    sha.update(chunk)
+            meta["content_hash"] = sha.hexdigest()
+            meta["complete"] = True
+        return upload_state(meta)
+
+
+def peek_upload(upload_id):
+    """Path of a finalized upload without claiming it (it stays available to a job)"""
+    with _locked_meta(upload_id) as meta:
+        if not meta["complete"]:
+            raise UploadError("Upload is not finalized", 409)
+        path = os.path.join(UPLOAD_DIR, meta["filename"])
+        content_hash = meta.get("content_hash")
+    if content_hash:
+        remember_content_hash(path, content_hash)
+    return path
+
+
+def _claimed_path(upload_id):
+    return os.path.join(META_DIR, f"{upload_id}.claimed")
+
+
+def claim_upload(upload_id):
+    """Hand a finalized upload to a job: returns its filename in UPLOAD_DIR.
+
+    The metadata is kept aside, so release_upload() can give the upload
+    back if the job is refused.
+    """
+    with _locked_meta(upload_id) as meta:
+        if not meta["complete"]:
+            raise UploadError("Upload is not finalized", 409)
+        filename = meta["filename"]
+        content_hash = meta.get("content_hash")
+        try:
+            os.replace(_meta_path(upload_id), _claimed_path(upload_id))
+        except FileNotFoundError:
+            raise UploadError("Upload not found", 404)  # claimed by a concurrent request
+    if content_hash:
+        remember_content_hash(os.path.join(UPLOAD_DIR, filename), content_hash)
+    return filename
+
+
+def claim_uploads(upload_ids):
+    """claim_upload for several uploads, all or none.
+
+    Every id is checked before any is claimed, so one bad id leaves the
+    others available to retry with.
+    """
+    for upload_id in upload_ids:
+        with _locked_meta(upload_id) as meta:
+            if not meta["complete"]:
+                raise UploadError("Upload is not finalized", 409)
+    claimed = []
+    try:
+        for upload_id in upload_ids:
+            claimed.append(claim_upload(upload_id))
+    except UploadError:
+        release_uploads(upload_ids[:len(claimed)])
+        raise
+    return claimed
+
+
+def release_upload(upload_id):
+    """Give a claimed upload back (the job that claimed it was refused)"""
+    claimed = _claimed_path(upload_id)
+    os.utime(claimed)  # restart its lifetime
+    os.replace(claimed, _meta_path(upload_id))
+
+
+def release_uploads(upload_ids):
+    for upload_id in upload_ids:
+        try:
+            release_upload(upload_id)
+        except OSError as e:
+            print(f"Error releasing upload {upload_id}: {e}")
+
+
+def purge_stale_uploads(max_age_seconds=UPLOAD_LIFETIME_MINUTES * 60):
+    """Delete abandoned uploads (metadata and partial file), return the count"""
+    if not os.path.isdir(META_DIR):
+        return 0
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for name in os.listdir(META_DIR):
+        path = os.path.join(META_DIR, name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            if name.endswith(".claimed"):
+                # The file belongs to the job that claimed it
+                os.remove(path)
+                continue
+            with open(path) as f:
+                filename = json.load(f).get("filename")
+            if filename:
+                data_path = os.path.join(UPLOAD_DIR, filename)
+                if os.path.exists(data_path):
+                    os.remove(data_path)
+            os.remove(path)
+            removed += 1
+        except (OSError, ValueError) as e:
+            print(f"Error purging upload {name}: {e}")
+    return removed
@@ -1,122 +1,355 @@
 import os
+import time
 import uuid
+import shutil
 import cv2
-import mediapipe as mp
-from mediapipe.tasks.python.vision import ImageSegmenter
-from mediapipe.tasks.python import BaseOptions
-from mediapipe.tasks.python.vision import RunningMode
-import numpy as np
 import subprocess
-import urllib.request
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from config import (FFMPEG, AUDIO_BITRATE, VIDEO_OPS_QUEUE_SIZE,
+                    BG_REMOVAL_QUALITY, BG_REMOVAL_DEFAULT_QUALITY, BG_VIDEO_CACHE_MB,
+                    BG_PARALLEL, BG_PARALLEL_WORKERS, BG_PARALLEL_MIN_PART_FRAMES)
+from services.media_index import get_media_index
+from services.segmentation_models import segmenter_pool, ModelUnavailableError
+from services.task_store import tasks
+from services.mask_tracker import MaskTracker
+from services.compositor import Compositor, BackgroundSource
+from utils.frame_pipeline import FramePipeline
+from utils.ffmpeg_utils import percent_of
+from workers.job_scheduler import scheduler
 
 
-def process_video_background(
+def open_frame_encoder(input_path, output_path, width, height, fps, remove_voice=False):
+    """One ffmpeg process that encodes raw BGR frames from stdin to H.264.
+
+    Audio is mapped from input_path in the same run (unless remove_voice),
+    so there is no intermediate file and no second transcode.
+    """
+    cmd = [
+        FFMPEG, "-y",
+        "-f", "rawvideo",
+        "-pix_fmt", "bgr24",
+        "-s", f"{width}x{height}",
+        "-r", str(fps or 30),
+        "-i", "pipe:0",
+    ]
+    if remove_voice:
+        cmd += ["-map", "0:v:0", "-an"]
+    else:
+        cmd += ["-i", input_path, "-map", "0:v:0", "-map", "1:a:0?",
+                "-c:a", "aac", "-b:a", str(AUDIO_BITRATE), "-shortest"]
+    cmd += [
+        "-c:v", "libx264",
+        "-preset", "fast",
+        # yuv420p needs even dimensions
+        "-vf", "crop=trunc(iw/2)*2:trunc(ih/2)*2",
+        "-pix_fmt", "yuv420p",
+        "-movflags", "+faststart",
+        output_path,
+    ]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def remove_background_frames(
     input_path: str,
+    encoder_output: str,
     bg_source: dict | None,
     threshold: float,
-    output_folder: str,
-    remove_voice: bool = False,
-) -> str:
-    os.makedirs(output_folder, exist_ok=True)
-
-    model_path = os.path.join(output_folder, 'selfie_segmenter.tflite')
-    if not os.path.exists(model_path):
-        url = 'https://storage.googleapis.com/mediapipe-models/image_segmenter/selfie_segmenter/float16/latest/selfie_segmenter.tflite'
-        urllib.request.urlretrieve(url, model_path)
+    remove_voice: bool,
+    quality: str,
+    feather: float,
+    start_time: float = 0.0,
+    end_time: float | None = None,
+    start_index: int = 0,
+    on_frame=None,
+) -> dict:
+    """Run the frames of input_path with start_time <= pts < end_time through
+    decode -> segment -> composite -> encode.
 
+    Each stage runs in its own thread. Ranges are selected by each decoded
+    frame's timestamp, not by frame-number seeking (which is not exact on
+    every codec/container), so adjacent ranges neither drop nor repeat a
+    frame. start_index is the absolute index of the range's first frame;
+    background frames are taken at that index so a looping background stays
+    in step across ranges. Returns the stage timings.
+    """
     cap = cv2.VideoCapture(input_path)
     fps = cap.get(cv2.CAP_PROP_FPS)
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    # Half a frame of tolerance when comparing timestamps with range bounds
+    slack = 0.5 / (fps or 30)
+    if start_time:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start_time * 1000)
 
-    temp_video = os.path.join(output_folder, f"temp_{uuid.uuid4().hex[:8]}.avi")
-    fourcc = cv2.VideoWriter_fourcc(*"XVID")
-    writer = cv2.VideoWriter(temp_video, fourcc, fps, (width, height))
+    # Background resized once (cached frames for a looping video) and a
+    # compositor blending into preallocated buffers; the ring covers every
+    # frame that can be queued between compositing and the encoder
+    background = BackgroundSource(bg_source, width, height,
+                                  max_bytes=BG_VIDEO_CACHE_MB * 1024 * 1024, start_index=start_index)
+    compositor = Compositor(width, height, threshold, feather, ring=VIDEO_OPS_QUEUE_SIZE + 3)
+    frame_index = [start_index]
 
-    # Prepare background
-    bg_frame = None
-    bg_video_cap = None
+    def decode():
+        nonlocal cap
+        first = True
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            # Timestamp of the frame just read
+            t = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if first and start_time and t > start_time + slack:
+                # The seek overshot the range start: decode from the beginning instead
+                cap.release()
+                cap = cv2.VideoCapture(input_path)
+                first = False
+                continue
+            first = False
+            if t < start_time - slack:
+                continue
+            if end_time is not None and t >= end_time - slack:
+                return
+            yield frame
 
-    if bg_source:
-        if bg_source["type"] == "color":
-            color = bg_source["value"].lstrip("#")
-            r, g, b = tuple(int(color[i:i+2], 16) for i in (0, 2, 4))
-            bg_frame = np.full((height, width, 3), (b, g, r), dtype=np.uint8)
+    def composite(item):
+        frame, confidence = item
+        bg = background.frame(frame_index[0])
+        frame_index[0] += 1
+        return compositor.composite(frame, confidence, bg)
 
-        elif bg_source["type"] == "image":
-            img = cv2.imread(bg_source["value"])
-            bg_frame = cv2.resize(img, (width, height))
+    # Warm segmenter from this process's pool (no per-request download or init)
+    with segmenter_pool.acquire() as segmenter:
+        masks = MaskTracker(segmenter, **BG_REMOVAL_QUALITY[quality])
 
-        elif bg_source["type"] == "video":
-            bg_video_cap = cv2.VideoCapture(bg_source["value"])
+        def segment(frame):
+            return frame, masks(frame)
 
-    options = ImageSegmenter.ImageSegmenterOptions(
-        base_options=BaseOptions(model_asset_path=model_path),
-        running_mode=RunningMode.IMAGE
-    )
+        def encode(frame):
+            encoder.stdin.write(frame.data)
+            if on_frame:
+                on_frame()
 
-    with ImageSegmenter.create_from_options(options) as segmenter:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
+        encoder = open_frame_encoder(input_path, encoder_output, width, height, fps, remove_voice)
+        pipeline = FramePipeline(decode(), [
+            ("segment", segment),
+            ("composite", composite),
+            ("encode", encode),
+        ], queue_size=VIDEO_OPS_QUEUE_SIZE)
+        try:
+            timings = pipeline.run()
+        except BaseException:
+            encoder.kill()
+            raise
+        finally:
+            cap.release()
+            background.release()
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = encoder.wait()
+
+    if returncode != 0 or not os.path.exists(encoder_output):
+        raise RuntimeError("ffmpeg failed to encode the processed video")
+    timings["bottleneck"] = pipeline.bottleneck()
+    timings["inferences"] = masks.inferences
+    timings["scene_cuts"] = masks.scene_cuts
+    return timings
+
+
+# Per-range frame counters shared with the worker processes of one parallel job
+_range_progress = None
+
+
+def _init_range_worker(progress):
+    global _range_progress
+    _range_progress = progress
+
+
+def _remove_background_range(slot, input_path, part_path, bg_source, threshold, quality, feather,
+                             start_time, end_time, start_index):
+    """Worker process entry point: one time range to a video-only part file"""
+    def on_frame():
+        with _range_progress.get_lock():
+            _range_progress[slot] += 1
+
+    return remove_background_frames(input_path, part_path, bg_source, threshold, True,
+                                    quality, feather, start_time, end_time, start_index, on_frame)
+
+
+def parallel_workers():
+    """Range processes for one job: BG_PARALLEL_WORKERS, but no more than this
+    job's share of the CPU while other scheduler jobs run alongside it"""
+    return max(1, min(BG_PARALLEL_WORKERS, (os.cpu_count() or 1) // scheduler.active_jobs()))
+
+
+def time_ranges(input_path, total_frames, fps, workers=None, min_part=BG_PARALLEL_MIN_PART_FRAMES):
+    """Split the input into up to `workers` keyframe-aligned time ranges.
+
+    Returns [(start_time, end_time or None, start_index)], each at least
+    about min_part frames long. Bounds are snapped to keyframes from the
+    media index so every range starts on a frame its decoder can seek to
+    exactly; without keyframe information the input stays in one range.
+    """
+    whole = [(0.0, None, 0)]
+    workers = parallel_workers() if workers is None else workers
+    parts = min(workers, total_frames // max(1, min_part)) if total_frames > 0 and fps > 0 else 0
+    if parts < 2:
+        return whole
+    duration = total_frames / fps
+    try:
+        keyframes = get_media_index(input_path).keyframes_between(0, duration)
+    except Exception as e:
+        print(f"No keyframes for {input_path}, processing in one range: {e}")
+        return whole
+
+    bounds = [0.0]
+    for i in range(1, parts):
+        target = duration * i / parts
+        # Nearest keyframe to the even split point, at least min_part frames after the last bound
+        candidates = [k for k in keyframes if k - bounds[-1] >= min_part / fps and duration - k >= min_part / fps]
+        if candidates:
+            bound = min(candidates, key=lambda k: abs(k - target))
+            if bound > bounds[-1]:
+                bounds.append(bound)
+    if len(bounds) < 2:
+        return whole
+    ends = bounds[1:] + [None]
+    return [(start, end, round(start * fps)) for start, end in zip(bounds, ends)]
+
+
+def _remove_background_parallel(input_path, output_path, bg_source, threshold, remove_voice,
+                                quality, feather, ranges, total_frames, on_progress, work_dir):
+    """Process frame ranges in separate processes and join them without re-encoding"""
+    progress = multiprocessing.get_context("spawn").Array("q", len(ranges))
+    parts = [os.path.join(work_dir, f"part_{i:03d}.mp4") for i in range(len(ranges))]
+
+    # spawn: forking a threaded web worker (sqlite, mediapipe) is not safe
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_range_worker, initargs=(progress,)) as pool:
+        futures = [
+            pool.submit(_remove_background_range, i, input_path, part, bg_source,
+                        threshold, quality, feather, start_time, end_time, start_index)
+            for i, (part, (start_time, end_time, start_index)) in enumerate(zip(parts, ranges))
+        ]
+        pending = futures
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_EXCEPTION)
+            if any(f.exception() for f in done):
+                for f in pending:
+                    f.cancel()
                 break
+            if on_progress:
+                on_progress(sum(progress[:]), total_frames)
+        errors = [f.exception() for f in futures if f.done() and not f.cancelled() and f.exception()]
+        if errors:
+            raise errors[0]
+        timings = [f.result() for f in futures]
 
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
-            result = segmenter.segment(mp_image)
-            mask = result.confidence_masks[0].numpy_view()
-            mask = (mask > threshold).astype(np.uint8)
+    concat_list = os.path.join(work_dir, "parts.txt")
+    with open(concat_list, "w") as f:
+        for part in parts:
+            f.write(f"file '{part}'\n")
 
-            if bg_video_cap:
-                ret2, bg = bg_video_cap.read()
-                if not ret2:
-                    bg_video_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    ret2, bg = bg_video_cap.read()
-                bg = cv2.resize(bg, (width, height))
-            else:
-                bg = bg_frame if bg_frame is not None else np.zeros_like(frame)
+    cmd = [FFMPEG, "-y", "-f", "concat", "-safe", "0", "-i", concat_list]
+    if remove_voice:
+        cmd += ["-map", "0:v:0", "-an"]
+    else:
+        cmd += ["-i", input_path, "-map", "0:v:0", "-map", "1:a:0?",
+                "-c:a", "aac", "-b:a", str(AUDIO_BITRATE), "-shortest"]
+    cmd += ["-c:v", "copy", "-movflags", "+faststart", output_path]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to join the processed parts: {result.stderr[-500:]}")
+    return timings
 
-            blended = frame * mask[:, :, None] + bg * (1 - mask[:, :, None])
-            blended = blended.astype(np.uint8)
 
-            writer.write(blended)
+def process_video_background(
+    input_path: str,
+    bg_source: dict | None,
+    threshold: float,
+    output_folder: str,
+    remove_voice: bool = False,
+    stats: dict | None = None,
+    quality: str = BG_REMOVAL_DEFAULT_QUALITY,
+    feather: float = 0.0,
+    on_progress=None,
+    parallel: bool = BG_PARALLEL,
+) -> str:
+    """Replace the background of input_path, returns the output file name.
 
+    When parallel is set, long inputs are split into keyframe-aligned time
+    ranges processed by separate processes (each with its own segmenter).
+    Off by default (BG_PARALLEL); measure with benchmarks/bench_bg_parallel.py
+    before enabling. on_progress is called with (frames done, total frames).
+    """
+    os.makedirs(output_folder, exist_ok=True)
+
+    cap = cv2.VideoCapture(input_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
     cap.release()
-    writer.release()
-    if bg_video_cap:
-        bg_video_cap.release()
 
-    # Final MP4 output
+    # Final MP4 output, encoded straight from the composited frames
     output_name = f"bg_removed_{uuid.uuid4().hex[:8]}.mp4"
     output_path = os.path.join(output_folder, output_name)
 
-    # Build ffmpeg command depending on remove_voice
-    if remove_voice:
-        # video only, no audio
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", temp_video,
-            "-c:v", "libx264",
-            "-preset", "fast",
-            "-an",
-            output_path,
-        ]
+    ranges = time_ranges(input_path, total_frames, fps) if parallel else [(0.0, None, 0)]
+    if len(ranges) > 1:
+        work_dir = os.path.join(os.path.abspath(output_folder), f".bg_parts_{uuid.uuid4().hex[:8]}")
+        os.makedirs(work_dir)
+        try:
+            timings = _remove_background_parallel(
+                input_path, output_path, bg_source, threshold, remove_voice,
+                quality, feather, ranges, total_frames, on_progress, work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
     else:
-        # keep audio from original
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", temp_video,
-            "-i", input_path,
-            "-map", "0:v:0",
-            "-map", "1:a:0?",
-            "-c:v", "libx264",
-            "-preset", "fast",
-            "-c:a", "aac",
-            "-shortest",
-            output_path,
-        ]
+        done = [0]
+        last_report = [0.0]
+
+        def on_frame():
+            done[0] += 1
+            now = time.monotonic()
+            if on_progress and now - last_report[0] >= 0.5:
+                last_report[0] = now
+                on_progress(done[0], total_frames)
 
-    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    os.remove(temp_video)
+        timings = remove_background_frames(input_path, output_path, bg_source, threshold,
+                                           remove_voice, quality, feather, on_frame=on_frame)
+    if on_progress:
+        on_progress(total_frames, total_frames)
+
+    print(f"Background removal timings ({len(ranges)} range(s)): {timings}")
+    if stats is not None:
+        stats["timings"] = timings
 
     return output_name
+
+
+def remove_background_task(task_id, input_path, **options):
+    """Scheduler job: process_video_background with progress in the task record.
+
+    Progress is frames processed out of the input's CAP_PROP_FRAME_COUNT.
+    """
+    tasks.update(task_id, status="processing", percent=0)
+
+    def on_progress(done, total):
+        tasks.update_progress(task_id, frames_done=done, total_frames=total,
+                              percent=percent_of(done, total))
+
+    try:
+        output_name = process_video_background(input_path, on_progress=on_progress, **options)
+    except ModelUnavailableError as e:
+        print("VIDEO BG MODEL ERROR:", e)
+        tasks.update(task_id, status="error", error="Background removal is not available")
+        return
+    except Exception as e:
+        print("VIDEO BG ERROR:", e)
+        tasks.update(task_id, status="error", error=str(e))
+        return
+
+    tasks.update(task_id, status="done", percent=100, file=output_name,
+                 download_url=f"/download-file/{output_name}")
@@ -0,0 +1,173 @@
+# services/video_preview.py
+
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import threading
+import cv2
+import numpy as np
+from config import (PREVIEW_FRAMES, PREVIEW_WIDTH, PREVIEW_FPS, PREVIEW_CACHE_DIR,
+                    PREVIEW_CACHE_MAX_MB, PREVIEW_INPUTS_DIR, PREVIEW_INPUT_LIFETIME_MINUTES)
+from services.media_index import index_key
+from services.segmentation_models import segmenter_pool
+from services.mask_tracker import MaskTracker
+from services.compositor import Compositor, BackgroundSource
+from services.video_ops_service import open_frame_encoder
+from utils.file_utils import evict_lru
+
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+_PREVIEW_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def register_input(input_path):
+    """Opaque preview_id for an input sent with a preview request.
+
+    Later previews and the final /process request send the id instead of
+    the file; it maps to this path only (never to a client-chosen name).
+    """
+    preview_id = uuid.uuid4().hex
+    os.makedirs(PREVIEW_INPUTS_DIR, exist_ok=True)
+    path = os.path.join(PREVIEW_INPUTS_DIR, f"{preview_id}.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"path": os.path.abspath(input_path)}, f)
+    os.replace(f"{path}.tmp", path)
+    return preview_id
+
+
+def resolve_input(preview_id):
+    """Input path of a preview_id, or None when it is unknown or expired"""
+    if not preview_id or not _PREVIEW_ID_RE.match(preview_id):
+        return None
+    path = os.path.join(PREVIEW_INPUTS_DIR, f"{preview_id}.json")
+    try:
+        with open(path) as f:
+            input_path = json.load(f)["path"]
+        os.utime(path)  # still in use: keep it past the lifetime
+    except (OSError, ValueError, KeyError):
+        return None
+    return input_path if os.path.isfile(input_path) else None
+
+
+def _sample_frames(input_path, count, width):
+    """`count` frames spread evenly over the input, scaled to `width` (even size)"""
+    cap = cv2.VideoCapture(input_path)
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        src_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        src_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if total <= 0 or src_width <= 0:
+            raise RuntimeError("Could not read the video")
+        out_width = min(width, src_width) // 2 * 2
+        out_height = max(2, round(src_height * out_width / src_width) // 2 * 2)
+
+        frames = []
+        for i in range(min(count, total)):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, total * (2 * i + 1) // (2 * min(count, total)))
+            ret, frame = cap.read()
+            if ret:
+                frames.append(cv2.resize(frame, (out_width, out_height), interpolation=cv2.INTER_AREA))
+        if not frames:
+            raise RuntimeError("Could not read the video")
+        return np.stack(frames)
+    finally:
+        cap.release()
+
+
+def preview_masks(input_path, count=PREVIEW_FRAMES, width=PREVIEW_WIDTH):
+    """(frames, confidence masks, cached) for the preview of input_path.
+
+    Sampled frames and their masks are cached on disk per input content, so
+    changing only the threshold, edge softness or background re-composites
+    without running inference again. Masks are stored as uint8 (0-255).
+    """
+    key = hashlib.sha256(f"{index_key(input_path)}:{count}:{width}".encode()).hexdigest()
+    path = os.path.join(PREVIEW_CACHE_DIR, f"{key}.npz")
+    with _build_locks_lock:
+        lock = _build_locks.setdefault(key, threading.Lock())
+
+    try:
+        with lock:
+            try:
+                with np.load(path) as data:
+                    frames, masks = data["frames"], data["masks"]
+                os.utime(path)  # mtime doubles as LRU recency
+                return frames, masks, True
+            except (OSError, ValueError, KeyError):
+                pass
+
+            frames = _sample_frames(input_path, count, width)
+            with segmenter_pool.acquire() as segmenter:
+                # Frames are far apart, so every one is inferred on its own
+                masks = np.stack([
+                    np.rint(MaskTracker(segmenter)(frame) * 255).astype(np.uint8) for frame in frames
+                ])
+
+            os.makedirs(PREVIEW_CACHE_DIR, exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, frames=frames, masks=masks)
+            os.replace(tmp, path)
+    finally:
+        with _build_locks_lock:
+            _build_locks.pop(key, None)
+    return frames, masks, False
+
+
+def render_preview(input_path, bg_source, threshold, output_folder, feather=0.0):
+    """Small silent MP4 of the sampled frames with the background replaced.
+
+    Returns (output file name, whether the masks came from the cache).
+    """
+    frames, masks, cached = preview_masks(input_path)
+    height, width = frames.shape[1:3]
+
+    output_name = f"bg_preview_{uuid.uuid4().hex[:8]}.mp4"
+    output_path = os.path.join(output_folder, output_name)
+    # Only a handful of background frames are needed: stream them rather
+    # than decoding the whole asset into the shared cache
+    background = BackgroundSource(bg_source, width, height, ring=2, use_cache=False)
+    compositor = Compositor(width, height, threshold, feather, ring=2)
+    confidence = np.empty((height, width), dtype=np.float32)
+
+    encoder = open_frame_encoder(input_path, output_path, width, height, PREVIEW_FPS, remove_voice=True)
+    try:
+        for i, (frame, mask) in enumerate(zip(frames, masks)):
+            np.multiply(mask, 1 / 255, out=confidence)
+            out = compositor.composite(frame, confidence, background.frame(i))
+            encoder.stdin.write(out.data)
+    except BaseException:
+        encoder.kill()
+        raise
+    finally:
+        background.release()
+        try:
+            encoder.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = encoder.wait()
+
+    if returncode != 0 or not os.path.exists(output_path):
+        raise RuntimeError("ffmpeg failed to encode the preview")
+    return output_name, cached
+
+
+def evict(max_bytes=PREVIEW_CACHE_MAX_MB * 1024 * 1024,
+          input_lifetime=PREVIEW_INPUT_LIFETIME_MINUTES * 60):
+    """Keep cached preview frames and masks within their size budget (LRU)
+    and forget preview_ids unused for input_lifetime seconds"""
+    removed = evict_lru(PREVIEW_CACHE_DIR, max_bytes)
+    if os.path.isdir(PREVIEW_INPUTS_DIR):
+        cutoff = time.time() - input_lifetime
+        for name in os.listdir(PREVIEW_INPUTS_DIR):
+            path = os.path.join(PREVIEW_INPUTS_DIR, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
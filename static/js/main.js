@@ -1,6 +1,8 @@
 async function startCompression() {
   const files = document.getElementById("videos").files;
   const codec = document.getElementById("codec").value;
+  const targetSize = document.getElementById("target-size").value;
+  const twoPass = document.getElementById("two-pass").checked;
 
   if (!files.length) {
     alert("Please select at least one video.");
@@ -26,12 +28,41 @@ async function startCompression() {
     fileProgress[files[i].name] = i;
   }
 
+  // A single file is sent as one stream: the server encodes large,
+  // pipe-readable files while they upload and queues the rest like /start
+  // (target-size encodes need the whole file for sampling)
+  if (files.length === 1 && !targetSize) {
+    try {
+      await startStreamUpload(files[0], codec, fileProgress);
+    } catch (error) {
+      alert("Error: " + error.message);
+    }
+    return;
+  }
+
   // Upload files via FormData
   const formData = new FormData();
-  for (let file of files) {
-    formData.append("videos", file);
-  }
   formData.append("codec", codec);
+  if (targetSize) {
+    // Upload first and show the estimate, so the user confirms before encoding
+    let uploadIds;
+    try {
+      uploadIds = await estimateBeforeEncode(files, codec, targetSize, twoPass);
+    } catch (error) {
+      alert("Error: " + error.message);
+      return;
+    }
+    if (!uploadIds) return;
+    for (let uploadId of uploadIds) {
+      formData.append("upload_id", uploadId);
+    }
+    formData.append("target_size_mb", targetSize);
+    if (twoPass) formData.append("two_pass", "1");
+  } else {
+    for (let file of files) {
+      formData.append("videos", file);
+    }
+  }
 
   // Start compression
   try {
@@ -48,94 +79,227 @@ async function startCompression() {
     const data = await response.json();
     const taskId = data.task_id;
 
-    // Start polling for progress
-    pollProgress(taskId, fileProgress);
+    // Follow progress (SSE, or polling as a fallback)
+    watchProgress(taskId, fileProgress);
   } catch (error) {
     alert("Error: " + error.message);
   }
 }
 
+// Map a saved filename (name_xxxxxxxx.ext) back to its progress bar index
+function progressIndex(savedName, fileProgress, fallback) {
+  const originalNameMatch = savedName.match(
+    /^(.+)_[a-f0-9]{8}\.(mp4|mov|avi|mkv|webm)$/i
+  );
+  const displayName = originalNameMatch
+    ? `${originalNameMatch[1]}.${originalNameMatch[2]}`
+    : savedName;
+  return displayName in fileProgress ? fileProgress[displayName] : fallback;
+}
+
+// Update every file's bar from the task's per-file progress list
+function renderFileProgress(status, fileProgress) {
+  (status.progress || []).forEach((entry, i) => {
+    const idx = progressIndex(entry.file, fileProgress, i);
+    const progressBar = document.getElementById(`progress-${idx}`);
+    const percentSpan = document.getElementById(`percent-${idx}`);
+    const statusSpan = document.getElementById(`status-${idx}`);
+    if (!progressBar) return;
+
+    progressBar.value = entry.percent;
+    if (entry.status === "done") {
+      percentSpan.innerText = "100% - Done";
+      statusSpan.innerText = "Completed!";
+    } else if (entry.status === "error") {
+      percentSpan.innerText = "Failed";
+      statusSpan.innerText = entry.error || "Compression failed";
+    } else if (entry.status === "estimating") {
+      percentSpan.innerText = "0% - Estimating";
+      statusSpan.innerText = "Sampling to estimate size...";
+    } else if (entry.status === "processing") {
+      percentSpan.innerText = `${entry.percent}% - Processing`;
+      if (entry.estimate) {
+        statusSpan.innerText = formatEstimate(entry.estimate);
+      } else {
+        statusSpan.innerText =
+          entry.path && entry.path.video === "copy"
+            ? "Already compact, remuxing..."
+            : "Processing...";
+      }
+    } else {
+      percentSpan.innerText = "0% - Waiting";
+      statusSpan.innerText = "Pending...";
+    }
+  });
+}
+
+// "Expected ~48.2 MB in ~1m 30s" from a target-size estimate
+function formatEstimate(estimate) {
+  const mb = (estimate.predicted_bytes / (1024 * 1024)).toFixed(1);
+  const seconds = Math.round(estimate.encode_seconds);
+  const time =
+    seconds >= 60 ? `${Math.floor(seconds / 60)}m ${seconds % 60}s` : `${seconds}s`;
+  return `Expected ~${mb} MB in ~${time}`;
+}
+
+// Send a file through the resumable upload API, returns its upload_id
+async function resumableUpload(file, onProgress) {
+  const init = await fetch("/api/uploads", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ filename: file.name, size: file.size }),
+  });
+  const upload = await init.json();
+  if (!init.ok) throw new Error(upload.error || "Upload failed");
+
+  for (let offset = 0; offset < file.size; offset += upload.chunk_size) {
+    const res = await fetch(`/api/uploads/${upload.upload_id}?offset=${offset}`, {
+      method: "PUT",
+      body: file.slice(offset, offset + upload.chunk_size),
+    });
+    if (!res.ok) {
+      const error = await res.json();
+      throw new Error(error.error || "Upload failed");
+    }
+    onProgress(Math.min(100, Math.round(((offset + upload.chunk_size) / file.size) * 100)));
+  }
+
+  const done = await fetch(`/api/uploads/${upload.upload_id}/finalize`, { method: "POST" });
+  if (!done.ok) {
+    const error = await done.json();
+    throw new Error(error.error || "Upload failed");
+  }
+  return upload.upload_id;
+}
+
+// Upload every file, estimate its target-size encode and ask for confirmation.
+// Returns the upload ids to start with, or null when the user cancels.
+async function estimateBeforeEncode(files, codec, targetSize, twoPass) {
+  const uploadIds = [];
+  const estimates = [];
+  for (let i = 0; i < files.length; i++) {
+    const statusSpan = document.getElementById(`status-${i}`);
+    const uploadId = await resumableUpload(files[i], (percent) => {
+      statusSpan.innerText = `Uploading... ${percent}%`;
+    });
+    statusSpan.innerText = "Sampling to estimate size...";
+
+    const res = await fetch("/estimate-size", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        upload_id: uploadId,
+        codec: codec,
+        target_size_mb: targetSize,
+        two_pass: twoPass,
+      }),
+    });
+    const estimate = await res.json();
+    if (!res.ok) throw new Error(estimate.error || "Could not estimate the size");
+
+    statusSpan.innerText = formatEstimate(estimate);
+    uploadIds.push(uploadId);
+    estimates.push(`${files[i].name}: ${formatEstimate(estimate)}`);
+  }
+  return confirm(`${estimates.join("\n")}\n\nStart compression?`) ? uploadIds : null;
+}
+
+// Create a streaming task, follow its progress, then PUT the raw file body
+async function startStreamUpload(file, codec, fileProgress) {
+  const response = await fetch("/start-stream", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ filename: file.name, codec: codec }),
+  });
+  const data = await response.json();
+  if (!response.ok) {
+    throw new Error(data.error || "Failed to start compression");
+  }
+
+  watchProgress(data.task_id, fileProgress);
+
+  const upload = await fetch(data.upload_url, { method: "PUT", body: file });
+  if (!upload.ok) {
+    const error = await upload.json();
+    throw new Error(error.error || "Upload failed");
+  }
+}
+
+// Apply one status update to the page, returns true once the task has finished
+function handleStatus(status, fileProgress) {
+  if (status.status === "uploading") {
+    const statusSpan = document.getElementById("status-0");
+    if (statusSpan) statusSpan.innerText = "Uploading...";
+  } else if (status.status === "queued") {
+    // Waiting for a free worker
+    for (let i = 0; i < status.total; i++) {
+      const statusSpan = document.getElementById(`status-${i}`);
+      if (statusSpan) {
+        statusSpan.innerText = status.queue_position
+          ? `Queued (position ${status.queue_position})...`
+          : "Queued...";
+      }
+    }
+  } else if (status.status === "processing") {
+    renderFileProgress(status, fileProgress);
+  } else if (status.status === "done") {
+    renderFileProgress(status, fileProgress);
+
+    // Show download links
+    const downloadsDiv = document.getElementById("downloads");
+    downloadsDiv.innerHTML = "<h4>Download Links:</h4>";
+
+    for (let file of status.files) {
+      const a = document.createElement("a");
+      a.href = `/download/${file}`;
+      a.innerText = `Download: ${file}`;
+      a.className = "download-link";
+      a.download = file;
+      downloadsDiv.appendChild(a);
+      downloadsDiv.appendChild(document.createElement("br"));
+    }
+    return true;
+  } else if (status.status === "error") {
+    alert("Compression failed: " + (status.error || "Unknown error"));
+    return true;
+  }
+  return false;
+}
+
+// Follow progress over Server-Sent Events, falling back to polling
+function watchProgress(taskId, fileProgress) {
+  if (!window.EventSource) {
+    pollProgress(taskId, fileProgress);
+    return;
+  }
+
+  const source = new EventSource(`/events/${taskId}`);
+  let finished = false;
+  const onStatus = (e) => {
+    finished = handleStatus(JSON.parse(e.data), fileProgress);
+    if (finished) source.close();
+  };
+  source.onmessage = onStatus;
+  source.addEventListener("done", onStatus);
+  source.addEventListener("error", (e) => {
+    if (e.data) {
+      onStatus(e);
+    } else if (!finished && source.readyState === EventSource.CLOSED) {
+      // Refused (too many streams) or failed: switch to polling /status.
+      // While CONNECTING the server just ended the stream and it reconnects.
+      pollProgress(taskId, fileProgress);
+    }
+  });
+}
+
 async function pollProgress(taskId, fileProgress) {
   const interval = setInterval(async () => {
     try {
       const res = await fetch(`/status/${taskId}`);
       const status = await res.json();
 
-      if (status.status === "processing") {
-        // Find which file is being processed
-        const currentFile = status.file;
-
-        if (currentFile) {
-          // Find the original filename (remove the unique ID)
-          const originalNameMatch = currentFile.match(
-            /^(.+)_[a-f0-9]{8}\.(mp4|mov|avi|mkv|webm)$/i
-          );
-          const displayName = originalNameMatch
-            ? `${originalNameMatch[1]}.${originalNameMatch[2]}`
-            : currentFile;
-
-          // Update all progress bars
-          for (let i = 0; i < status.total; i++) {
-            const progressBar = document.getElementById(`progress-${i}`);
-            const percentSpan = document.getElementById(`percent-${i}`);
-            const statusSpan = document.getElementById(`status-${i}`);
-
-            if (i < status.current - 1) {
-              // Files already processed
-              progressBar.value = 100;
-              percentSpan.innerText = "100% - Done";
-              statusSpan.innerText = "Completed!";
-            } else if (i === status.current - 1) {
-              // Current file being processed
-              progressBar.value = status.percent;
-              percentSpan.innerText = `${status.percent}% - Processing`;
-
-              // When this one reaches 100%, mark as completed
-              if (status.percent >= 100) {
-                statusSpan.innerText = "Completed!";
-              } else {
-                // Still processing
-                statusSpan.innerText = "Processing...";
-              }
-            } else {
-              // Files not yet processed
-              progressBar.value = 0;
-              percentSpan.innerText = "0% - Waiting";
-              // Keep them as Pending... until they start
-              statusSpan.innerText = "Pending...";
-            }
-          }
-        }
-      } else if (status.status === "done") {
-        clearInterval(interval);
-
-        // Set all progress bars to 100%
-        for (let i = 0; i < status.total; i++) {
-          const progressBar = document.getElementById(`progress-${i}`);
-          const percentSpan = document.getElementById(`percent-${i}`);
-          const statusSpan = document.getElementById(`status-${i}`);
-
-          progressBar.value = 100;
-          percentSpan.innerText = "100% - Done";
-          statusSpan.innerText = "Completed!";
-        }
-
-        // Show download links
-        const downloadsDiv = document.getElementById("downloads");
-        downloadsDiv.innerHTML = "<h4>Download Links:</h4>";
-
-        for (let file of status.files) {
-          const a = document.createElement("a");
-          a.href = `/download/${file}`;
-          a.innerText = `Download: ${file}`;
-          a.className = "download-link";
-          a.download = file;
-          downloadsDiv.appendChild(a);
-          downloadsDiv.appendChild(document.createElement("br"));
-        }
-      } else if (status.status === "error") {
+      if (handleStatus(status, fileProgress)) {
         clearInterval(interval);
-        alert("Compression failed: " + (status.error || "Unknown error"));
       }
     } catch (error) {
       console.error("Error polling status:", error);
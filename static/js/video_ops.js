@@ -7,10 +7,17 @@ document.addEventListener("DOMContentLoaded", () => {
     const removeBtn = document.getElementById("remove-video");
     const thresholdSlider = document.getElementById("thresholdSlider");
     const thresholdValue = document.getElementById("thresholdValue");
+    const previewBtn = document.getElementById("previewBtn");
+    const previewDiv = document.getElementById("bgPreview");
+
+    // Set after the first preview: the server keeps the video (and its masks),
+    // so later previews and the final run do not upload it again
+    let previewId = null;
 
     // Video preview
     videoFileInput.addEventListener("change", (e) => {
         const file = e.target.files[0];
+        previewId = null;
         if (file) {
             const url = URL.createObjectURL(file);
             videoPreview.src = url;
@@ -39,7 +46,7 @@ document.addEventListener("DOMContentLoaded", () => {
         e.preventDefault();
         resultDiv.textContent = "Processing...";
 
-        const formData = new FormData(form);
+        const formData = buildFormData();
 
         const removeVoiceCheckbox = form.querySelector('input[name="remove_voice"]');
         if (removeVoiceCheckbox && removeVoiceCheckbox.checked) {
@@ -62,22 +69,119 @@ document.addEventListener("DOMContentLoaded", () => {
                 return;
             }
 
-            const downloadUrl = data.download_url || `/download/${encodeURIComponent(data.file)}`;
+            resultDiv.textContent = data.queue_position
+                ? `Queued (position ${data.queue_position})...`
+                : "Queued...";
+            watchBackgroundTask(data.task_id);
+        } catch (err) {
+            console.error("REQUEST ERROR:", err);
+            resultDiv.textContent = "Request failed. Check console.";
+        }
+    });
+
+    // Form fields, sending the preview id instead of the video when there is one
+    function buildFormData() {
+        const formData = new FormData(form);
+        if (previewId) {
+            formData.delete("video_file");
+            formData.set("preview_id", previewId);
+        }
+        return formData;
+    }
+
+    // Low-resolution preview of a few sampled frames
+    if (previewBtn) {
+        previewBtn.addEventListener("click", async () => {
+            previewBtn.disabled = true;
+            previewDiv.textContent = "Rendering preview...";
+            try {
+                const res = await fetch("/api/video-ops/preview", {
+                    method: "POST",
+                    body: buildFormData()
+                });
+                const data = await res.json();
+                if (!res.ok || data.error) {
+                    previewDiv.textContent = "Preview failed: " + (data.error || "Unknown error");
+                    return;
+                }
+                previewId = data.preview_id;
+                previewDiv.innerHTML = `
+                    <p>Preview (sampled frames):</p>
+                    <video src="${data.preview_url}" autoplay loop muted playsinline width="400"></video>
+                `;
+            } catch (err) {
+                console.error("PREVIEW ERROR:", err);
+                previewDiv.textContent = "Preview request failed. Check console.";
+            } finally {
+                previewBtn.disabled = false;
+            }
+        });
+    }
 
+    // Show one task update, returns true once the task has finished
+    function showTaskStatus(task) {
+        if (task.status === "queued") {
+            resultDiv.textContent = task.queue_position
+                ? `Queued (position ${task.queue_position})...`
+                : "Queued...";
+        } else if (task.status === "processing") {
+            resultDiv.textContent = task.total_frames
+                ? `Processing... ${task.percent}% (${task.frames_done}/${task.total_frames} frames)`
+                : "Processing...";
+        } else if (task.status === "done") {
+            const downloadUrl = task.download_url || `/download/${encodeURIComponent(task.file)}`;
             resultDiv.innerHTML = `
                 <p>Done!</p>
                 <a href="${downloadUrl}" download>Download processed video</a>
             `;
-        } catch (err) {
-            console.error("REQUEST ERROR:", err);
-            resultDiv.textContent = "Request failed. Check console.";
+            return true;
+        } else if (task.status === "error") {
+            resultDiv.textContent = "Error: " + (task.error || "Unknown error");
+            return true;
         }
-    });
+        return false;
+    }
+
+    // Follow the task over Server-Sent Events, falling back to polling /status
+    function watchBackgroundTask(taskId) {
+        const poll = () => {
+            const interval = setInterval(async () => {
+                try {
+                    const res = await fetch(`/status/${taskId}`);
+                    if (showTaskStatus(await res.json())) clearInterval(interval);
+                } catch (err) {
+                    console.error("Error polling status:", err);
+                }
+            }, 1000);
+        };
+
+        if (!window.EventSource) {
+            poll();
+            return;
+        }
+        const source = new EventSource(`/events/${taskId}`);
+        let finished = false;
+        const onStatus = (e) => {
+            finished = showTaskStatus(JSON.parse(e.data));
+            if (finished) source.close();
+        };
+        source.onmessage = onStatus;
+        source.addEventListener("done", onStatus);
+        source.addEventListener("error", (e) => {
+            if (e.data) {
+                onStatus(e);
+            } else if (!finished && source.readyState === EventSource.CLOSED) {
+                // Refused or failed; while CONNECTING it reconnects by itself
+                poll();
+            }
+        });
+    }
 
     // Remove/reset logic for uploaded video
     if (removeBtn) {
         removeBtn.addEventListener("click", () => {
             videoFileInput.value = "";
+            previewId = null;
             videoPreview.src = "";
             videoPreview.load();
 
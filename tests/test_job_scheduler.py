@@ -0,0 +1,24 @@
+# tests/test_job_scheduler.py
+
+import threading
+import pytest
+from workers.job_scheduler import JobScheduler, QueueFullError
+
+
+def test_preview_pool_is_not_blocked_by_long_jobs():
+    jobs = JobScheduler(1, 2)
+    previews = JobScheduler(1, 2, name="preview")
+    release = threading.Event()
+    running = [jobs.submit(f"long-{i}", release.wait, 5) for i in range(2)]
+
+    try:
+        assert previews.run("preview:a", lambda: "frames") == "frames"
+    finally:
+        release.set()
+    assert all(future.result(timeout=5) for future in running)
+
+
+def test_full_queue_refuses_work():
+    jobs = JobScheduler(1, 0)
+    with pytest.raises(QueueFullError):
+        jobs.run("x", lambda: None)
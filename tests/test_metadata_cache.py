@@ -0,0 +1,131 @@
+# tests/test_metadata_cache.py
+
+import time
+import threading
+import pytest
+from services.metadata_cache import MetadataCache, normalize_url
+
+
+class StubExtract:
+    """extract() stand-in that counts calls and can block or fail"""
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {"url": url, "formats": [{"format_id": "18"}]}
+
+
+def make_cache(**kwargs):
+    kwargs.setdefault("ttl", 60)
+    kwargs.setdefault("size", 8)
+    kwargs.setdefault("persist", False)
+    return MetadataCache(**kwargs)
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=abc123&feature=share",
+    "http://youtube.com/watch?si=xyz&v=abc123",
+    "https://m.youtube.com/watch?v=abc123&pp=ygU",
+    "https://youtu.be/abc123?si=xyz",
+    "https://www.youtube.com/shorts/abc123",
+    "https://youtube.com/embed/abc123#t=10",
+])
+def test_normalize_youtube_variants(url):
+    assert normalize_url(url) == "https://youtube.com/watch?v=abc123"
+
+
+def test_normalize_strips_global_trackers_and_sorts_query():
+    assert (normalize_url("HTTP://WWW.Example.com/video/?b=2&utm_source=x&a=1&fbclid=f#frag")
+            == "https://example.com/video?a=1&b=2")
+
+
+def test_normalize_keeps_site_specific_params_on_other_hosts():
+    assert normalize_url("https://example.com/v?ref=1") != normalize_url("https://example.com/v?ref=2")
+    assert normalize_url("https://example.com/v?feature=a") == "https://example.com/v?feature=a"
+
+
+def test_normalize_strips_host_trackers():
+    assert normalize_url("https://www.instagram.com/reel/xyz/?igsh=abc") == "https://instagram.com/reel/xyz"
+    assert normalize_url("https://x.com/u/status/1?s=20") == "https://x.com/u/status/1"
+
+
+def test_get_caches_and_returns_copies():
+    cache = make_cache()
+    extract = StubExtract()
+    first = cache.get("https://youtu.be/abc123", extract)
+    first["formats"].clear()
+    second = cache.get("https://www.youtube.com/watch?v=abc123", extract)
+    assert extract.calls == 1
+    assert second["formats"] == [{"format_id": "18"}]
+    assert cache.stats()["hits"] == 1
+
+
+def test_singleflight_runs_one_extraction():
+    cache = make_cache()
+    extract = StubExtract(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("https://example.com/v", extract)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert extract.calls == 1
+    assert len(results) == 8
+    assert all(r == results[0] for r in results)
+    assert len({id(r) for r in results}) == 8
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["coalesced"] == 7 and stats["inflight"] == 0
+
+
+def test_singleflight_propagates_errors_and_caches_nothing():
+    cache = make_cache()
+    extract = StubExtract(delay=0.2, error=RuntimeError("extraction failed"))
+    errors = []
+
+    def lookup():
+        try:
+            cache.get("https://example.com/v", extract)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=lookup) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert extract.calls == 1
+    assert len(errors) == 4
+    assert cache.stats()["entries"] == 0
+
+    retry = StubExtract()
+    assert cache.get("https://example.com/v", retry)["url"] == "https://example.com/v"
+    assert retry.calls == 1
+
+
+def test_expired_entries_are_extracted_again():
+    cache = make_cache(ttl=0.05)
+    extract = StubExtract()
+    cache.get("https://example.com/v", extract)
+    time.sleep(0.1)
+    cache.get("https://example.com/v", extract)
+    assert extract.calls == 2
+    assert cache.stats()["expired"] == 1
+
+
+def test_persisted_entries_are_shared(tmp_path):
+    extract = StubExtract()
+    make_cache(persist=True, directory=str(tmp_path)).get("https://example.com/v", extract)
+    other = make_cache(persist=True, directory=str(tmp_path))
+    assert other.get("https://example.com/v", extract)["url"] == "https://example.com/v"
+    assert extract.calls == 1
+    assert other.stats()["disk_hits"] == 1
@@ -0,0 +1,79 @@
+# tests/test_stream_ingest.py
+
+import io
+import os
+import time
+import pytest
+from services import stream_ingest, result_cache
+from services.task_store import MemoryTaskStore
+
+PLAN = {"video": "encode", "audio": "encode"}
+
+
+class SlowBody(io.RawIOBase):
+    """Request body that arrives in small pieces"""
+
+    def __init__(self, data, delay=0.002):
+        self.data = data
+        self.pos = 0
+        self.delay = delay
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        time.sleep(self.delay)
+        size = 64 * 1024 if size < 0 else min(size, 64 * 1024)
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+@pytest.fixture
+def ingest(tmp_path, monkeypatch):
+    store = MemoryTaskStore()
+    monkeypatch.setattr(stream_ingest, "tasks", store)
+    monkeypatch.setattr(stream_ingest, "_stream_plan", lambda head, length, codec: PLAN)
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_DIR", str(tmp_path / "results"))
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    output_dir.mkdir()
+
+    def run(data, command):
+        # The "encoder" copies stdin to the output, or fails
+        monkeypatch.setattr(stream_ingest, "build_compress_command",
+                            lambda src, dst, codec, threads, plan: ["sh", "-c", command.format(dst=dst)])
+        store.create("t", {"status": "uploading"})
+        mode = stream_ingest.ingest_upload("t", "clip.mkv", "libx264", SlowBody(data), len(data),
+                                           str(input_dir), str(output_dir))
+        for _ in range(200):
+            if store.get("t")["status"] in ("done", "error"):
+                break
+            time.sleep(0.02)
+        return mode, store.get("t"), output_dir / "compressed_clip.mkv", input_dir / "clip.mkv"
+
+    return run
+
+
+def test_streams_from_the_spool_and_caches_the_result(ingest):
+    data = b"\x1a\x45\xdf\xa3" + os.urandom(2 * 1024 * 1024)
+    mode, task, output, spool = ingest(data, "cat > {dst}")
+    assert mode == "streaming"
+    assert task["status"] == "done"
+    assert output.read_bytes() == data
+    assert not spool.exists()
+
+    # Same content again: the encode is cut short and the cached output is linked
+    output.unlink()
+    mode, task, output, _ = ingest(data, "head -c 10 > {dst}; cat > /dev/null")
+    assert task["status"] == "done" and task["progress"][0]["cached"]
+    assert output.read_bytes() == data
+
+
+def test_encoder_failure_ends_the_upload(ingest):
+    data = b"\x1a\x45\xdf\xa3" + os.urandom(4 * 1024 * 1024)
+    mode, task, output, spool = ingest(data, "head -c 10 > /dev/null; exit 1")
+    assert mode == "streaming"
+    assert task["status"] == "error"
+    assert not output.exists()
+    assert not spool.exists()
@@ -0,0 +1,39 @@
+# tests/test_task_store.py
+
+import time
+import threading
+from services.task_store import SQLiteTaskStore, MemoryTaskStore
+
+
+def test_buffered_progress_reaches_other_processes(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    writer = SQLiteTaskStore(path=path, flush_interval=0.1)
+    reader = SQLiteTaskStore(path=path, flush_interval=0.1)  # stands in for another worker
+    writer.create("t", {"status": "processing", "percent": 0})
+
+    writer.update_progress("t", percent=10)
+    writer.update_progress("t", percent=20)
+    assert reader.get("t")["percent"] == 10
+
+    time.sleep(0.4)
+    assert reader.get("t")["percent"] == 20
+
+
+def test_wait_for_change_only_wakes_that_task():
+    store = MemoryTaskStore()
+    store.create("a", {"status": "processing"})
+    store.create("b", {"status": "processing"})
+    version = store.wait_for_change("a", -1, 0)
+
+    timer = threading.Timer(0.05, lambda: store.update("b", status="done"))
+    timer.start()
+    started = time.monotonic()
+    assert store.wait_for_change("a", version, 0.3) == version
+    assert time.monotonic() - started >= 0.3
+
+    timer = threading.Timer(0.05, lambda: store.update("a", status="done"))
+    timer.start()
+    started = time.monotonic()
+    assert store.wait_for_change("a", version, 5) != version
+    assert time.monotonic() - started < 1
+    assert not store._waiters
@@ -0,0 +1,44 @@
+# tests/test_upload_service.py
+
+import io
+import pytest
+from services import upload_service
+from services.upload_service import (UploadError, create_upload, write_chunk, finalize_upload,
+                                     claim_uploads, release_uploads, get_upload)
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_service, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(upload_service, "META_DIR", str(tmp_path / ".uploads"))
+    return tmp_path
+
+
+def finished_upload(data=b"video bytes"):
+    upload_id = create_upload("clip.mp4", len(data))["upload_id"]
+    write_chunk(upload_id, 0, io.BytesIO(data))
+    finalize_upload(upload_id)
+    return upload_id
+
+
+def test_invalid_id_claims_nothing():
+    first, second = finished_upload(), finished_upload()
+    unfinished = create_upload("clip.mp4", 10)["upload_id"]
+    with pytest.raises(UploadError):
+        claim_uploads([first, unfinished, second])
+    with pytest.raises(UploadError):
+        claim_uploads([first, "0" * 32])
+    # Both finished uploads are still there to start with
+    assert len(claim_uploads([first, second])) == 2
+
+
+def test_released_upload_can_be_claimed_again(upload_dir):
+    upload_id = finished_upload()
+    filename, = claim_uploads([upload_id])
+    with pytest.raises(UploadError):
+        get_upload(upload_id)
+
+    release_uploads([upload_id])
+    assert get_upload(upload_id)["complete"]
+    assert claim_uploads([upload_id]) == [filename]
+    assert (upload_dir / filename).read_bytes() == b"video bytes"
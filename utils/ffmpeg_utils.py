@@ -0,0 +1,31 @@
+# utils/ffmpeg_utils.py
+
+import subprocess
+
+
+def run_with_progress(cmd, on_time=None, stdin=None):
+    """Run an ffmpeg command that has "-progress pipe:1" and report progress.
+
+    on_time is called with the encoded position in seconds every time ffmpeg
+    reports out_time_ms. Returns the process return code.
+    """
+    process = subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True, bufsize=1)
+
+    for line in process.stdout:
+        line = line.strip()
+        if line.startswith("out_time_ms=") and on_time:
+            try:
+                seconds = int(line.split("=")[1]) / 1_000_000
+            except ValueError:
+                continue
+            on_time(max(seconds, 0))
+
+    return process.wait()
+
+
+def percent_of(seconds, duration):
+    """Bounded integer percentage of duration"""
+    if duration <= 0:
+        return 0
+    return max(0, min(int(seconds / duration * 100), 100))
@@ -1,9 +1,86 @@
 # utils/file_utils.py
 
+import io
 import os
 import uuid
+import hashlib
+import zipfile
+import threading
+from collections import OrderedDict
 from config import UPLOAD_DIR, ALLOWED_EXTENSIONS
 
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Content hashes computed while uploads were written (path -> sha256 hex)
+_content_hashes = OrderedDict()
+_content_hashes_lock = threading.Lock()
+_MAX_REMEMBERED_HASHES = 1024
+
+
+def remember_content_hash(path, digest):
+    """Record the content hash of a file written by this process"""
+    with _content_hashes_lock:
+        _content_hashes[os.path.abspath(path)] = digest
+        while len(_content_hashes) > _MAX_REMEMBERED_HASHES:
+            _content_hashes.popitem(last=False)
+
+
+def known_content_hash(path):
+    """Content hash recorded for path by this process, without hashing the file"""
+    with _content_hashes_lock:
+        return _content_hashes.get(os.path.abspath(path))
+
+
+def get_content_hash(path):
+    """sha256 of a file, reusing the hash computed at upload time when known"""
+    with _content_hashes_lock:
+        digest = _content_hashes.get(os.path.abspath(path))
+    if digest:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    remember_content_hash(path, digest)
+    return digest
+
+
+def evict_lru(directory, max_bytes):
+    """Delete the least recently modified files in directory until it fits in max_bytes"""
+    if not os.path.isdir(directory):
+        return 0
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError as e:
+            print(f"Error evicting {path}: {e}")
+    return removed
+
+
+def unique_upload_name(original_name):
+    """name.ext -> name_<8 hex>.ext so uploads never collide"""
+    unique_id = str(uuid.uuid4())[:8]  # Short unique ID
+    name_part, ext_part = os.path.splitext(os.path.basename(original_name))
+    return f"{name_part}_{unique_id}{ext_part}"
+
+
 def save_uploaded_files(files, upload_dir):
     """Save uploaded files to disk and return their names"""
     os.makedirs(upload_dir, exist_ok=True)
@@ -20,17 +97,53 @@ def save_uploaded_files(files, upload_dir):
         
         # Generate unique filename to avoid duplicates
         original_name = file.filename
-        unique_id = str(uuid.uuid4())[:8]  # Short unique ID
-        name_part, ext_part = os.path.splitext(original_name)
-        unique_filename = f"{name_part}_{unique_id}{ext_part}"
+        unique_filename = unique_upload_name(original_name)
         
-        # Save file with unique name
+        # Stream to disk, hashing the content on the way for the result cache
         save_path = os.path.join(upload_dir, unique_filename)
-        file.save(save_path)
+        sha = hashlib.sha256()
+        with open(save_path, "wb") as out:
+            for chunk in iter(lambda: file.stream.read(HASH_CHUNK_SIZE), b""):
+                sha.update(chunk)
+                out.write(chunk)
         
         # Verify file was saved
         if os.path.exists(save_path):
+            remember_content_hash(save_path, sha.hexdigest())
             filenames.append(unique_filename)
             print(f"Saved: {original_name} as {unique_filename}")
     
     return filenames
+
+
+class _ZipBuffer(io.RawIOBase):
+    """Write-only sink that lets zipfile write to a non-seekable stream"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+    def take(self):
+        chunk = bytes(self.data)
+        self.data.clear()
+        return chunk
+
+
+def iter_zip(paths):
+    """Yield a stored (uncompressed) zip of paths chunk by chunk, without a temp file"""
+    sink = _ZipBuffer()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        for path in paths:
+            info = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+            with open(path, "rb") as src, archive.open(info, "w", force_zip64=True) as dst:
+                for chunk in iter(lambda: src.read(HASH_CHUNK_SIZE), b""):
+                    dst.write(chunk)
+                    yield sink.take()
+        yield sink.take()
+    yield sink.take()
@@ -0,0 +1,115 @@
+# utils/frame_pipeline.py
+
+import time
+import queue
+import threading
+
+_DONE = object()
+
+
+class FramePipeline:
+    """Run a frame source and a chain of stages, each in its own thread.
+
+    Stages are connected by bounded queues, so a slow stage applies
+    backpressure instead of buffering the whole video. Every stage is a single
+    thread reading its queue in FIFO order, which keeps frames in order. Each
+    stage's busy time is recorded in `timings` to show the bottleneck.
+    """
+
+    def __init__(self, source, stages, queue_size=8, source_name="decode"):
+        self.source = source   # iterable of items
+        self.stages = stages   # [(name, fn(item) -> item), ...]; the last stage's result is dropped
+        self.queue_size = queue_size
+        self.timings = {name: {"seconds": 0.0, "frames": 0}
+                        for name in [source_name] + [name for name, _ in stages]}
+        self._source_name = source_name
+        self._stop = threading.Event()
+        self._error = None
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _run_source(self, outbox):
+        timing = self.timings[self._source_name]
+        try:
+            items = iter(self.source)
+            while True:
+                started = time.perf_counter()
+                item = next(items, _DONE)
+                if item is _DONE:
+                    break
+                timing["seconds"] += time.perf_counter() - started
+                timing["frames"] += 1
+                if not self._put(outbox, item):
+                    break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(outbox, _DONE)
+
+    def _run_stage(self, name, fn, inbox, outbox):
+        timing = self.timings[name]
+        try:
+            while True:
+                item = self._get(inbox)
+                if item is _DONE:
+                    break
+                started = time.perf_counter()
+                result = fn(item)
+                timing["seconds"] += time.perf_counter() - started
+                timing["frames"] += 1
+                if outbox is not None and not self._put(outbox, result):
+                    break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            if outbox is not None:
+                self._put(outbox, _DONE)
+
+    def run(self):
+        """Process every item; re-raises the first stage error. Returns timings."""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [threading.Thread(target=self._run_source, args=(queues[0],),
+                                    name=f"pipeline-{self._source_name}", daemon=True)]
+        for i, (name, fn) in enumerate(self.stages):
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            threads.append(threading.Thread(target=self._run_stage, args=(name, fn, queues[i], outbox),
+                                            name=f"pipeline-{name}", daemon=True))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+
+        elapsed = time.perf_counter() - started
+        for timing in self.timings.values():
+            timing["fps"] = round(timing["frames"] / timing["seconds"], 1) if timing["seconds"] else None
+            timing["seconds"] = round(timing["seconds"], 3)
+        self.timings["total"] = {"seconds": round(elapsed, 3)}
+        return self.timings
+
+    def bottleneck(self):
+        """Name of the stage that spent the most time busy"""
+        stages = {k: v for k, v in self.timings.items() if k != "total"}
+        return max(stages, key=lambda name: stages[name]["seconds"])
@@ -4,7 +4,11 @@ import os
 import time
 import threading
 from datetime import datetime, timedelta
-from config import OUTPUT_DIR, CLEANUP_INTERVAL_MINUTES, FILE_LIFETIME_MINUTES
+from config import OUTPUT_DIR, CLEANUP_INTERVAL_MINUTES, FILE_LIFETIME_MINUTES, TASK_LIFETIME_MINUTES
+from services.task_store import tasks
+from services import result_cache, media_index, preset_tuner, background_cache, video_preview
+from services.metadata_cache import metadata_cache
+from services.upload_service import purge_stale_uploads
 
 def cleanup_processed_folder():
     """Periodically clean up old files in processed folder"""
@@ -20,6 +24,38 @@ def cleanup_processed_folder():
                         print(f"Deleted old processed file: {filename}")
                 except Exception as e:
                     print(f"Error deleting {filename}: {e}")
+
+        # Garbage-collect expired task records
+        try:
+            purged = tasks.purge_expired(TASK_LIFETIME_MINUTES * 60)
+            if purged:
+                print(f"Purged {purged} expired task(s)")
+        except Exception as e:
+            print(f"Error purging tasks: {e}")
+
+        # Keep the result cache, media index, background rings, preview masks and
+        # persisted metadata within budget (LRU)
+        try:
+            evicted = (result_cache.evict() + media_index.evict() + background_cache.evict()
+                       + video_preview.evict() + metadata_cache.evict())
+            if evicted:
+                print(f"Evicted {evicted} cached file(s)")
+        except Exception as e:
+            print(f"Error evicting cached files: {e}")
+
+        # Drop resumable uploads that were never finalized
+        try:
+            purged = purge_stale_uploads()
+            if purged:
+                print(f"Purged {purged} abandoned upload(s)")
+        except Exception as e:
+            print(f"Error purging uploads: {e}")
+
+        # Pick up preset changes made by other worker processes
+        try:
+            preset_tuner.refresh()
+        except Exception as e:
+            print(f"Error refreshing presets: {e}")
         time.sleep(CLEANUP_INTERVAL_MINUTES * 30)
 
 def start_cleanup_worker():
@@ -0,0 +1,128 @@
+# workers/job_scheduler.py
+
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from config import JOB_WORKERS, JOB_QUEUE_SIZE, PREVIEW_WORKERS, PREVIEW_QUEUE_SIZE
+from services.task_store import tasks
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+
+class JobScheduler:
+    """Bounded FIFO job queue drained by a fixed pool of worker threads"""
+
+    def __init__(self, max_workers, max_queue, on_positions=None, name="job"):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.on_positions = on_positions  # called with [(task_id, position), ...]
+        self._pending = deque()  # (job_id, is_task, future, fn, args, kwargs)
+        self._cond = threading.Condition()
+        self._workers = []
+        self._running = 0
+
+    def _ensure_workers(self):
+        # Workers are started lazily so each gunicorn worker process gets its own pool
+        if self._workers:
+            return
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._work, name=f"{self.name}-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job_id, _, future, fn, args, kwargs = self._pending.popleft()
+                self._running += 1
+                # Only jobs backed by a task record have a position to publish
+                positions = [(p[0], idx) for idx, p in enumerate(self._pending, start=1) if p[1]]
+            self._notify_positions(positions)
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    print(f"Job {job_id} failed: {e}")
+                    traceback.print_exc()
+                    future.set_exception(e)
+
+            with self._cond:
+                self._running -= 1
+
+    def _enqueue(self, job_id, is_task, fn, args, kwargs):
+        future = Future()
+        with self._cond:
+            if len(self._pending) >= self.max_queue:
+                raise QueueFullError("Server is busy, please try again shortly")
+            self._ensure_workers()
+            self._pending.append((job_id, is_task, future, fn, args, kwargs))
+            position = len(self._pending)
+            self._cond.notify()
+        if is_task:
+            self._notify_positions([(job_id, position)])
+        return future
+
+    def submit(self, task_id, fn, *args, **kwargs):
+        """Queue a job for task_id (its queue position is published to the
+        task record), raising QueueFullError when the queue is at capacity"""
+        return self._enqueue(task_id, True, fn, args, kwargs)
+
+    def _notify_positions(self, positions):
+        if not self.on_positions or not positions:
+            return
+        try:
+            self.on_positions(positions)
+        except Exception as e:
+            print(f"Error publishing queue positions: {e}")
+
+    def run(self, job_id, fn, *args, **kwargs):
+        """Queue a job and block until it finishes, returning its result.
+
+        job_id only labels the job (it need not be a task id).
+        """
+        return self._enqueue(job_id, False, fn, args, kwargs).result()
+
+    def position(self, job_id):
+        """1-based position of a queued job, or None if it is not waiting"""
+        with self._cond:
+            for idx, pending in enumerate(self._pending, start=1):
+                if pending[0] == job_id:
+                    return idx
+        return None
+
+    def idle_workers(self):
+        """Workers that would start a newly submitted job immediately"""
+        with self._cond:
+            return max(0, self.max_workers - self._running - len(self._pending))
+
+    def active_jobs(self):
+        """Jobs running or about to start (at most max_workers), at least 1"""
+        with self._cond:
+            return max(1, min(self.max_workers, self._running + len(self._pending)))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "workers": self.max_workers,
+                "running": self._running,
+                "queued": len(self._pending),
+                "queue_size": self.max_queue,
+            }
+
+
+def publish_queue_positions(positions):
+    """Mirror queue positions into the shared task store for other workers"""
+    tasks.update_many({task_id: {"queue_position": position} for task_id, position in positions})
+
+
+scheduler = JobScheduler(JOB_WORKERS, JOB_QUEUE_SIZE, on_positions=publish_queue_positions)
+# Short interactive jobs (previews) run here instead of queueing behind encodes
+preview_scheduler = JobScheduler(PREVIEW_WORKERS, PREVIEW_QUEUE_SIZE, name="preview")
+